@@ -1,44 +1,95 @@
-from crewai import Agent
 import os
 from config.config import Config
-from typing import Dict, List
+from typing import Dict, List, Optional
+from utils.tracing import span
+from agents.vision_findings import VisionFindings
+
+# Report severity each vision SEVERITY ASSESSMENT raises the level to (at least)
+VISION_SEVERITY_LEVELS = {"minor": "minor", "moderate": "moderate", "severe": "serious"}
+SEVERITY_ORDER = ["minor", "moderate", "serious"]
 
 class CommunicationAgentHandler:
     def __init__(self):
         os.makedirs(Config.AUDIO_DIR, exist_ok=True)
 
-    def generate_patient_report(self, diagnosis_data: Dict) -> Dict:
+    def generate_patient_report(self, diagnosis_data: Dict, request_id: Optional[str] = None) -> Dict:
         """
         Generate tiered patient-friendly report
+        `request_id` keeps audio filenames unique across concurrent requests
+        """
+        report = self._build_report(diagnosis_data)
+
+        # Generate audio
+        report["audio_path"] = self.synthesize_audio(report, request_id)
+
+        return report
+
+    async def generate_patient_report_async(self, diagnosis_data: Dict, request_id: Optional[str] = None) -> Dict:
+        """Async variant of generate_patient_report"""
+        report = self._build_report(diagnosis_data)
+        report["audio_path"] = await self.synthesize_audio_async(report, request_id)
+
+        return report
+
+    def _build_report(self, diagnosis_data: Dict) -> Dict:
+        """Render the text sections of the report (no audio)"""
+        return {**self.build_summary(diagnosis_data), **self.build_details(diagnosis_data)}
+
+    def build_summary(self, diagnosis_data: Dict, findings: Optional[VisionFindings] = None) -> Dict:
+        """
+        Severity and plain-language summary (all the audio needs)
+        `findings` lets the vision model's severity assessment raise the level
+        (only with REPORT_SEVERITY_FROM_VISION)
         """
-        differential = diagnosis_data.get("differential_diagnosis", [])
         primary = diagnosis_data.get("primary_diagnosis", {})
         confidence = diagnosis_data.get("confidence", 0)
 
-        # Determine severity for emotional tone
-        severity = self._determine_severity(confidence, primary)
-
-        # Generate tiered text
-        summary = self._generate_summary(primary, confidence, severity)
-        detailed = self._generate_detailed(differential, confidence)
-        medical = self._generate_medical_details(diagnosis_data)
+        with span("report.render", section="summary"):
+            # Determine severity for emotional tone
+            severity = self._determine_severity(confidence, primary, findings)
+            summary = self._generate_summary(primary, confidence, severity)
 
-        report = {
+        return {
             "summary": summary,
-            "detailed": detailed,
-            "medical_details": medical,
             "severity": severity,
             "confidence": confidence,
             "requires_professional_review": confidence < Config.CONFIDENCE_THRESHOLD
         }
 
-        # Generate audio
-        audio_path = self._generate_audio(summary, severity)
-        report["audio_path"] = audio_path
+    def build_details(self, diagnosis_data: Dict) -> Dict:
+        """Detailed and medical-grade sections (independent of the audio)"""
+        differential = diagnosis_data.get("differential_diagnosis", [])
+        confidence = diagnosis_data.get("confidence", 0)
 
-        return report
+        with span("report.render", section="details"):
+            detailed = self._generate_detailed(differential, confidence)
+            medical = self._generate_medical_details(diagnosis_data)
+
+        return {
+            "detailed": detailed,
+            "medical_details": medical
+        }
+
+    def synthesize_audio(self, summary: Dict, request_id: Optional[str] = None, fast: bool = False) -> str:
+        """Speak a summary built by build_summary (`fast` skips the premium voice)"""
+        with span("tts.synthesize", severity=summary["severity"], fast=fast):
+            return self._generate_audio(summary["summary"], summary["severity"], request_id, fast)
 
-    def _determine_severity(self, confidence: float, primary_diagnosis: Dict) -> str:
+    async def synthesize_audio_async(self, summary: Dict, request_id: Optional[str] = None,
+                                     fast: bool = False) -> str:
+        """Async variant of synthesize_audio"""
+        from utils.tts_handler import TTSHandler
+
+        with span("tts.synthesize", severity=summary["severity"], fast=fast):
+            return await TTSHandler.generate_with_emotion_async(
+                summary["summary"],
+                summary["severity"],
+                request_id=request_id,
+                fast=fast
+            )
+
+    def _determine_severity(self, confidence: float, primary_diagnosis: Dict,
+                            findings: Optional[VisionFindings] = None) -> str:
         """Determine severity level"""
         if confidence < 50:
             return "uncertain"
@@ -46,14 +97,20 @@ class CommunicationAgentHandler:
         condition = primary_diagnosis.get("condition", "").lower() if primary_diagnosis else ""
 
         serious_conditions = ["fracture", "deep laceration", "severe burn"]
+        moderate_conditions = ["laceration", "hematoma", "sprain"]
         if any(s in condition for s in serious_conditions):
-            return "serious"
+            severity = "serious"
+        elif any(m in condition for m in moderate_conditions):
+            severity = "moderate"
+        else:
+            severity = "minor"
 
-        moderate_conditions = ["laceration", "hematoma", "sprain"]
-        if any(m in condition for m in moderate_conditions):
-            return "moderate"
+        use_vision = findings is not None and Config.REPORT_SEVERITY_FROM_VISION
+        vision_severity = VISION_SEVERITY_LEVELS.get(findings.severity) if use_vision else None
+        if vision_severity and SEVERITY_ORDER.index(vision_severity) > SEVERITY_ORDER.index(severity):
+            severity = vision_severity
 
-        return "minor"
+        return severity
 
     def _generate_summary(self, primary: Dict, confidence: float, severity: str) -> str:
         """Generate patient-friendly summary"""
@@ -109,20 +166,18 @@ class CommunicationAgentHandler:
 
         return text
 
-    def _generate_audio(self, text: str, severity: str) -> str:
+    def _generate_audio(self, text: str, severity: str, request_id: Optional[str] = None,
+                        fast: bool = False) -> str:
         """Generate TTS audio with emotional tone using ElevenLabs (with gTTS fallback)"""
         from utils.tts_handler import TTSHandler
-        
+
         # Use TTSHandler which handles ElevenLabs with gTTS fallback
-        import time
-        timestamp = int(time.time())
-        audio_filename = f"diagnosis_{severity}_{timestamp}.mp3"
-        
-        return TTSHandler.generate_with_emotion(text, severity)
+        return TTSHandler.generate_with_emotion(text, severity, request_id=request_id, fast=fast)
 
 
 def create_communication_agent():
     """Create CrewAI Communication Agent"""
+    from crewai import Agent
     return Agent(
         role="Patient Communication Specialist",
         goal="Translate medical findings into clear, empathetic, accessible communication for patients",
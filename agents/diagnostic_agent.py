@@ -1,11 +1,25 @@
-from crewai import Agent, Task
-import requests
-from typing import List, Dict
+import asyncio
+import importlib.util
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Optional, Tuple, Union
+from agents.vision_findings import VisionFindings
 from config.config import Config
+from utils.cassette import get_cassette
+from utils.rate_limiter import get_rate_limiter
+from utils.tracing import span
+
+# Async HTTP client is optional - fall back to running requests in a thread
+# (checked without importing so module import stays cheap)
+AIOHTTP_AVAILABLE = importlib.util.find_spec("aiohttp") is not None
 
 class DiagnosticAgentHandler:
     def __init__(self):
-        self.pubmed_base_url = "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/"
+        self.pubmed_base_url = Config.PUBMED_BASE_URL
+
+        # Recent results per query, served when a request has no time left to search
+        self._literature_cache: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._literature_lock = threading.Lock()
 
     def search_pubmed(self, query: str, max_results: int = 10) -> List[Dict]:
         """
@@ -24,7 +38,7 @@ class DiagnosticAgentHandler:
         # Pass 2: Narrow to treatments (only if we have results)
         if broad_results:
             # Use the extracted keywords, not the full description
-            narrow_query = f"{broad_query} AND treatment[Title/Abstract]"
+            narrow_query = self.narrow_query(broad_query)
             narrow_results = self._execute_search(narrow_query, max_results=5)
             results.extend(narrow_results)
         else:
@@ -36,28 +50,103 @@ class DiagnosticAgentHandler:
 
         return results[:max_results]
 
-    def _create_broad_query(self, injury_description: str) -> str:
+    async def search_pubmed_async(self, query: str, max_results: int = 10) -> List[Dict]:
         """
-        Convert injury description to structured medical search terms
-        Extract only relevant medical keywords, ignore full sentences
-        Focus on external injuries and wound care
+        Async variant of search_pubmed
+        Both passes share one HTTP session so connections are reused
         """
-        keywords = []
-        description_lower = injury_description.lower()
-
-        # Expanded list of injury types - check for these terms
-        injury_types = [
-            "contusion", "laceration", "abrasion", "hematoma",
-            "bruise", "wound", "burn", "fracture", "cut",
-            "trauma", "injury", "sprain", "strain", "scrape"
-        ]
+        if not AIOHTTP_AVAILABLE:
+            return await asyncio.to_thread(self.search_pubmed, query, max_results)
+
+        import aiohttp
+
+        results = []
+        broad_query = self._create_broad_query(query)
+        print(f"PubMed query: {broad_query}")  # Debug output
+
+        async with aiohttp.ClientSession() as session:
+            # Pass 1: Broad search
+            broad_results = await self._execute_search_async(session, broad_query, max_results)
+
+            # Pass 2: Narrow to treatments (only if we have results)
+            if broad_results:
+                narrow_query = self.narrow_query(broad_query)
+                narrow_results = await self._execute_search_async(session, narrow_query, max_results=5)
+                results.extend(narrow_results)
+            else:
+                results = broad_results
+
+        results = self._prioritize_meta_analyses(results)
+
+        return results[:max_results]
+
+    # Single passes, used by the stage graph to run both PubMed passes concurrently
 
-        # Extract injury type keywords
-        for injury_type in injury_types:
-            if injury_type in description_lower:
-                # Avoid duplicates
-                if injury_type not in keywords:
-                    keywords.append(injury_type)
+    def build_query(self, findings: Union[VisionFindings, str]) -> str:
+        """Pass 1 query: medical keywords from the vision findings"""
+        return self._create_broad_query(findings)
+
+    def narrow_query(self, broad_query: str) -> str:
+        """Pass 2 query: the broad keywords narrowed to treatment literature"""
+        return f"{broad_query} AND treatment[Title/Abstract]"
+
+    def search_pass(self, query: str, max_results: int, timeout: Optional[float] = None) -> List[Dict]:
+        """
+        Run one esearch/esummary pass
+        `timeout` caps the total HTTP wait (seconds left in the request budget)
+        """
+        results = self._execute_search(query, max_results, timeout)
+        self._remember_literature(query, results)
+        return results
+
+    async def search_pass_async(self, query: str, max_results: int, timeout: Optional[float] = None) -> List[Dict]:
+        """Async variant of search_pass with its own HTTP session"""
+        if not AIOHTTP_AVAILABLE:
+            return await asyncio.to_thread(self.search_pass, query, max_results, timeout)
+
+        import aiohttp
+
+        async with aiohttp.ClientSession() as session:
+            results = await self._execute_search_async(session, query, max_results, timeout)
+        self._remember_literature(query, results)
+        return results
+
+    def cached_literature(self, query: str) -> Optional[List[Dict]]:
+        """Results of an earlier search for the same query, if any"""
+        with self._literature_lock:
+            results = self._literature_cache.get(query)
+            if results is not None:
+                self._literature_cache.move_to_end(query)
+        return list(results) if results is not None else None
+
+    def _remember_literature(self, query: str, results: List[Dict]):
+        if not results:
+            return
+        with self._literature_lock:
+            self._literature_cache[query] = list(results)
+            self._literature_cache.move_to_end(query)
+            while len(self._literature_cache) > Config.LITERATURE_CACHE_MAX_ENTRIES:
+                self._literature_cache.popitem(last=False)
+
+    def merge_passes(self, broad_results: List[Dict], narrow_results: Optional[List[Dict]],
+                     max_results: int = 10) -> List[Dict]:
+        """
+        Combine pass results the same way search_pubmed does
+        The narrow pass only counts when the broad pass found something;
+        if it was skipped (None) the broad results are used instead
+        """
+        if narrow_results is None:
+            results = broad_results
+        else:
+            results = narrow_results if broad_results else []
+        return self._prioritize_meta_analyses(list(results))[:max_results]
+
+    def _create_broad_query(self, findings: Union[VisionFindings, str]) -> str:
+        """
+        Convert the identified injury types to structured medical search terms
+        Focus on external injuries and wound care
+        """
+        keywords = list(_as_findings(findings).conditions)
 
         # If no specific terms found, use general terms
         if not keywords:
@@ -77,76 +166,164 @@ class DiagnosticAgentHandler:
         
         return query
 
-    def _execute_search(self, query: str, max_results: int) -> List[Dict]:
+    def _execute_search(self, query: str, max_results: int, timeout: Optional[float] = None) -> List[Dict]:
         """Execute PubMed E-utilities search"""
+        search_timeout, summary_timeout = self._http_timeouts(timeout)
         try:
             # Search for article IDs
-            search_url = f"{self.pubmed_base_url}esearch.fcgi"
-            search_params = {
-                "db": "pubmed",
-                "term": query,
-                "retmax": max_results,
-                "retmode": "json",
-                "sort": "relevance",
-                "usehistory": "y"
-            }
-
-            search_response = requests.get(search_url, params=search_params, timeout=15)
-            
-            # Check if request was successful
-            if search_response.status_code != 200:
-                print(f"PubMed API returned status {search_response.status_code}")
-                return []
-            
-            search_data = search_response.json()
-            
-            # Debug: print query and response
-            if not search_data.get("esearchresult"):
-                print(f"Unexpected PubMed response structure: {list(search_data.keys())}")
+            with span("pubmed.esearch", query=query):
+                search_data = self._get_json("esearch.fcgi", self._search_params(query, max_results), search_timeout)
+            if search_data is None:
                 return []
 
-            article_ids = search_data.get("esearchresult", {}).get("idlist", [])
-            
-            # Debug output
+            article_ids = self._parse_article_ids(search_data)
             if not article_ids:
-                error_info = search_data.get('esearchresult', {}).get('errorlist', {})
-                if error_info:
-                    print(f"PubMed error: {error_info}")
+                return []
+
+            # Fetch article summaries
+            with span("pubmed.esummary", ids=len(article_ids)):
+                summary_data = self._get_json("esummary.fcgi", self._summary_params(article_ids), summary_timeout)
+            if summary_data is None:
+                return []
+
+            return self._parse_summaries(article_ids, summary_data)
+
+        except Exception as e:
+            print(f"PubMed search error: {e}")
+            return []
+
+    async def _execute_search_async(self, session, query: str, max_results: int,
+                                    timeout: Optional[float] = None) -> List[Dict]:
+        """Execute PubMed E-utilities search over an aiohttp session"""
+        search_timeout, summary_timeout = self._http_timeouts(timeout)
+        try:
+            with span("pubmed.esearch", query=query):
+                search_data = await self._get_json_async(
+                    session, "esearch.fcgi", self._search_params(query, max_results), search_timeout
+                )
+            if search_data is None:
+                return []
 
+            article_ids = self._parse_article_ids(search_data)
             if not article_ids:
                 return []
 
-            # Fetch article summaries
-            summary_url = f"{self.pubmed_base_url}esummary.fcgi"
-            summary_params = {
-                "db": "pubmed",
-                "id": ",".join(article_ids),
-                "retmode": "json"
-            }
-
-            summary_response = requests.get(summary_url, params=summary_params, timeout=10)
-            summary_data = summary_response.json()
-
-            # Parse results
-            results = []
-            for article_id in article_ids:
-                article = summary_data.get("result", {}).get(article_id, {})
-                if article:
-                    results.append({
-                        "pmid": article_id,
-                        "title": article.get("title", ""),
-                        "authors": article.get("authors", []),
-                        "source": article.get("source", ""),
-                        "pubdate": article.get("pubdate", ""),
-                        "article_type": article.get("pubtype", [])
-                    })
-
-            return results
+            with span("pubmed.esummary", ids=len(article_ids)):
+                summary_data = await self._get_json_async(
+                    session, "esummary.fcgi", self._summary_params(article_ids), summary_timeout
+                )
+            if summary_data is None:
+                return []
+
+            return self._parse_summaries(article_ids, summary_data)
 
         except Exception as e:
             print(f"PubMed search error: {e}")
             return []
 
+    def _get_json(self, endpoint: str, params: Dict, timeout: float) -> Optional[Dict]:
+        """GET an E-utilities endpoint (rate limited, recorded/replayed by the cassette)"""
+        import requests
+
+        def fetch():
+            with get_rate_limiter("ncbi").acquire():
+                response = requests.get(f"{self.pubmed_base_url}{endpoint}", params=params, timeout=timeout)
+            # Check if request was successful
+            if response.status_code != 200:
+                print(f"PubMed API returned status {response.status_code}")
+                return None
+            return response.json()
+
+        return get_cassette().call("ncbi", lambda: self._fingerprint(endpoint, params), fetch)
+
+    async def _get_json_async(self, session, endpoint: str, params: Dict, timeout: float) -> Optional[Dict]:
+        """Async variant of _get_json over an aiohttp session"""
+        import aiohttp
+
+        async def fetch():
+            async with get_rate_limiter("ncbi").acquire_async():
+                async with session.get(
+                    f"{self.pubmed_base_url}{endpoint}",
+                    params=params,
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as response:
+                    if response.status != 200:
+                        print(f"PubMed API returned status {response.status}")
+                        return None
+                    return await response.json(content_type=None)
+
+        return await get_cassette().call_async("ncbi", lambda: self._fingerprint(endpoint, params), fetch)
+
+    def _fingerprint(self, endpoint: str, params: Dict) -> Dict:
+        """Cassette key for an E-utilities request (the API key is left out)"""
+        return {"endpoint": endpoint, "params": {k: v for k, v in params.items() if k != "api_key"}}
+
+    def _http_timeouts(self, budget: Optional[float]) -> Tuple[float, float]:
+        """esearch/esummary timeouts, shrunk to fit the remaining request budget"""
+        if budget is None:
+            return 15, 10
+        budget = max(budget, 1.0)
+        return min(15, budget * 0.6), min(10, budget * 0.4)
+
+    def _search_params(self, query: str, max_results: int) -> Dict:
+        """Build esearch query parameters"""
+        return self._with_api_key({
+            "db": "pubmed",
+            "term": query,
+            "retmax": str(max_results),
+            "retmode": "json",
+            "sort": "relevance",
+            "usehistory": "y"
+        })
+
+    def _summary_params(self, article_ids: List[str]) -> Dict:
+        """Build esummary query parameters"""
+        return self._with_api_key({
+            "db": "pubmed",
+            "id": ",".join(article_ids),
+            "retmode": "json"
+        })
+
+    def _with_api_key(self, params: Dict) -> Dict:
+        """Add the NCBI API key when configured (allows 10 instead of 3 req/s)"""
+        if Config.NCBI_API_KEY:
+            params["api_key"] = Config.NCBI_API_KEY
+        return params
+
+    def _parse_article_ids(self, search_data: Dict) -> List[str]:
+        """Extract article IDs from an esearch response"""
+        # Debug: print query and response
+        if not search_data.get("esearchresult"):
+            print(f"Unexpected PubMed response structure: {list(search_data.keys())}")
+            return []
+
+        article_ids = search_data.get("esearchresult", {}).get("idlist", [])
+
+        # Debug output
+        if not article_ids:
+            error_info = search_data.get('esearchresult', {}).get('errorlist', {})
+            if error_info:
+                print(f"PubMed error: {error_info}")
+
+        return article_ids
+
+    def _parse_summaries(self, article_ids: List[str], summary_data: Dict) -> List[Dict]:
+        """Parse esummary JSON into result records"""
+        results = []
+        for article_id in article_ids:
+            article = summary_data.get("result", {}).get(article_id, {})
+            if article:
+                results.append({
+                    "pmid": article_id,
+                    "title": article.get("title", ""),
+                    "authors": article.get("authors", []),
+                    "source": article.get("source", ""),
+                    "pubdate": article.get("pubdate", ""),
+                    "article_type": article.get("pubtype", [])
+                })
+
+        return results
+
     def _prioritize_meta_analyses(self, results: List[Dict]) -> List[Dict]:
         """Prioritize meta-analyses and systematic reviews, filter irrelevant results"""
         meta_analyses = []
@@ -191,12 +368,14 @@ class DiagnosticAgentHandler:
         # Irrelevant results are excluded
         return meta_analyses + relevant_other
 
-    def generate_differential_diagnosis(self, vision_analysis: str, pubmed_results: List[Dict]) -> Dict:
+    def generate_differential_diagnosis(self, findings: Union[VisionFindings, str], pubmed_results: List[Dict]) -> Dict:
         """
         Generate differential diagnosis with probabilities
         """
-        # Extract likely conditions from vision analysis
-        conditions = self._extract_conditions(vision_analysis)
+        findings = _as_findings(findings)
+
+        # Likely conditions from the vision findings
+        conditions = self._extract_conditions(findings)
 
         # Score based on literature support
         scored_conditions = []
@@ -209,10 +388,9 @@ class DiagnosticAgentHandler:
             if literature_support > 0:
                 base_probability = literature_support
             else:
-                # Give base probability based on condition match in vision analysis
-                # If condition appears in vision analysis, give it some weight
-                condition_lower = condition.lower()
-                if condition_lower in vision_analysis.lower():
+                # Give base probability based on the injury types the vision model named
+                # If the condition was named, give it some weight
+                if condition.lower() in findings.conditions:
                     base_probability = 40  # Base confidence from vision
                 else:
                     base_probability = 20  # Lower confidence if not explicitly mentioned
@@ -258,35 +436,22 @@ class DiagnosticAgentHandler:
             "confidence": confidence
         }
 
-    def _extract_conditions(self, text: str) -> List[str]:
-        """Extract potential medical conditions from text"""
-        # Expanded list of injury terms
-        common_conditions = [
-            "contusion", "hematoma", "laceration", "abrasion",
-            "bruise", "sprain", "strain", "fracture", "cut",
-            "wound", "trauma", "injury", "scrape", "scratch"
-        ]
-
-        found = []
-        text_lower = text.lower()
+    def _extract_conditions(self, findings: Union[VisionFindings, str]) -> List[str]:
+        """Potential medical conditions from the vision findings"""
+        findings = _as_findings(findings)
 
-        # First pass: direct matches
-        for condition in common_conditions:
-            if condition in text_lower:
-                # Avoid duplicates
-                condition_cap = condition.capitalize()
-                if condition_cap not in found:
-                    found.append(condition_cap)
+        # First pass: injury types named by the vision model
+        found = [condition.capitalize() for condition in findings.conditions]
 
-        # Second pass: fallback analysis using descriptive terms
+        # Second pass: fallback analysis using the visible features
         if not found:
-            if any(word in text_lower for word in ["bleeding", "blood", "open", "cut", "laceration"]):
+            if findings.feature_says_yes("bleeding") or findings.feature_says_yes("open wound"):
                 found.append("Laceration")
-            elif any(word in text_lower for word in ["bruise", "discoloration", "purple", "blue", "contusion"]):
+            elif findings.feature_mentions("color/discoloration", "bruise", "discoloration", "purple", "blue"):
                 found.append("Contusion")
-            elif any(word in text_lower for word in ["scrape", "surface", "abrade", "abrasion"]):
+            elif findings.feature_mentions("texture", "scrape", "surface", "abrade", "raw"):
                 found.append("Abrasion")
-            elif any(word in text_lower for word in ["swelling", "hematoma", "bruise"]):
+            elif findings.feature_says_yes("swelling present"):
                 found.append("Hematoma")
 
         return found if found else ["External injury"]
@@ -317,8 +482,16 @@ class DiagnosticAgentHandler:
         return min(count * 20, 100)  # Cap at 100
 
 
+def _as_findings(findings: Union[VisionFindings, str]) -> VisionFindings:
+    """Accept parsed findings or raw vision text (parsed here)"""
+    if isinstance(findings, VisionFindings):
+        return findings
+    return VisionFindings.parse(findings)
+
+
 def create_diagnostic_agent():
     """Create CrewAI Diagnostic Agent"""
+    from crewai import Agent
     return Agent(
         role="Medical Diagnostic Specialist",
         goal="Analyze injury descriptions and provide evidence-based diagnosis using current medical literature",
@@ -328,4 +501,3 @@ def create_diagnostic_agent():
         verbose=True,
         allow_delegation=False
     )
-
@@ -1,100 +1,613 @@
-import google.generativeai as genai
-from crewai import Agent, Task
+from agents.vision_findings import VisionFindings
 from config.config import Config
+from utils.cassette import get_cassette
+from utils.image_processor import ImageProcessor
+from utils.rate_limiter import get_rate_limiter
+from utils.tracing import span
+from utils.vision_index import dhash, get_vision_index
+import asyncio
+import hashlib
+import json
+import re
+import time
+from typing import Callable, Dict, List, Optional
 from PIL import Image
 
+# Structured answer format shared by the single and batched prompts
+ANALYSIS_FORMAT = """1. INJURY TYPE: [State the specific type of injury visible - laceration, abrasion, contusion, hematoma, bruise, scrape, etc.]
+
+2. VISIBLE FEATURES:
+   - Color/discoloration: [Describe the colors you see - red, purple, blue, yellow, etc.]
+   - Size/dimensions: [Estimate size in cm if possible, or relative size]
+   - Texture: [smooth, rough, raised, flat, etc.]
+   - Location on body: [if identifiable from the image - arm, leg, hand, etc.]
+   - Swelling present: [yes/no and severity if yes]
+   - Open wound: [yes/no - is the skin broken?]
+   - Bleeding: [yes/no - is there visible blood?]
+
+3. SEVERITY ASSESSMENT: [Minor, Moderate, or Severe] - [brief reasoning for your assessment]
+
+4. IMAGE QUALITY: [Rate 1-10] - [brief comment on clarity, lighting, angle, focus]
+
+5. CONFIDENCE: [Your confidence percentage]% - [brief explanation of how certain you are]"""
+
+# Detailed prompt for medical analysis
+VISION_PROMPT = f"""You are a medical image analysis assistant for an educational research tool. This is a proof-of-concept system for analyzing external injuries in photographs for educational and research purposes only.
+
+Please analyze the injury photograph provided with this message. Look at the image carefully and describe what you observe.
+
+Provide your analysis in this structured format:
+
+{ANALYSIS_FORMAT}
+
+IMPORTANT: Please analyze the image that is attached to this message. Describe the visible characteristics of the injury you observe in the photograph. This analysis is for educational purposes only."""
+
+# Several photos in one request; answered in numbered sections split by BATCH_SECTION_PATTERN
+VISION_BATCH_PROMPT = """You are a medical image analysis assistant for an educational research tool. This is a proof-of-concept system for analyzing external injuries in photographs for educational and research purposes only.
+
+{count} injury photographs are attached to this message, each preceded by its label (IMAGE 1 to IMAGE {count}). Analyze each photograph independently - do not compare them or carry observations from one to another.
+
+For every image, start a section with the header line "=== IMAGE n ===" (n is the image number), then give the analysis in this structured format:
+
+""" + ANALYSIS_FORMAT + """
+
+IMPORTANT: Write exactly {count} sections, in order. This analysis is for educational purposes only."""
+
+BATCH_SECTION_PATTERN = re.compile(r'^\W*IMAGE\s+(\d+)\W*$', re.IGNORECASE | re.MULTILINE)
+
+# JSON output mode: the same fields, schema-constrained and terse so far fewer tokens are generated
+VISION_JSON_PROMPT = """You are a medical image analysis assistant for an educational research tool. This is a proof-of-concept system for analyzing external injuries in photographs for educational and research purposes only.
+
+Analyze the injury photograph attached to this message and fill in every field of the response schema. Keep text fields to a short phrase (at most 12 words). image_quality is a 1-10 rating of clarity, lighting and focus; confidence is your confidence percentage. This analysis is for educational purposes only."""
+
+VISION_JSON_BATCH_PROMPT = """You are a medical image analysis assistant for an educational research tool. This is a proof-of-concept system for analyzing external injuries in photographs for educational and research purposes only.
+
+{count} injury photographs are attached to this message, each preceded by its label (IMAGE 1 to IMAGE {count}). Analyze each photograph independently and return exactly {count} objects, in image order, filling in every field of the response schema. Keep text fields to a short phrase (at most 12 words). image_quality is a 1-10 rating of clarity, lighting and focus; confidence is your confidence percentage. This analysis is for educational purposes only."""
+
+# Gemini structured-output schema for one image (read by VisionFindings.from_json)
+VISION_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "injury_type": {"type": "STRING", "description": "laceration, abrasion, contusion, hematoma, bruise, scrape, etc."},
+        "color": {"type": "STRING"},
+        "size": {"type": "STRING", "description": "Estimated size in cm, or relative size"},
+        "texture": {"type": "STRING"},
+        "location": {"type": "STRING", "description": "Body location, if identifiable"},
+        "swelling": {"type": "BOOLEAN"},
+        "open_wound": {"type": "BOOLEAN", "description": "Is the skin broken?"},
+        "bleeding": {"type": "BOOLEAN"},
+        "severity": {"type": "STRING", "enum": ["Minor", "Moderate", "Severe"]},
+        "severity_reason": {"type": "STRING"},
+        "image_quality": {"type": "INTEGER"},
+        "confidence": {"type": "INTEGER"}
+    },
+    "required": ["injury_type", "color", "size", "texture", "location", "swelling", "open_wound",
+                 "bleeding", "severity", "severity_reason", "image_quality", "confidence"]
+}
+
+OUTPUT_MODES = ("prose", "json")
+
 class VisionAgentHandler:
-    def __init__(self):
+    def __init__(self, output_mode: Optional[str] = None):
+        # Use model name without 'models/' prefix - the SDK handles it
+        self.model_name = Config.GEMINI_VISION_MODEL.replace('models/', '')
+        self.model = None
+        self.output_mode = (output_mode or Config.VISION_OUTPUT_MODE).lower()
+        if self.output_mode not in OUTPUT_MODES:
+            raise ValueError(f"Unknown vision output mode: {self.output_mode} (expected one of {OUTPUT_MODES})")
+        self.prompt = VISION_JSON_PROMPT if self.output_mode == "json" else VISION_PROMPT
+        # Models tried in order (one unless the cascade is on)
+        self.tiers = list(Config.VISION_CASCADE_MODELS) if Config.VISION_CASCADE else [self.model_name]
+        self.tier_models = {}
+        # Indexed analyses are only reused for the same models and prompt
+        self.analyzer_id = f"{'>'.join(self.tiers)}/{hashlib.sha256(self.prompt.encode()).hexdigest()[:12]}"
+
+        # Replayed runs never reach Gemini, so they need no key or SDK
+        if get_cassette().replaying:
+            return
+
         if not Config.GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY not found in environment variables or .env file")
-        genai.configure(api_key=Config.GEMINI_API_KEY)
-        # Use model name without 'models/' prefix - the SDK handles it
-        model_name = Config.GEMINI_VISION_MODEL.replace('models/', '')
-        self.model = genai.GenerativeModel(model_name)
+        # Imported here so importing this module stays cheap (fast start)
+        import google.generativeai as genai
+        genai.configure(
+            api_key=Config.GEMINI_API_KEY,
+            transport=Config.GEMINI_TRANSPORT,
+            client_options={"api_endpoint": Config.GEMINI_API_ENDPOINT} if Config.GEMINI_API_ENDPOINT else None
+        )
+        self.model = genai.GenerativeModel(self.model_name)
+        self.tier_models = {name: genai.GenerativeModel(name) for name in self.tiers if name != self.model_name}
 
-    def analyze_image(self, image_path):
+    def is_ready(self) -> bool:
+        """Whether the handler can serve requests (live model or cassette replay)"""
+        return self.model is not None or get_cassette().replaying
+
+    def analyze_image(self, image_path, on_injury_type: Optional[Callable[[VisionFindings], None]] = None):
         """
         Analyze injury image and return structured description using Gemini Pro
+        With `on_injury_type` the response is streamed and the callback gets the findings
+        as soon as the INJURY TYPE line arrives, while the rest is still generating
         """
-        # Verify image exists and can be opened
-        try:
-            img = Image.open(image_path)
-            # Convert to RGB if necessary (Gemini works best with RGB)
-            if img.mode != 'RGB':
-                img = img.convert('RGB')
-        except Exception as e:
-            raise ValueError(f"Invalid image file: {e}")
+        img = self._load_image(image_path)
+        phash, reused = self._find_near_duplicate(img)
+        if reused is not None:
+            return reused
+        payload = self._encode_upload(img)
 
-        # Resize image if too large (Gemini has size limits)
-        # Max dimension should be around 2048px for best results
-        max_dimension = 2048
-        if img.size[0] > max_dimension or img.size[1] > max_dimension:
-            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+        result = self._analyze_cascade(payload, on_injury_type)
+        self._index_analysis(phash, result)
+        return result
 
-        # Create detailed prompt for medical analysis
-        prompt = """You are a medical image analysis assistant for an educational research tool. This is a proof-of-concept system for analyzing external injuries in photographs for educational and research purposes only.
+    async def analyze_image_async(self, image_path,
+                                  on_injury_type: Optional[Callable[[VisionFindings], None]] = None):
+        """
+        Async variant of analyze_image using the async Gemini client
+        Image decoding and encoding run in worker threads so the event loop stays free;
+        `on_injury_type` is called on the event loop
+        """
+        img = await asyncio.to_thread(self._load_image, image_path)
+        phash, reused = await asyncio.to_thread(self._find_near_duplicate, img)
+        if reused is not None:
+            return reused
+        payload = await asyncio.to_thread(self._encode_upload, img)
 
-Please analyze the injury photograph provided with this message. Look at the image carefully and describe what you observe.
+        result = await self._analyze_cascade_async(payload, on_injury_type)
+        await asyncio.to_thread(self._index_analysis, phash, result)
+        return result
 
-Provide your analysis in this structured format:
+    def analyze_images(self, image_paths: List[str], batch_size: int = Config.VISION_BATCH_SIZE) -> List[Optional[Dict]]:
+        """
+        Analyze several images with one Gemini request per `batch_size` images
+        Images whose section is missing or unparseable fall back to a single-image call.
+        Returns results in input order, with None where an image could not be analyzed.
+        Callers screen image quality first and pass only usable photos.
+        """
+        results: List[Optional[Dict]] = [None] * len(image_paths)
+        pending = []  # (position, phash, payload) still needing Gemini
+        for position, image_path in enumerate(image_paths):
+            try:
+                img = self._load_image(image_path)
+            except Exception as e:
+                print(f"⚠️ Leaving {image_path} out of the vision batch: {e}")
+                continue
+            phash, reused = self._find_near_duplicate(img)
+            if reused is not None:
+                results[position] = reused
+            else:
+                pending.append((position, phash, self._encode_upload(img)))
 
-1. INJURY TYPE: [State the specific type of injury visible - laceration, abrasion, contusion, hematoma, bruise, scrape, etc.]
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            sections = self._analyze_batch([payload for _, _, payload in chunk]) if len(chunk) > 1 else {}
+            fallbacks = 0
+            for number, (position, phash, payload) in enumerate(chunk, 1):
+                response = sections.get(number)
+                if response is None:
+                    fallbacks += 1
+                try:
+                    first = self._build_result(response, self.tiers[0]) if response is not None else None
+                    results[position] = self._analyze_cascade(payload, first_result=first)
+                except Exception:
+                    continue  # The pipeline's vision stage retries this image on its own
+                self._index_analysis(phash, results[position])
+            if len(chunk) > 1:
+                print(f"🧩 Vision batch: {len(chunk)} images in one request, {fallbacks} analyzed separately")
 
-2. VISIBLE FEATURES:
-   - Color/discoloration: [Describe the colors you see - red, purple, blue, yellow, etc.]
-   - Size/dimensions: [Estimate size in cm if possible, or relative size]
-   - Texture: [smooth, rough, raised, flat, etc.]
-   - Location on body: [if identifiable from the image - arm, leg, hand, etc.]
-   - Swelling present: [yes/no and severity if yes]
-   - Open wound: [yes/no - is the skin broken?]
-   - Bleeding: [yes/no - is there visible blood?]
+        return results
 
-3. SEVERITY ASSESSMENT: [Minor, Moderate, or Severe] - [brief reasoning for your assessment]
+    def _analyze_cascade(self, payload, on_injury_type: Optional[Callable[[VisionFindings], None]] = None,
+                         first_result: Optional[Dict] = None) -> Dict:
+        """
+        Ask each model tier in turn until one answers confidently (see Config.VISION_CASCADE_*)
+        `first_result` is the first tier's answer when it came from a batched request.
+        A failed escalation keeps the previous tier's answer.
+        """
+        attempts = []
+        for index, model_name in enumerate(self.tiers):
+            if index == 0 and first_result is not None:
+                attempts.append(first_result)
+            else:
+                try:
+                    attempts.append(self._build_result(
+                        self._analyze_payload(payload, on_injury_type, model_name), model_name
+                    ))
+                except Exception as e:
+                    if not attempts:
+                        raise
+                    print(f"⚠️ Escalation to {model_name} failed, keeping the {self.tiers[index - 1]} answer: {e}")
+                    break
+            if not self._should_escalate(attempts[-1], index):
+                break
+        return self._cascade_result(attempts)
 
-4. IMAGE QUALITY: [Rate 1-10] - [brief comment on clarity, lighting, angle, focus]
+    async def _analyze_cascade_async(self, payload,
+                                     on_injury_type: Optional[Callable[[VisionFindings], None]] = None) -> Dict:
+        """Async variant of _analyze_cascade"""
+        attempts = []
+        for index, model_name in enumerate(self.tiers):
+            try:
+                attempts.append(self._build_result(
+                    await self._analyze_payload_async(payload, on_injury_type, model_name), model_name
+                ))
+            except Exception as e:
+                if not attempts:
+                    raise
+                print(f"⚠️ Escalation to {model_name} failed, keeping the {self.tiers[index - 1]} answer: {e}")
+                break
+            if not self._should_escalate(attempts[-1], index):
+                break
+        return self._cascade_result(attempts)
 
-5. CONFIDENCE: [Your confidence percentage]% - [brief explanation of how certain you are]
+    def _should_escalate(self, result: Dict, index: int) -> bool:
+        """Whether the answer from tier `index` is too unsure to keep (the last tier always answers)"""
+        if index >= len(self.tiers) - 1:
+            return False
+        if not result["findings"]["complete"]:
+            reason = "incomplete answer"
+        elif result["confidence"] < Config.VISION_CASCADE_MIN_CONFIDENCE:
+            reason = f"confidence {result['confidence']}%"
+        elif result["image_quality"] < Config.VISION_CASCADE_MIN_QUALITY:
+            reason = f"image quality {result['image_quality']}/10"
+        else:
+            return False
+        print(f"⤴️ Escalating vision from {self.tiers[index]} to {self.tiers[index + 1]} ({reason})")
+        return True
 
-IMPORTANT: Please analyze the image that is attached to this message. Describe the visible characteristics of the injury you observe in the photograph. This analysis is for educational purposes only."""
+    def _cascade_result(self, attempts: List[Dict]) -> Dict:
+        """The last tier's result, with which tier answered and the latency and cost of each tier tried"""
+        result = attempts[-1]
+        tiers = [{
+            "model": attempt["generation"]["model"],
+            "latency_ms": attempt["generation"]["latency_ms"],
+            "cost_usd": attempt["generation"]["cost_usd"],
+            "confidence": attempt["confidence"],
+            "image_quality": attempt["image_quality"]
+        } for attempt in attempts]
+        costs = [tier["cost_usd"] for tier in tiers if tier["cost_usd"] is not None]
+        latencies = [tier["latency_ms"] for tier in tiers if tier["latency_ms"] is not None]
+        result["generation"].update({
+            "tier": len(attempts) - 1,
+            "escalated": len(attempts) > 1,
+            "tiers": tiers,
+            "total_cost_usd": round(sum(costs), 6) if costs else None,
+            "total_latency_ms": round(sum(latencies), 1) if latencies else None
+        })
+        return result
+
+    def _model(self, model_name: str):
+        return self.model if model_name == self.model_name else self.tier_models[model_name]
+
+    def _analyze_payload(self, payload, on_injury_type: Optional[Callable[[VisionFindings], None]] = None,
+                         model_name: Optional[str] = None) -> Dict:
+        """
+        One Gemini request for one encoded image; returns the response record (see _response_record)
+        The response is streamed when `on_injury_type` is given
+        """
+        model_name = model_name or self.tiers[0]
+
+        def generate():
+            model = self._model(model_name)
+            with get_rate_limiter("gemini").acquire():
+                start = time.perf_counter()
+                if on_injury_type is None:
+                    response = model.generate_content([self.prompt, payload], **self._generation_kwargs())
+                    return self._response_record(response, start)
+
+                response = model.generate_content([self.prompt, payload], stream=True, **self._generation_kwargs())
+                watcher = _StreamWatcher(self.output_mode == "json", on_injury_type, start)
+                for chunk in response:
+                    watcher.feed(chunk)
+                return self._response_record(response, start, watcher.text, watcher.injury_type_ms)
 
         # Generate analysis using Gemini Vision API
         try:
-            response = self.model.generate_content([prompt, img])
-            response_text = response.text
-            
-            # Debug: Check if we got a valid response
-            if not response_text or len(response_text) < 50:
-                print(f"⚠️ Warning: Short response from vision model: {response_text[:100]}")
-            
+            with span("vision.gemini", model=model_name, mode=self.output_mode) as attributes:
+                response = _as_record(get_cassette().call(
+                    "gemini", lambda: self._fingerprint(payload, model_name), generate
+                ))
+                attributes.update(prompt_tokens=response["prompt_tokens"], output_tokens=response["output_tokens"])
+            return response
         except Exception as e:
             print(f"❌ Error calling Gemini Vision API: {e}")
             raise
 
+    async def _analyze_payload_async(self, payload,
+                                     on_injury_type: Optional[Callable[[VisionFindings], None]] = None,
+                                     model_name: Optional[str] = None) -> Dict:
+        """Async variant of _analyze_payload using the async Gemini client"""
+        model_name = model_name or self.tiers[0]
+
+        async def generate():
+            model = self._model(model_name)
+            async with get_rate_limiter("gemini").acquire_async():
+                start = time.perf_counter()
+                if on_injury_type is None:
+                    response = await model.generate_content_async([self.prompt, payload], **self._generation_kwargs())
+                    return self._response_record(response, start)
+
+                response = await model.generate_content_async([self.prompt, payload], stream=True,
+                                                              **self._generation_kwargs())
+                watcher = _StreamWatcher(self.output_mode == "json", on_injury_type, start)
+                async for chunk in response:
+                    watcher.feed(chunk)
+                return self._response_record(response, start, watcher.text, watcher.injury_type_ms)
+
+        try:
+            with span("vision.gemini", model=model_name, mode=self.output_mode) as attributes:
+                response = _as_record(await get_cassette().call_async(
+                    "gemini", lambda: self._fingerprint(payload, model_name), generate
+                ))
+                attributes.update(prompt_tokens=response["prompt_tokens"], output_tokens=response["output_tokens"])
+            return response
+        except Exception as e:
+            print(f"❌ Error calling Gemini Vision API: {e}")
+            raise
+
+    def _analyze_batch(self, payloads: List[Dict]) -> Dict[int, Dict]:
+        """
+        One Gemini request for several images
+        Returns {image number: response record} for the sections that parsed; a failed call returns {}.
+        Each record carries the whole request's latency and token counts.
+        """
+        template = VISION_JSON_BATCH_PROMPT if self.output_mode == "json" else VISION_BATCH_PROMPT
+        prompt = template.format(count=len(payloads))
+        parts = [prompt]
+        for number, payload in enumerate(payloads, 1):
+            parts += [f"IMAGE {number}:", payload]
+
+        model_name = self.tiers[0]
+
+        def generate():
+            with get_rate_limiter("gemini").acquire():
+                start = time.perf_counter()
+                response = self._model(model_name).generate_content(parts, **self._generation_kwargs(len(payloads)))
+                return self._response_record(response, start)
+
+        def fingerprint():
+            return {
+                "model": model_name,
+                "prompt": hashlib.sha256(prompt.encode()).hexdigest(),
+                "images": [hashlib.sha256(payload["data"]).hexdigest() for payload in payloads],
+                **self._generation_kwargs(len(payloads))
+            }
+
+        try:
+            with span("vision.gemini_batch", model=model_name, images=len(payloads),
+                      mode=self.output_mode) as attributes:
+                response = _as_record(get_cassette().call("gemini", fingerprint, generate))
+                attributes.update(prompt_tokens=response["prompt_tokens"], output_tokens=response["output_tokens"])
+        except Exception as e:
+            print(f"⚠️ Batched vision request failed, analyzing images separately: {e}")
+            return {}
+
+        if self.output_mode == "json":
+            sections = self._split_json(response["text"], len(payloads))
+        else:
+            sections = self._split_sections(response["text"], len(payloads))
+        return {number: {**response, "text": text, "batch_size": len(payloads)} for number, text in sections.items()}
+
+    def _generation_kwargs(self, images: int = 1) -> Dict:
+        """
+        Structured-output settings for JSON mode: response schema and an output token cap
+        Prose mode passes none, keeping the model defaults
+        """
+        if self.output_mode != "json":
+            return {}
+        schema = VISION_RESPONSE_SCHEMA if images == 1 else {"type": "ARRAY", "items": VISION_RESPONSE_SCHEMA}
+        return {"generation_config": {
+            "response_mime_type": "application/json",
+            "response_schema": schema,
+            "max_output_tokens": Config.VISION_JSON_MAX_OUTPUT_TOKENS * images
+        }}
+
+    def _response_record(self, response, start: float, text: Optional[str] = None,
+                         injury_type_ms: Optional[float] = None) -> Dict:
+        """
+        Response text with generation latency and token counts (recorded as-is by cassettes)
+        Streamed responses pass their collected text and when the injury type arrived
+        """
+        usage = getattr(response, "usage_metadata", None)
+        return {
+            "text": response.text if text is None else text,
+            "latency_ms": round((time.perf_counter() - start) * 1000, 1),
+            "injury_type_ms": injury_type_ms,
+            "prompt_tokens": _token_count(usage, "prompt_token_count"),
+            "output_tokens": _token_count(usage, "candidates_token_count")
+        }
+
+    def _split_sections(self, text: str, count: int) -> Dict[int, str]:
+        """Split a batched response on its IMAGE n headers, keeping complete analyses only"""
+        headers = list(BATCH_SECTION_PATTERN.finditer(text or ""))
+        sections = {}
+        for i, header in enumerate(headers):
+            number = int(header.group(1))
+            end = headers[i + 1].start() if i + 1 < len(headers) else len(text)
+            section = text[header.end():end].strip()
+            if 1 <= number <= count and number not in sections and self._is_complete_analysis(section):
+                sections[number] = section
+        return sections
+
+    def _split_json(self, text: str, count: int) -> Dict[int, str]:
+        """Split a batched JSON array into per-image objects, keeping complete analyses only"""
+        try:
+            items = json.loads(text or "")
+        except ValueError:
+            return {}
+        if not isinstance(items, list):
+            return {}
         return {
-            "description": response_text,
-            "image_quality": self._extract_quality(response_text),
-            "confidence": self._extract_confidence(response_text)
+            number: json.dumps(item)
+            for number, item in enumerate(items[:count], 1)
+            if isinstance(item, dict) and VisionFindings.from_json_object(item).complete
         }
 
-    def _extract_confidence(self, text):
-        """Extract confidence percentage from response"""
-        import re
-        match = re.search(r'CONFIDENCE.*?(\d+)%', text, re.IGNORECASE)
-        if match:
-            return int(match.group(1))
-        return 70  # Default if not found
+    def _is_complete_analysis(self, text: str) -> bool:
+        """Whether a response carries the fields the parser reads (they fall back to defaults otherwise)"""
+        return VisionFindings.parse(text).complete
+
+    def _load_image(self, image_path):
+        """Open, convert and resize the image for the vision model"""
+        # Verify image exists and can be opened
+        with span("vision.decode"):
+            try:
+                img = Image.open(image_path)
+                # JPEGs decode at the smallest DCT scale still covering the upload size
+                img.draft('RGB', (Config.VISION_UPLOAD_MAX_DIMENSION, Config.VISION_UPLOAD_MAX_DIMENSION))
+                # Convert to RGB if necessary (Gemini works best with RGB)
+                if img.mode != 'RGB':
+                    img = img.convert('RGB')
+            except Exception as e:
+                raise ValueError(f"Invalid image file: {e}")
+
+        # Resize to the upload size up front so hashing and encoding work on the small image
+        max_dimension = Config.VISION_UPLOAD_MAX_DIMENSION
+        with span("vision.resize", original_size=list(img.size)):
+            if img.size[0] > max_dimension or img.size[1] > max_dimension:
+                img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+        return img
+
+    def _encode_upload(self, img):
+        """Encode the Gemini payload once (bytes, so the SDK doesn't re-encode per call)"""
+        with span("vision.encode", format=Config.VISION_UPLOAD_FORMAT) as attributes:
+            payload = ImageProcessor.encode_for_upload(img)
+            attributes["payload_bytes"] = len(payload["data"])
+        print(f"📦 Vision payload: {len(payload['data']) / 1024:.0f} KB ({payload['mime_type']})")
+        return payload
+
+    def _find_near_duplicate(self, img):
+        """
+        Perceptual hash of the resized image and the indexed analysis of a near-duplicate
+        Returns (phash, analysis); phash is None when the index is off
+        """
+        # Cassette runs must reach the recording, so they never use the index
+        if not Config.VISION_INDEX_ENABLED or get_cassette().enabled:
+            return None, None
+
+        with span("vision.phash") as attributes:
+            phash = dhash(img)
+            match = get_vision_index().lookup(phash, self.analyzer_id)
+            attributes["hit"] = match is not None
+        if match is None:
+            return phash, None
+
+        analysis, distance = match
+        print(f"♻️ Reusing vision analysis of a near-duplicate photo ({distance} bits apart)")
+        analysis["reused"] = f"reused analysis from near-duplicate (distance {distance})"
+        return phash, analysis
+
+    def _index_analysis(self, phash, result):
+        if phash is not None:
+            get_vision_index().add(phash, self.analyzer_id, result)
+
+    def _fingerprint(self, payload, model_name: Optional[str] = None) -> dict:
+        """Cassette key for a Gemini request: model, prompt and the exact upload bytes"""
+        return {
+            "model": model_name or self.model_name,
+            "prompt": hashlib.sha256(self.prompt.encode()).hexdigest(),
+            "mime_type": payload["mime_type"],
+            "image": hashlib.sha256(payload["data"]).hexdigest(),
+            **self._generation_kwargs()
+        }
+
+    def _build_result(self, response: Dict, model_name: Optional[str] = None) -> Dict:
+        """Turn a response record from `model_name` into the vision result dict"""
+        model_name = model_name or self.tiers[0]
+        response_text = response["text"] or ""
+        if self.output_mode == "json":
+            findings = VisionFindings.from_json(response_text)
+            description = findings.to_text()
+        else:
+            findings = VisionFindings.parse(response_text)
+            description = response_text
+
+        # Debug: Check if we got a valid response
+        if len(response_text) < 50 or not findings.complete:
+            print(f"⚠️ Warning: Short or incomplete response from vision model: {response_text[:100]}")
+
+        generation = {
+            "model": model_name,
+            "mode": self.output_mode,
+            "latency_ms": response["latency_ms"],
+            "injury_type_ms": response.get("injury_type_ms"),
+            "prompt_tokens": response["prompt_tokens"],
+            "output_tokens": response["output_tokens"],
+            "batch_size": response.get("batch_size", 1)
+        }
+        # A batched request's cost is shared by its images
+        cost = _estimate_cost(model_name, generation["prompt_tokens"], generation["output_tokens"])
+        generation["cost_usd"] = round(cost / generation["batch_size"], 6) if cost is not None else None
+        if generation["latency_ms"] is not None:
+            print(f"🧮 Vision generation ({model_name}, {self.output_mode}): {generation['latency_ms']:.0f} ms, "
+                  f"{generation['prompt_tokens']} prompt + {generation['output_tokens']} output tokens")
+
+        return {
+            "description": description,
+            "image_quality": findings.image_quality,
+            "confidence": findings.confidence,
+            "findings": findings.to_dict(),
+            "generation": generation
+        }
+
+
+class _StreamWatcher:
+    """Collects a streamed response and reports the injury type once its line is complete"""
+
+    def __init__(self, json_mode: bool, on_injury_type: Callable[[VisionFindings], None], start: float):
+        self.json_mode = json_mode
+        self.on_injury_type = on_injury_type
+        self.start = start
+        self.parts: List[str] = []
+        self.injury_type_ms: Optional[float] = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    def feed(self, chunk):
+        try:
+            self.parts.append(chunk.text)
+        except ValueError:
+            return  # Chunks without text (e.g. only usage metadata)
+        if self.injury_type_ms is not None:
+            return
+
+        findings = VisionFindings.from_partial(self.text, self.json_mode)
+        if findings is None:
+            return
+        self.injury_type_ms = round((time.perf_counter() - self.start) * 1000, 1)
+        print(f"⚡ Injury type streamed in after {self.injury_type_ms:.0f} ms: {findings.injury_type}")
+        try:
+            self.on_injury_type(findings)
+        except Exception as e:
+            # Early work is an optimization; the analysis itself carries on
+            print(f"⚠️ Early injury-type handler failed: {e}")
+
+
+def _as_record(response) -> Dict:
+    """Response record from a Gemini call; recordings made before records existed hold plain text"""
+    if isinstance(response, str):
+        return {"text": response, "latency_ms": None, "injury_type_ms": None, "prompt_tokens": None,
+                "output_tokens": None}
+    return response
+
+
+def _estimate_cost(model_name: str, prompt_tokens: Optional[int], output_tokens: Optional[int]) -> Optional[float]:
+    """USD for one call at Config.VISION_MODEL_PRICES (None when the price or usage is unknown)"""
+    prices = Config.VISION_MODEL_PRICES.get(model_name)
+    if prices is None or prompt_tokens is None or output_tokens is None:
+        return None
+    input_price, output_price = prices
+    return (prompt_tokens * input_price + output_tokens * output_price) / 1_000_000
 
-    def _extract_quality(self, text):
-        """Extract image quality score"""
-        import re
-        match = re.search(r'IMAGE QUALITY.*?(\d+)', text, re.IGNORECASE)
-        if match:
-            return int(match.group(1))
-        return 7  # Default
 
+def _token_count(usage, name: str) -> Optional[int]:
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) else None
 
 def create_vision_agent():
     """Create CrewAI Vision Agent"""
+    from crewai import Agent
     return Agent(
         role="Medical Vision Analyst",
         goal="Analyze injury photographs and provide detailed, structured descriptions of visible injuries",
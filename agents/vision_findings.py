@@ -0,0 +1,201 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# Injury terms recognised in the INJURY TYPE line (canonical lower-case spelling)
+INJURY_TERMS = (
+    "contusion", "hematoma", "laceration", "abrasion", "bruise", "burn",
+    "sprain", "strain", "fracture", "cut", "scrape", "scratch",
+    "wound", "trauma", "injury"
+)
+# Whole words only (plurals allowed): "cut" must not match "cutaneous", nor "burn" "burning"
+INJURY_TERM_PATTERN = re.compile(r'\b(' + "|".join(INJURY_TERMS) + r')(?:e?s)?\b', re.IGNORECASE)
+
+# Every "Label: value" line of the structured response, numbered, bulleted or bold
+FIELD_PATTERN = re.compile(
+    r'^[ \t>#*\-\d.)]*(?P<label>[A-Za-z][A-Za-z/ ]{0,40}?)[ \t*]*:[ \t*]*(?P<value>.*?)[ \t*]*$',
+    re.MULTILINE
+)
+NUMBER_PATTERN = re.compile(r'\d+')
+PERCENT_PATTERN = re.compile(r'(\d+)\s*%')
+SEVERITY_PATTERN = re.compile(r'\b(minor|moderate|severe)\b', re.IGNORECASE)
+# A finished injury_type string at the start of a streamed JSON response
+JSON_INJURY_TYPE_PATTERN = re.compile(r'"injury_type"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+# JSON output mode: schema fields and the VISIBLE FEATURES labels they fill
+JSON_FEATURES = {
+    "color": "color/discoloration",
+    "size": "size/dimensions",
+    "texture": "texture",
+    "location": "location on body",
+    "swelling": "swelling present",
+    "open_wound": "open wound",
+    "bleeding": "bleeding"
+}
+
+DEFAULT_IMAGE_QUALITY = 7
+DEFAULT_CONFIDENCE = 70
+
+
+@dataclass(slots=True)
+class VisionFindings:
+    """
+    Structured fields of a vision response, parsed once
+    Downstream stages read these instead of rescanning the free-text description
+    """
+    injury_type: str = ""
+    conditions: List[str] = field(default_factory=list)  # INJURY_TERMS found, in order
+    features: Dict[str, str] = field(default_factory=dict)  # VISIBLE FEATURES by lower-case label
+    severity: Optional[str] = None  # "minor", "moderate" or "severe"
+    severity_reason: str = ""
+    image_quality: int = DEFAULT_IMAGE_QUALITY
+    confidence: int = DEFAULT_CONFIDENCE
+    complete: bool = False  # Injury type, quality and confidence were all present
+
+    @classmethod
+    def parse(cls, text: str) -> "VisionFindings":
+        """Parse the structured response in a single pass over its lines"""
+        findings = cls()
+        found = set()
+        for match in FIELD_PATTERN.finditer(text or ""):
+            label = match.group('label').strip().lower()
+            value = match.group('value').strip('* ')
+
+            if label == "injury type":
+                findings.injury_type = value
+                found.add("injury_type")
+            elif label.startswith("severity"):
+                severity = SEVERITY_PATTERN.search(value)
+                findings.severity = severity.group(1).lower() if severity else None
+                findings.severity_reason = value.split("-", 1)[1].strip() if "-" in value else ""
+            elif label == "image quality":
+                number = NUMBER_PATTERN.search(value)
+                if number:
+                    findings.image_quality = int(number.group())
+                    found.add("image_quality")
+            elif label == "confidence":
+                percent = PERCENT_PATTERN.search(value)
+                if percent:
+                    findings.confidence = int(percent.group(1))
+                    found.add("confidence")
+            elif value and label not in findings.features:
+                findings.features[label] = value
+
+        # Unstructured answers fall back to the terms anywhere in the text
+        source = findings.injury_type if findings.injury_type else (text or "")
+        for term in INJURY_TERM_PATTERN.findall(source):
+            term = term.lower()
+            if term not in findings.conditions:
+                findings.conditions.append(term)
+
+        findings.complete = found == {"injury_type", "image_quality", "confidence"}
+        return findings
+
+    @classmethod
+    def from_partial(cls, text: str, json_mode: bool = False) -> Optional["VisionFindings"]:
+        """
+        Findings from the first part of a streamed response, once its injury type has fully arrived
+        Returns None until then; only injury_type and conditions are meaningful
+        """
+        if json_mode:
+            match = JSON_INJURY_TYPE_PATTERN.search(text)
+            return cls.from_json_object({"injury_type": json.loads(match.group(1))}) if match else None
+
+        # The last line may still be streaming in
+        findings = cls.parse(text[:text.rfind("\n") + 1])
+        return findings if findings.injury_type else None
+
+    @classmethod
+    def from_json(cls, text: str) -> "VisionFindings":
+        """
+        Findings from a schema-constrained JSON response (see VISION_RESPONSE_SCHEMA)
+        Truncated or malformed JSON gives incomplete findings with the defaults
+        """
+        try:
+            data = json.loads(text or "")
+        except ValueError:
+            return cls()
+        return cls.from_json_object(data) if isinstance(data, dict) else cls()
+
+    @classmethod
+    def from_json_object(cls, data: Dict) -> "VisionFindings":
+        findings = cls(injury_type=str(data.get("injury_type") or "").strip())
+        for key, label in JSON_FEATURES.items():
+            value = data.get(key)
+            if isinstance(value, bool):
+                value = "yes" if value else "no"
+            if value not in (None, ""):
+                findings.features[label] = str(value)
+
+        severity = SEVERITY_PATTERN.search(str(data.get("severity") or ""))
+        findings.severity = severity.group(1).lower() if severity else None
+        findings.severity_reason = str(data.get("severity_reason") or "")
+
+        found = {"injury_type"} if findings.injury_type else set()
+        for name in ("image_quality", "confidence"):
+            if isinstance(data.get(name), (int, float)) and not isinstance(data.get(name), bool):
+                setattr(findings, name, int(data[name]))
+                found.add(name)
+
+        for term in INJURY_TERM_PATTERN.findall(findings.injury_type):
+            if term.lower() not in findings.conditions:
+                findings.conditions.append(term.lower())
+        findings.complete = found == {"injury_type", "image_quality", "confidence"}
+        return findings
+
+    @classmethod
+    def from_result(cls, vision_result: Dict) -> "VisionFindings":
+        """Findings stored on a vision result, or parsed from its description (older results)"""
+        stored = vision_result.get("findings")
+        if stored is not None:
+            return cls.from_dict(stored)
+        return cls.parse(vision_result.get("description", ""))
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "VisionFindings":
+        return cls(
+            injury_type=data.get("injury_type", ""),
+            conditions=list(data.get("conditions", [])),
+            features=dict(data.get("features", {})),
+            severity=data.get("severity"),
+            severity_reason=data.get("severity_reason", ""),
+            image_quality=data.get("image_quality", DEFAULT_IMAGE_QUALITY),
+            confidence=data.get("confidence", DEFAULT_CONFIDENCE),
+            complete=data.get("complete", False)
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "injury_type": self.injury_type,
+            "conditions": list(self.conditions),
+            "features": dict(self.features),
+            "severity": self.severity,
+            "severity_reason": self.severity_reason,
+            "image_quality": self.image_quality,
+            "confidence": self.confidence,
+            "complete": self.complete
+        }
+
+    def to_text(self) -> str:
+        """Render in the structured prose format (descriptions shown to users and agents)"""
+        lines = [f"1. INJURY TYPE: {self.injury_type or 'Unknown'}", "", "2. VISIBLE FEATURES:"]
+        lines += [f"   - {label[0].upper()}{label[1:]}: {value}" for label, value in self.features.items()]
+        severity = (self.severity or "unknown").title()
+        lines += ["", f"3. SEVERITY ASSESSMENT: {severity}" + (f" - {self.severity_reason}" if self.severity_reason else ""),
+                  "", f"4. IMAGE QUALITY: {self.image_quality}",
+                  "", f"5. CONFIDENCE: {self.confidence}%"]
+        return "\n".join(lines)
+
+    def feature_says_yes(self, label: str) -> Optional[bool]:
+        """Yes/no VISIBLE FEATURES entries (e.g. "open wound") as a bool, None if absent"""
+        value = self.features.get(label, "").lower()
+        if value.startswith("yes"):
+            return True
+        if value.startswith("no"):
+            return False
+        return None
+
+    def feature_mentions(self, label: str, *words: str) -> bool:
+        value = self.features.get(label, "").lower()
+        return any(word in value for word in words)
@@ -1,8 +1,13 @@
 import streamlit as st
-from crew_orchestrator import run_medical_assessment
+from crew_orchestrator import run_medical_assessment, get_crew_pool
 from utils.image_processor import ImageProcessor
+from utils.result_cache import get_result_cache
+from utils.rate_limiter import get_rate_limit_metrics
+from utils.vision_index import get_vision_index
+from utils.job_queue import JobQueue
 from config.config import Config
 import os
+import time
 from datetime import datetime
 import json
 
@@ -62,6 +67,27 @@ if 'assessment_result' not in st.session_state:
     st.session_state.assessment_result = None
 if 'uploaded_image_path' not in st.session_state:
     st.session_state.uploaded_image_path = None
+if 'pending_job_id' not in st.session_state:
+    st.session_state.pending_job_id = None
+    st.session_state.pending_job_submitted_at = None
+
+
+@st.cache_resource
+def get_job_queue():
+    """Job queue shared across sessions (only used when USE_JOB_QUEUE is set)"""
+    return JobQueue()
+
+
+# Pick up a queued assessment that finished since the last rerun
+if st.session_state.pending_job_id:
+    job_status = get_job_queue().status(st.session_state.pending_job_id)
+    if job_status is None or job_status['status'] in ('done', 'failed'):
+        try:
+            st.session_state.assessment_result = get_job_queue().result(st.session_state.pending_job_id, timeout=0)
+        except (KeyError, RuntimeError) as e:
+            st.session_state.assessment_result = {"error": str(e)}
+        st.session_state.pending_job_id = None
+        st.toast("✅ Your queued assessment is ready. View results in the 'Results' tab.")
 
 # Header
 st.markdown('<div class="main-header">🏥 AI Medical Assessor</div>', unsafe_allow_html=True)
@@ -184,7 +210,24 @@ with tab1:
     st.divider()
 
     # Assessment button
-    if st.session_state.uploaded_image_path:
+    if st.session_state.uploaded_image_path and Config.USE_JOB_QUEUE:
+        # Enqueue and return at once; the pending job is picked up on a later rerun
+        if st.button("🔍 Analyze Injury", type="primary", use_container_width=True,
+                     disabled=st.session_state.pending_job_id is not None):
+            try:
+                job_id = get_job_queue().submit(os.path.abspath(st.session_state.uploaded_image_path))
+                st.session_state.pending_job_id = job_id
+                st.session_state.pending_job_submitted_at = time.time()
+            except Exception as e:
+                st.error(f"❌ Could not queue the assessment: {str(e)}")
+
+        if st.session_state.pending_job_id:
+            job_status = get_job_queue().status(st.session_state.pending_job_id) or {}
+            st.info(f"⏳ Your assessment is {job_status.get('status', 'queued')}. "
+                    "Results will appear in the 'Results' tab when a worker finishes it.")
+            st.button("🔄 Check status")
+
+    elif st.session_state.uploaded_image_path:
         if st.button("🔍 Analyze Injury", type="primary", use_container_width=True):
 
             with st.spinner(""):
@@ -196,7 +239,6 @@ with tab1:
                     progress_bar = st.progress(0)
 
                     try:
-                        # Run assessment
                         result = run_medical_assessment(st.session_state.uploaded_image_path)
 
                         progress_bar.progress(33)
@@ -214,6 +256,10 @@ with tab1:
                         st.success("✅ Analysis complete! View results in the 'Results' tab.")
                         st.balloons()
 
+                    except TimeoutError:
+                        # Every pooled crew stayed busy for CREW_POOL_CHECKOUT_TIMEOUT
+                        st.warning("⏳ The assessor is busy with other photos right now. Please try again in a moment.")
+
                     except Exception as e:
                         st.error(f"❌ Error during assessment: {str(e)}")
                         st.info("💡 Try uploading a different photo or check your internet connection")
@@ -262,6 +308,9 @@ with tab2:
                 image_quality = metadata.get('image_quality', 0)
                 st.metric("Image Quality", f"{image_quality}/10")
 
+            if metadata.get('vision_reuse'):
+                st.info(f"♻️ Image analysis {metadata['vision_reuse']}")
+
             st.divider()
 
             # Detailed report
@@ -342,11 +391,43 @@ with tab3:
         with st.expander("🔍 Full Raw Output (Debug)"):
             st.json(result)
 
-        with st.expander("🧠 Crew Memory (Shared Context)"):
-            metadata = result.get('metadata', {})
-            if 'crew_memory' in metadata:
+        metadata = result.get('metadata', {})
+        if 'crew_memory' in metadata:
+            # Only present when DEBUG_RESULTS is enabled
+            with st.expander("🧠 Crew Memory (Debug)"):
                 st.json(metadata['crew_memory'])
 
+        image_screen = metadata.get('image_screen') or result.get('image_screen')
+        if image_screen:
+            with st.expander("🔬 Image Pre-screen"):
+                st.json(image_screen)
+
+        vision_generation = metadata.get('vision_generation')
+        if vision_generation:
+            with st.expander("🧮 Vision Generation"):
+                st.json(vision_generation)
+
+        with st.expander("⏱️ Stage Timings"):
+            metadata = result.get('metadata', {})
+            critical_path = metadata.get('critical_path')
+            if critical_path:
+                st.write(f"**Critical path** ({critical_path['duration_ms']:.0f} ms): "
+                         + " → ".join(critical_path['stages']))
+            for span in metadata.get('spans', []):
+                st.write(f"`{span['name']}` - {span['duration_ms']:.0f} ms ({span['status']})")
+
+        with st.expander("🏊 Crew Pool Metrics"):
+            st.json(get_crew_pool().get_metrics())
+
+        with st.expander("♻️ Result Cache"):
+            st.json(get_result_cache().get_stats())
+
+        with st.expander("🔁 Near-duplicate Vision Index"):
+            st.json(get_vision_index().get_stats())
+
+        with st.expander("🚦 Provider Rate Limits"):
+            st.json(get_rate_limit_metrics())
+
     else:
         st.info("Technical details will appear here after assessment")
 
@@ -359,3 +440,9 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+
+# Poll a queued assessment by rerunning the script (for up to JOB_RESULT_TIMEOUT; "Check status" after that)
+if st.session_state.pending_job_id and \
+        time.time() - st.session_state.pending_job_submitted_at < Config.JOB_RESULT_TIMEOUT:
+    time.sleep(Config.JOB_POLL_INTERVAL)
+    st.rerun()
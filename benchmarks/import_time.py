@@ -0,0 +1,115 @@
+"""
+Cold-start benchmark: time to import the app and CLI entry points
+Each measurement runs in a fresh interpreter so nothing is cached in-process
+
+Usage:
+    python benchmarks/import_time.py --runs 5 --output data/outputs/import_time.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Module imported for each entry point
+TARGETS = {
+    "crew_orchestrator": "crew_orchestrator",
+    "cli": "quick_test",
+    "app": "app"
+}
+
+
+def time_import(module: str, fast_start: bool) -> float:
+    """Import `module` in a fresh interpreter and return wall time in seconds"""
+    env = dict(os.environ, FAST_START="true" if fast_start else "false")
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        env=env,
+        capture_output=True,
+        text=True
+    )
+    elapsed = time.perf_counter() - start
+
+    if proc.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{proc.stderr.strip()[-500:]}")
+    return elapsed
+
+
+def slowest_imports(module: str, top: int = 10) -> list:
+    """Return the modules with the largest cumulative import time (python -X importtime)"""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True
+    )
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3:
+            continue
+        rows.append({
+            "module": parts[2].strip(),
+            "cumulative_ms": round(int(parts[1]) / 1000, 2)
+        })
+
+    rows.sort(key=lambda r: r["cumulative_ms"], reverse=True)
+    return rows[:top]
+
+
+def run_benchmark(runs: int, targets: list, breakdown: bool) -> dict:
+    report = {"python": sys.version.split()[0], "runs": runs, "targets": {}}
+
+    for name in targets:
+        module = TARGETS[name]
+        entry = {"module": module}
+        for fast_start in (True, False):
+            mode = "fast_start" if fast_start else "eager"
+            try:
+                samples = [time_import(module, fast_start) for _ in range(runs)]
+            except RuntimeError as e:
+                entry[mode] = {"error": str(e)}
+                continue
+            entry[mode] = {
+                "median_s": round(statistics.median(samples), 4),
+                "min_s": round(min(samples), 4),
+                "max_s": round(max(samples), 4)
+            }
+        if breakdown:
+            entry["slowest_imports"] = slowest_imports(module)
+        report["targets"][name] = entry
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure cold-start import time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per measurement")
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument("--breakdown", action="store_true", help="Include slowest imports (-X importtime)")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.runs, args.targets, args.breakdown)
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+"""
+Load test: generate synthetic injury photos and drive the assessment entry points
+at a target request rate (open loop) or a fixed concurrency (closed loop)
+Writes a JSON report (latency percentiles, error rate, throughput) that can be
+compared between releases with --compare
+
+Usage:
+    python benchmarks/load_test.py --requests 100 --concurrency 8 --stub --output data/outputs/load.json
+    python benchmarks/load_test.py --requests 60 --rps 2 --compare data/outputs/load.json
+    python benchmarks/load_test.py --generate-only data/sample_images/synthetic --images 24
+"""
+
+import argparse
+import itertools
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.stub_servers import StubServers, StubSettings, parse_service_values
+from benchmarks.throughput import configure_for_stubs, summarize
+
+# Variation axes for the synthetic images
+RESOLUTIONS = [(320, 240), (800, 600), (1280, 960), (1920, 1080), (4032, 3024)]
+FORMATS = ["JPEG", "PNG", "WEBP"]
+QUALITIES = [40, 75, 95]  # JPEG/WebP only
+INJURY_KINDS = ["contusion", "laceration", "abrasion"]
+SKIN_TONES = [(241, 194, 167), (224, 172, 105), (198, 134, 66), (141, 85, 36), (92, 56, 32)]
+
+# Metrics compared by --compare (lower is better except throughput)
+COMPARED_METRICS = ("latency_ms.p50", "latency_ms.p95", "latency_ms.p99", "error_rate", "throughput_per_s")
+
+
+def make_injury_image(path: str, size, image_format: str, quality: int, kind: str, seed: int):
+    """Draw a skin-toned photo with a bruise, cut or scrape on it"""
+    from PIL import Image, ImageDraw, ImageFilter
+
+    rng = random.Random(seed)
+    width, height = size
+    img = Image.new("RGB", size, rng.choice(SKIN_TONES))
+    draw = ImageDraw.Draw(img)
+    cx, cy = width * rng.uniform(0.35, 0.65), height * rng.uniform(0.35, 0.65)
+    radius = min(width, height) * rng.uniform(0.08, 0.2)
+
+    if kind == "contusion":
+        for step in range(6, 0, -1):
+            r = radius * step / 6
+            shade = (110 + step * 10, 50 + step * 8, 120 + step * 6)
+            draw.ellipse([cx - r * 1.3, cy - r, cx + r * 1.3, cy + r], fill=shade)
+        img = img.filter(ImageFilter.GaussianBlur(radius / 4))
+    elif kind == "laceration":
+        end = (cx + radius * 2 * rng.uniform(0.7, 1.0), cy + radius * rng.uniform(-0.5, 0.5))
+        draw.line([(cx - radius, cy), end], fill=(120, 10, 20), width=max(int(radius / 8), 2))
+        img = img.filter(ImageFilter.GaussianBlur(1))
+    else:
+        for _ in range(int(radius * 3)):
+            x, y = cx + rng.gauss(0, radius / 2), cy + rng.gauss(0, radius / 3)
+            dot = rng.uniform(1, max(radius / 25, 1.5))
+            draw.ellipse([x - dot, y - dot, x + dot, y + dot], fill=(180, 40 + rng.randint(0, 40), 40))
+
+    # Skin texture at a fixed scale relative to the frame (so it survives the quality
+    # pre-screen's downscale), plus sensor noise so every image decodes to different pixels
+    texture = Image.effect_noise((256, 192), 40).resize(size, Image.Resampling.BILINEAR).convert("RGB")
+    noise = Image.effect_noise(size, 12).convert("RGB")
+    img = Image.blend(Image.blend(img, texture, 0.12), noise, 0.08)
+
+    options = {"quality": quality} if image_format in ("JPEG", "WEBP") else {"optimize": True}
+    img.save(path, image_format, **options)
+
+
+def generate_images(directory: str, count: int, seed: int = 0) -> List[Dict]:
+    """Write `count` images cycling through resolution, format, quality and injury kind"""
+    os.makedirs(directory, exist_ok=True)
+    combos = list(itertools.product(RESOLUTIONS, FORMATS, QUALITIES, INJURY_KINDS))
+    random.Random(seed).shuffle(combos)
+
+    images = []
+    for i in range(count):
+        size, image_format, quality, kind = combos[i % len(combos)]
+        extension = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}[image_format]
+        path = os.path.join(directory, f"synthetic_{i:04d}_{kind}.{extension}")
+        make_injury_image(path, size, image_format, quality, kind, seed + i)
+        images.append({
+            "path": path,
+            "kind": kind,
+            "format": image_format,
+            "resolution": f"{size[0]}x{size[1]}",
+            "quality": quality if image_format != "PNG" else None,
+            "bytes": os.path.getsize(path)
+        })
+    return images
+
+
+def _timed(assess: Callable[[str], Dict], image: Dict) -> Dict:
+    """Run one assessment and classify the outcome"""
+    start = time.perf_counter()
+    record = {"image": image, "status": "ok", "error_type": None}
+    try:
+        result = assess(image["path"])
+        if "error" in result:
+            # Low-quality photos are a valid answer, not a failure
+            record["status"] = "rejected"
+    except Exception as e:
+        record["status"] = "error"
+        record["error_type"] = type(e).__name__
+    record["latency_ms"] = (time.perf_counter() - start) * 1000
+    return record
+
+
+def run_closed_loop(images: List[Dict], total: int, concurrency: int, assess: Callable) -> List[Dict]:
+    """`concurrency` workers each start a new request as soon as their last one finishes"""
+    feed = itertools.islice(itertools.cycle(images), total)
+    feed_lock = threading.Lock()
+    records = []
+
+    def worker():
+        while True:
+            with feed_lock:
+                image = next(feed, None)
+            if image is None:
+                return
+            records.append(_timed(assess, image))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records
+
+
+def run_open_loop(images: List[Dict], total: int, rps: float, assess: Callable,
+                  max_workers: int) -> List[Dict]:
+    """Start requests on a fixed schedule regardless of how fast earlier ones finish"""
+    interval = 1.0 / rps
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="load") as executor:
+        futures = []
+        for i, image in enumerate(itertools.islice(itertools.cycle(images), total)):
+            delay = start + i * interval - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            futures.append(executor.submit(_timed, assess, image))
+        return [future.result() for future in futures]
+
+
+def build_report(records: List[Dict], wall_s: float, settings: Dict) -> Dict:
+    latencies = [r["latency_ms"] for r in records if r["status"] != "error"]
+    errors = defaultdict(int)
+    by_variant = defaultdict(list)
+    for record in records:
+        if record["error_type"]:
+            errors[record["error_type"]] += 1
+        image = record["image"]
+        if record["status"] != "error":
+            by_variant[f"{image['format']}/{image['resolution']}"].append(record["latency_ms"])
+
+    total = len(records)
+    completed = total - sum(errors.values())
+    return {
+        "git_commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "settings": settings,
+        "requests": total,
+        "completed": completed,
+        "rejected": sum(1 for r in records if r["status"] == "rejected"),
+        "errors": dict(errors),
+        "error_rate": round((total - completed) / total, 4) if total else 0.0,
+        "wall_s": round(wall_s, 3),
+        "throughput_per_s": round(completed / wall_s, 3) if wall_s else 0.0,
+        "latency_ms": summarize(latencies),
+        "latency_by_variant_ms": {name: summarize(samples) for name, samples in sorted(by_variant.items())}
+    }
+
+
+def compare_reports(previous: Dict, current: Dict) -> Dict:
+    """Relative change of the headline metrics against an earlier report"""
+    deltas = {}
+    for metric in COMPARED_METRICS:
+        before, after = _lookup(previous, metric), _lookup(current, metric)
+        if before is None or after is None:
+            continue
+        change = (after - before) / before if before else None
+        deltas[metric] = {"before": before, "after": after, "change": round(change, 4) if change is not None else None}
+    return deltas
+
+
+def _lookup(report: Dict, dotted: str) -> Optional[float]:
+    value = report
+    for key in dotted.split("."):
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return value
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        proc = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                              capture_output=True, text=True, timeout=5)
+        return proc.stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def _make_assess(use_batch: bool) -> Callable[[str], Dict]:
+    if use_batch:
+        from crew_orchestrator import assess_many
+
+        def assess(image_path):
+            # One-image batch goes through the batch code path (per-item error capture)
+            result = next(assess_many([image_path], max_concurrency=1))
+            if result.get("error_type"):
+                raise RuntimeError(f"{result['error_type']}: {result['error']}")
+            return result
+        return assess
+
+    from crew_orchestrator import run_medical_assessment
+    return run_medical_assessment
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the medical assessment pipeline")
+    parser.add_argument("--requests", type=int, default=50, help="Total assessments to run")
+    parser.add_argument("--images", type=int, default=30, help="Distinct synthetic images to generate")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=4, help="Closed loop: requests in flight")
+    load.add_argument("--rps", type=float, help="Open loop: requests started per second")
+    parser.add_argument("--max-workers", type=int, default=64, help="Thread cap for open-loop mode")
+    parser.add_argument("--batch", action="store_true", help="Use assess_many instead of run_medical_assessment")
+    parser.add_argument("--stub", action="store_true", help="Run against local stub servers (no network)")
+    parser.add_argument("--latency", nargs="*", default=[], help="Stub latency, service=seconds")
+    parser.add_argument("--error-rate", nargs="*", default=[], help="Stub error rate, service=fraction")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--generate-only", metavar="DIR", help="Only write the synthetic images to DIR")
+    parser.add_argument("--compare", help="Earlier JSON report to diff against")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    if args.generate_only:
+        images = generate_images(args.generate_only, args.images, args.seed)
+        print(f"🖼️ Wrote {len(images)} synthetic images to {args.generate_only}")
+        return
+
+    servers = None
+    if args.stub:
+        servers = StubServers(StubSettings(
+            latency=parse_service_values(args.latency),
+            error_rate=parse_service_values(args.error_rate),
+            seed=args.seed
+        )).start()
+        configure_for_stubs(servers)
+
+    try:
+        with tempfile.TemporaryDirectory() as image_dir:
+            images = generate_images(image_dir, args.images, args.seed)
+            assess = _make_assess(args.batch)
+
+            mode = f"{args.rps} rps" if args.rps else f"concurrency {args.concurrency}"
+            print(f"🚀 {args.requests} assessments over {len(images)} images ({mode})")
+            start = time.perf_counter()
+            if args.rps:
+                records = run_open_loop(images, args.requests, args.rps, assess, args.max_workers)
+            else:
+                records = run_closed_loop(images, args.requests, args.concurrency, assess)
+            wall_s = time.perf_counter() - start
+    finally:
+        if servers is not None:
+            servers.stop()
+
+    settings = {
+        "mode": "open" if args.rps else "closed",
+        "rps": args.rps,
+        "concurrency": None if args.rps else args.concurrency,
+        "entry_point": "assess_many" if args.batch else "run_medical_assessment",
+        "stub": args.stub,
+        "images": args.images,
+        "seed": args.seed
+    }
+    report = build_report(records, wall_s, settings)
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare_reports(json.load(f), report)
+
+    text = json.dumps(report, indent=2)
+    print(text)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            f.write(text)
+
+
+if __name__ == "__main__":
+    main()
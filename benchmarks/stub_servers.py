@@ -0,0 +1,362 @@
+"""
+Local stand-ins for PubMed E-utilities, Gemini generateContent and ElevenLabs TTS
+Used to measure the orchestrator's own overhead without network access
+
+    GET  /entrez/eutils/esearch.fcgi
+    GET  /entrez/eutils/esummary.fcgi
+    POST /v1beta/models/{model}:generateContent
+    POST /v1beta/models/{model}:streamGenerateContent
+    POST /v1/text-to-speech/{voice_id}
+
+Usage (standalone):
+    python benchmarks/stub_servers.py --port 8765 --latency gemini=1.5 ncbi=0.3 --error-rate ncbi=0.05
+    # then point the app at it, see StubServers.environment()
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+SERVICES = ("gemini", "ncbi", "tts")
+
+STREAM_CHUNK_CHARS = 80  # About 20 tokens per streamed chunk
+
+# Injury types the stub vision model rotates through
+INJURY_TYPES = ("contusion", "laceration", "abrasion", "hematoma", "burn")
+
+# Small ("lite") models are unsure about one image in this many, so cascades escalate
+LITE_UNSURE_EVERY = 4
+LITE_UNSURE_CONFIDENCE = 55
+
+STUB_TITLES = (
+    "Wound care in emergency medicine: a systematic review",
+    "First aid management of soft tissue trauma",
+    "Meta-analysis of topical treatments for wound healing",
+    "Trauma care for minor injuries in primary care",
+    "Evidence-based wound management after laceration repair"
+)
+
+
+def vision_text(injury_type: str, confidence: int = 85) -> str:
+    """Response in the structured format VISION_PROMPT asks for"""
+    return f"""1. INJURY TYPE: {injury_type.title()}
+
+2. VISIBLE FEATURES:
+   - Color/discoloration: red and purple
+   - Size/dimensions: approximately 3 cm
+   - Texture: flat
+   - Location on body: forearm
+   - Swelling present: yes, mild
+   - Open wound: no
+   - Bleeding: no
+
+3. SEVERITY ASSESSMENT: Minor - superficial {injury_type} without open wound
+
+4. IMAGE QUALITY: 8 - clear, well lit
+
+5. CONFIDENCE: {confidence}% - typical appearance of a {injury_type}"""
+
+
+def vision_json(injury_type: str, confidence: int = 85) -> Dict:
+    """The same answer as vision_text, in the JSON output mode's schema"""
+    return {
+        "injury_type": injury_type.title(),
+        "color": "red and purple",
+        "size": "approximately 3 cm",
+        "texture": "flat",
+        "location": "forearm",
+        "swelling": True,
+        "open_wound": False,
+        "bleeding": False,
+        "severity": "Minor",
+        "severity_reason": f"superficial {injury_type} without open wound",
+        "image_quality": 8,
+        "confidence": confidence
+    }
+
+
+class StubSettings:
+    """
+    Latency (seconds, plus uniform jitter) and error rate per service
+    `token_latency` adds seconds per generated Gemini token, so response length costs time
+    """
+
+    def __init__(self, latency: Optional[Dict[str, float]] = None, jitter: float = 0.0,
+                 error_rate: Optional[Dict[str, float]] = None, seed: Optional[int] = None,
+                 token_latency: float = 0.0):
+        self.latency = {service: 0.0 for service in SERVICES}
+        self.latency.update(latency or {})
+        self.error_rate = {service: 0.0 for service in SERVICES}
+        self.error_rate.update(error_rate or {})
+        self.jitter = jitter
+        self.token_latency = token_latency
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = {service: 0 for service in SERVICES}
+        self.errors = {service: 0 for service in SERVICES}
+
+    def admit(self, service: str) -> bool:
+        """Sleep for the service latency; return False if this call should fail"""
+        with self._lock:
+            self.requests[service] += 1
+            delay = self.latency[service] + self._random.uniform(0, self.jitter)
+            failed = self._random.random() < self.error_rate[service]
+            if failed:
+                self.errors[service] += 1
+        if delay > 0:
+            time.sleep(delay)
+        return not failed
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings: StubSettings = None
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+
+        if url.path.endswith("/esearch.fcgi"):
+            if not self.settings.admit("ncbi"):
+                return self._send_json(429, {"error": "API rate limit exceeded"})
+            count = min(int(params.get("retmax", 10)), len(STUB_TITLES))
+            ids = [str(30000000 + i) for i in range(count)]
+            return self._send_json(200, {"esearchresult": {"count": str(count), "idlist": ids}})
+
+        if url.path.endswith("/esummary.fcgi"):
+            if not self.settings.admit("ncbi"):
+                return self._send_json(429, {"error": "API rate limit exceeded"})
+            ids = [i for i in params.get("id", "").split(",") if i]
+            result = {"uids": ids}
+            for i, article_id in enumerate(ids):
+                result[article_id] = {
+                    "title": STUB_TITLES[i % len(STUB_TITLES)],
+                    "authors": [{"name": "Stub A"}],
+                    "source": "Stub J Med",
+                    "pubdate": "2023",
+                    "pubtype": ["Review"] if i % 2 == 0 else ["Journal Article"]
+                }
+            return self._send_json(200, {"result": result})
+
+        self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+        if url.path.endswith(":generateContent") or url.path.endswith(":streamGenerateContent"):
+            if not self.settings.admit("gemini"):
+                return self._send_json(503, {"error": {"code": 503, "message": "The model is overloaded"}})
+            text = _vision_answer(body, url.path.rsplit("/", 1)[-1].split(":")[0])
+            if url.path.endswith(":streamGenerateContent"):
+                return self._stream_answer(text, sse=parse_qs(url.query).get("alt") == ["sse"])
+
+            output_tokens = len(text) // 4
+            if self.settings.token_latency > 0:
+                time.sleep(output_tokens * self.settings.token_latency)
+            return self._send_json(200, _generate_response(text, output_tokens, final=True))
+
+        if "/text-to-speech/" in url.path:
+            if not self.settings.admit("tts"):
+                return self._send_json(500, {"detail": "TTS backend error"})
+            # Roughly 1 KB of "audio" per 10 characters of text
+            text = json.loads(body or b"{}").get("text", "")
+            audio = b"ID3" + bytes(max(len(text) * 100, 1024))
+            return self._send(200, audio, "audio/mpeg")
+
+        self._send_json(404, {"error": f"Unknown path {url.path}"})
+
+    def _stream_answer(self, text: str, sse: bool):
+        """
+        Send the answer in ~20-token chunks, each after its share of the token latency
+        As a JSON array (the SDK's REST stream) or server-sent events (alt=sse)
+        """
+        chunks = [text[i:i + STREAM_CHUNK_CHARS] for i in range(0, len(text), STREAM_CHUNK_CHARS)] or [""]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream" if sse else "application/json")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        output_tokens = 0
+        for i, chunk in enumerate(chunks):
+            output_tokens += len(chunk) // 4
+            if self.settings.token_latency > 0:
+                time.sleep(len(chunk) // 4 * self.settings.token_latency)
+            message = json.dumps(_generate_response(chunk, output_tokens, final=i == len(chunks) - 1))
+            if sse:
+                self.wfile.write(f"data: {message}\r\n\r\n".encode())
+            else:
+                self.wfile.write(("[" if i == 0 else ",").encode() + message.encode())
+            self.wfile.flush()
+        if not sse:
+            self.wfile.write(b"]")
+
+    def _send_json(self, status: int, payload: Dict):
+        self._send(status, json.dumps(payload).encode(), "application/json")
+
+    def _send(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _vision_answer(body: bytes, model: str = "") -> str:
+    """Stub model answer for a generateContent body, deterministic per image and model"""
+    images = _inline_images(body)
+
+    def answer(data: str, render):
+        injury_type = INJURY_TYPES[len(data) % len(INJURY_TYPES)]
+        unsure = "lite" in model and len(data) % LITE_UNSURE_EVERY == 0
+        return render(injury_type, LITE_UNSURE_CONFIDENCE if unsure else 85)
+
+    if _wants_json(body):
+        if len(images) > 1:
+            return json.dumps([answer(data, vision_json) for data in images])
+        return json.dumps(answer(images[0] if images else "", vision_json))
+    if len(images) > 1:
+        # Batched request: one numbered section per image
+        return "\n\n".join(
+            f"=== IMAGE {number} ===\n{answer(data, vision_text)}"
+            for number, data in enumerate(images, 1)
+        )
+    return answer(images[0] if images else "", vision_text)
+
+
+def _generate_response(text: str, output_tokens: int, final: bool) -> Dict:
+    """One generateContent response (or stream chunk); the last one carries the finish reason"""
+    candidate = {"content": {"role": "model", "parts": [{"text": text}]}, "index": 0}
+    if final:
+        candidate["finishReason"] = "STOP"
+    return {
+        "candidates": [candidate],
+        "usageMetadata": {
+            "promptTokenCount": 1290,
+            "candidatesTokenCount": output_tokens,
+            "totalTokenCount": 1290 + output_tokens
+        }
+    }
+
+
+def _inline_images(body: bytes) -> List[str]:
+    """Base64 image data of each inline image part in a generateContent body"""
+    try:
+        contents = json.loads(body or b"{}").get("contents", [])
+    except ValueError:
+        return []
+    images = []
+    for content in contents:
+        for part in content.get("parts", []):
+            inline = part.get("inline_data") or part.get("inlineData")
+            if inline:
+                images.append(inline.get("data", ""))
+    return images
+
+
+def _wants_json(body: bytes) -> bool:
+    """Whether a generateContent body asks for the JSON output mode"""
+    try:
+        request = json.loads(body or b"{}")
+    except ValueError:
+        return False
+    config = request.get("generationConfig") or request.get("generation_config") or {}
+    return (config.get("responseMimeType") or config.get("response_mime_type")) == "application/json"
+
+
+class StubServers:
+    """
+    One threaded HTTP server answering for all three providers
+    Use as a context manager; `environment()` gives the settings that point the app at it
+    """
+
+    def __init__(self, settings: Optional[StubSettings] = None, host: str = "127.0.0.1", port: int = 0):
+        self.settings = settings or StubSettings()
+        handler = type("StubHandler", (_StubHandler,), {"settings": self.settings})
+        self.server = ThreadingHTTPServer((host, port), handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def environment(self) -> Dict[str, str]:
+        """Config overrides (environment variables) that route every provider here"""
+        return {
+            "PUBMED_BASE_URL": f"{self.base_url}/entrez/eutils/",
+            "GEMINI_API_ENDPOINT": self.base_url,
+            "GEMINI_TRANSPORT": "rest",
+            "ELEVENLABS_BASE_URL": self.base_url,
+            "GEMINI_API_KEY": "stub-key",
+            "ELEVENLABS_API_KEY": "stub-key"
+        }
+
+    def start(self) -> "StubServers":
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-servers", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_service_values(pairs) -> Dict[str, float]:
+    """Parse ["gemini=1.5", "ncbi=0.3"] into {"gemini": 1.5, "ncbi": 0.3}"""
+    values = {}
+    for pair in pairs or []:
+        service, _, value = pair.partition("=")
+        if service not in SERVICES:
+            raise argparse.ArgumentTypeError(f"Unknown service '{service}' (expected one of {SERVICES})")
+        values[service] = float(value)
+    return values
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run local provider stand-ins")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", nargs="*", default=[], help="service=seconds, e.g. gemini=1.5")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random latency (seconds)")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Extra Gemini seconds per output token")
+    parser.add_argument("--error-rate", nargs="*", default=[], help="service=fraction, e.g. ncbi=0.05")
+    args = parser.parse_args()
+
+    settings = StubSettings(
+        latency=parse_service_values(args.latency),
+        jitter=args.jitter,
+        error_rate=parse_service_values(args.error_rate),
+        token_latency=args.token_latency
+    )
+    servers = StubServers(settings, args.host, args.port)
+    print(f"🧪 Stub servers listening on {servers.base_url}")
+    for name, value in servers.environment().items():
+        print(f"   export {name}={value}")
+
+    try:
+        servers.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servers.server.server_close()
+
+
+if __name__ == "__main__":
+    main()
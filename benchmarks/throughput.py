@@ -0,0 +1,168 @@
+"""
+Throughput benchmark: drive MedicalAssessmentCrew against the local stub servers
+Reports assessments per second and per-stage latency percentiles (from tracing spans)
+No network access or API keys are needed; the ElevenLabs SDK must be installed
+for TTS to reach the stub (otherwise gTTS is tried)
+
+Usage:
+    python benchmarks/throughput.py --images 40 --concurrency 1 4 16 \\
+        --latency gemini=1.0 ncbi=0.2 tts=0.5 --output data/outputs/throughput.json
+"""
+
+import argparse
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.stub_servers import StubServers, StubSettings, parse_service_values
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile (samples need not be sorted)"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(math.ceil(pct / 100 * len(ordered)), 1)
+    return ordered[rank - 1]
+
+
+def summarize(samples: List[float]) -> Dict:
+    return {
+        "count": len(samples),
+        "p50": round(percentile(samples, 50), 2),
+        "p95": round(percentile(samples, 95), 2),
+        "p99": round(percentile(samples, 99), 2),
+        "max": round(max(samples), 2) if samples else 0.0
+    }
+
+
+def configure_for_stubs(servers: StubServers, deadline: float = 0, rate_limits: bool = False):
+    """
+    Route every provider to the stub servers and turn off caching
+    Must run before the app modules are imported (Config reads the environment at import)
+    """
+    os.environ.update(servers.environment())
+    os.environ.update({
+        "FAST_START": "true",
+        "RESULT_CACHE_ENABLED": "false",
+        "VISION_INDEX_ENABLED": "false",
+        "CASSETTE_MODE": "off",
+        "ASSESSMENT_DEADLINE": str(deadline)
+    })
+    from config.config import Config
+    if not rate_limits:
+        # Measure the orchestrator, not the NCBI pacing
+        Config.PROVIDER_RATE_LIMITS = {}
+
+
+def make_images(directory: str, count: int, size: int = 512) -> List[str]:
+    """Write distinct synthetic photos so no two requests share a cache key"""
+    from PIL import Image
+
+    paths = []
+    for i in range(count):
+        base = Image.new("RGB", (size, size), (60 + (i * 37) % 160, 60 + (i * 91) % 160, 60 + (i * 53) % 160))
+        noise = Image.effect_noise((size, size), 20 + i % 40).convert("RGB")
+        path = os.path.join(directory, f"bench_{i:04d}.jpg")
+        # Light enough to pass the quality pre-screen's noise limit
+        Image.blend(base, noise, 0.15).save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def run_level(image_paths: List[str], concurrency: int) -> Dict:
+    """Assess every image with `concurrency` in flight and collect latency distributions"""
+    from crew_orchestrator import assess_many
+
+    stage_ms = defaultdict(list)
+    end_to_end_ms = []
+    errors = defaultdict(int)
+
+    start = time.perf_counter()
+    for result in assess_many(image_paths, max_concurrency=concurrency):
+        if "error" in result:
+            errors[result.get("error_type", "error")] += 1
+            continue
+        for span in result["metadata"].get("spans", []):
+            if span["name"] == "assessment":
+                end_to_end_ms.append(span["duration_ms"])
+            else:
+                stage_ms[span["name"]].append(span["duration_ms"])
+    wall = time.perf_counter() - start
+
+    completed = len(end_to_end_ms)
+    return {
+        "concurrency": concurrency,
+        "assessments": len(image_paths),
+        "completed": completed,
+        "errors": dict(errors),
+        "wall_s": round(wall, 3),
+        "throughput_per_s": round(completed / wall, 3) if wall else 0.0,
+        "latency_ms": summarize(end_to_end_ms),
+        "spans_ms": {name: summarize(samples) for name, samples in sorted(stage_ms.items())}
+    }
+
+
+def print_level(level: Dict):
+    print(f"\n⚡ concurrency={level['concurrency']}: {level['throughput_per_s']} assessments/s "
+          f"({level['completed']}/{level['assessments']} ok in {level['wall_s']}s)")
+    latency = level["latency_ms"]
+    print(f"   end-to-end p50={latency['p50']}ms p95={latency['p95']}ms p99={latency['p99']}ms")
+    for name, stats in level["spans_ms"].items():
+        print(f"   {name:<24} p50={stats['p50']:>9}ms p95={stats['p95']:>9}ms p99={stats['p99']:>9}ms")
+    if level["errors"]:
+        print(f"   errors: {level['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure assessment throughput against local stub servers")
+    parser.add_argument("--images", type=int, default=20, help="Assessments per concurrency level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--latency", nargs="*", default=[], help="service=seconds, e.g. gemini=1.0")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", nargs="*", default=[], help="service=fraction, e.g. ncbi=0.05")
+    parser.add_argument("--rate-limits", action="store_true", help="Keep the provider rate limits on")
+    parser.add_argument("--deadline", type=float, default=0, help="Per-request deadline (0 = none)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    settings = StubSettings(
+        latency=parse_service_values(args.latency),
+        jitter=args.jitter,
+        error_rate=parse_service_values(args.error_rate),
+        seed=args.seed
+    )
+
+    with StubServers(settings) as servers, tempfile.TemporaryDirectory() as image_dir:
+        configure_for_stubs(servers, args.deadline, args.rate_limits)
+
+        image_paths = make_images(image_dir, args.images)
+        report = {
+            "python": sys.version.split()[0],
+            "stub": {"latency": settings.latency, "jitter": settings.jitter, "error_rate": settings.error_rate},
+            "levels": []
+        }
+        for concurrency in args.concurrency:
+            level = run_level(image_paths, concurrency)
+            print_level(level)
+            report["levels"].append(level)
+        report["stub_requests"] = settings.requests
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📄 Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Vision output modes side by side: the prose report vs schema-constrained JSON
+Sends the same synthetic images through VisionAgentHandler in each mode and reports
+generation latency, prompt/output token counts, estimated cost and how often every field parsed
+With --cascade the models are tried fastest first (see Config.VISION_CASCADE) and the
+escalation rate is reported too
+
+Usage:
+    python benchmarks/vision_output.py --images 12 --stub --latency gemini=0.3 --token-latency 0.004
+    python benchmarks/vision_output.py --images 12 --stub --cascade gemini-2.5-flash-lite gemini-2.5-flash
+    python benchmarks/vision_output.py --images 12 --output data/outputs/vision_output.json  # live Gemini
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from typing import Dict, List
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, PROJECT_ROOT)
+
+from benchmarks.load_test import generate_images
+from benchmarks.stub_servers import StubServers, StubSettings, parse_service_values
+from benchmarks.throughput import configure_for_stubs, summarize
+
+
+def run_mode(mode: str, image_paths: List[str]) -> Dict:
+    """Analyze every image once in `mode` and summarize the generation records"""
+    from agents.vision_agent import VisionAgentHandler
+
+    handler = VisionAgentHandler(output_mode=mode)
+    latency_ms, prompt_tokens, output_tokens, cost_usd = [], [], [], []
+    complete = errors = escalated = 0
+    for path in image_paths:
+        try:
+            result = handler.analyze_image(path)
+        except Exception as e:
+            errors += 1
+            print(f"❌ {mode}: {os.path.basename(path)} failed: {e}")
+            continue
+        generation = result["generation"]
+        # Cascade totals cover every tier tried for the image
+        if generation["total_latency_ms"] is not None:
+            latency_ms.append(generation["total_latency_ms"])
+        if generation["total_cost_usd"] is not None:
+            cost_usd.append(generation["total_cost_usd"])
+        escalated += generation["escalated"]
+        if generation["prompt_tokens"] is not None:
+            prompt_tokens.append(generation["prompt_tokens"])
+        if generation["output_tokens"] is not None:
+            output_tokens.append(generation["output_tokens"])
+        complete += result["findings"]["complete"]
+
+    analyzed = len(image_paths) - errors
+    return {
+        "mode": mode,
+        "models": handler.tiers,
+        "images": len(image_paths),
+        "errors": errors,
+        "complete_rate": round(complete / analyzed, 3) if analyzed else 0.0,
+        "escalation_rate": round(escalated / analyzed, 3) if analyzed else 0.0,
+        "cost_usd": round(sum(cost_usd), 6),
+        "latency_ms": summarize(latency_ms),
+        "prompt_tokens": summarize(prompt_tokens),
+        "output_tokens": summarize(output_tokens)
+    }
+
+
+def print_mode(report: Dict):
+    latency, output = report["latency_ms"], report["output_tokens"]
+    print(f"\n🧮 {report['mode']} ({' > '.join(report['models'])}): "
+          f"generation p50={latency['p50']}ms p95={latency['p95']}ms, "
+          f"output tokens p50={output['p50']} max={output['max']}, "
+          f"prompt tokens p50={report['prompt_tokens']['p50']}, "
+          f"complete={report['complete_rate']:.0%} ({report['errors']} errors), "
+          f"escalated={report['escalation_rate']:.0%}, cost=${report['cost_usd']:.4f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the prose and JSON vision output modes")
+    parser.add_argument("--images", type=int, default=12, help="Synthetic images analyzed per mode")
+    parser.add_argument("--modes", nargs="+", default=["prose", "json"], choices=["prose", "json"])
+    parser.add_argument("--stub", action="store_true", help="Run against the local stub Gemini (no network)")
+    parser.add_argument("--latency", nargs="*", default=[], help="Stub latency, service=seconds")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Stub seconds per output token")
+    parser.add_argument("--cascade", nargs="+", metavar="MODEL",
+                        help="Try these models in order, escalating on low confidence (fastest first)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    # Every image must reach the model in every mode
+    os.environ["VISION_INDEX_ENABLED"] = "false"
+    if args.cascade:
+        from config.config import Config
+        Config.VISION_CASCADE = True
+        Config.VISION_CASCADE_MODELS = args.cascade
+    servers = None
+    if args.stub:
+        servers = StubServers(StubSettings(
+            latency=parse_service_values(args.latency),
+            token_latency=args.token_latency,
+            seed=args.seed
+        )).start()
+        configure_for_stubs(servers)
+
+    try:
+        with tempfile.TemporaryDirectory() as image_dir:
+            paths = [image["path"] for image in generate_images(image_dir, args.images, args.seed)]
+            reports = [run_mode(mode, paths) for mode in args.modes]
+    finally:
+        if servers is not None:
+            servers.stop()
+
+    for report in reports:
+        print_mode(report)
+
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w") as f:
+            json.dump({"stub": args.stub, "seed": args.seed, "cascade": args.cascade, "modes": reports}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
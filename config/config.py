@@ -8,12 +8,48 @@ class Config:
     GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
+    NCBI_API_KEY = os.getenv("NCBI_API_KEY")  # Optional - raises the PubMed limit to 10 req/s
 
     # Model Settings
     GEMINI_VISION_MODEL = "gemini-2.5-flash"  # For vision/image analysis (Stable Gemini 2.5 Flash - fast and supports vision)
     # Alternatives: "gemini-2.5-pro" (more capable, slower), "gemini-2.5-flash-image" (image-optimized)
     OPENAI_MODEL = "gpt-4"  # For CrewAI agents
 
+    # Vision model cascade: the first (fastest) model answers unless it is unsure, then the next one tries
+    # Off by default - only GEMINI_VISION_MODEL is used
+    VISION_CASCADE = os.getenv("VISION_CASCADE", "false").lower() == "true"
+    VISION_CASCADE_MODELS = [
+        model.strip() for model in os.getenv("VISION_CASCADE_MODELS", "gemini-2.5-flash-lite,gemini-2.5-flash").split(",")
+        if model.strip()
+    ]
+    VISION_CASCADE_MIN_CONFIDENCE = int(os.getenv("VISION_CASCADE_MIN_CONFIDENCE", "70"))  # Percentage
+    VISION_CASCADE_MIN_QUALITY = int(os.getenv("VISION_CASCADE_MIN_QUALITY", "6"))  # Image quality 1-10
+    # USD per million (input, output) tokens, for the per-request cost estimate (list prices, update as needed)
+    VISION_MODEL_PRICES = {
+        "gemini-2.5-flash-lite": (0.10, 0.40),
+        "gemini-2.5-flash": (0.30, 2.50),
+        "gemini-2.5-pro": (1.25, 10.00)
+    }
+
+    # Vision response format: "prose" (structured text report) or "json" (schema-constrained, compact)
+    VISION_OUTPUT_MODE = os.getenv("VISION_OUTPUT_MODE", "prose").lower()
+    VISION_JSON_MAX_OUTPUT_TOKENS = int(os.getenv("VISION_JSON_MAX_OUTPUT_TOKENS", "400"))  # Per image
+    # Stream the vision response and start the PubMed search as soon as the injury type arrives
+    VISION_STREAMING = os.getenv("VISION_STREAMING", "true").lower() != "false"
+
+    # Service endpoints (override to point at local stand-ins, see benchmarks/stub_servers.py)
+    PUBMED_BASE_URL = os.getenv("PUBMED_BASE_URL", "https://eutils.ncbi.nlm.nih.gov/entrez/eutils/")
+    GEMINI_API_ENDPOINT = os.getenv("GEMINI_API_ENDPOINT")  # e.g. http://127.0.0.1:8765
+    GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT")  # "rest" is required for plain-HTTP endpoints
+    ELEVENLABS_BASE_URL = os.getenv("ELEVENLABS_BASE_URL")
+
+    # Fast start: defer the SDK imports and build the CrewAI agent definitions on first access
+    # (the pipeline never runs them). FAST_START=false builds them in MedicalAssessmentCrew() and preloads the SDKs
+    FAST_START = os.getenv("FAST_START", "true").lower() != "false"
+
+    # Let the vision model's SEVERITY ASSESSMENT raise the patient-facing report severity
+    REPORT_SEVERITY_FROM_VISION = os.getenv("REPORT_SEVERITY_FROM_VISION", "false").lower() == "true"
+
     # Confidence Thresholds
     CONFIDENCE_THRESHOLD = 75  # Percentage
     DIFFERENTIAL_DIAGNOSIS_COUNT = 3
@@ -22,10 +58,109 @@ class Config:
     MAX_RETRIES = 3
     RETRY_DELAY = 2  # seconds
 
+    # Per-stage retry policies (max_retries counts total attempts)
+    STAGE_RETRY_POLICIES = {
+        "vision": {"max_retries": 3, "base_delay": 2},  # Paid Gemini call
+        "diagnostic": {"max_retries": 3, "base_delay": 1},  # PubMed
+        "communication": {"max_retries": 2, "base_delay": 1}  # ElevenLabs/gTTS
+    }
+
+    # Provider rate limits shared by all crews in a process
+    # rate = requests/second (token bucket holding `burst` tokens), max_concurrency = calls in flight
+    PROVIDER_RATE_LIMITS = {
+        "gemini": {"rate": float(os.getenv("GEMINI_RATE_LIMIT", "5")), "burst": 5, "max_concurrency": 8},
+        "ncbi": {"rate": 10 if NCBI_API_KEY else 3, "burst": 1, "max_concurrency": 3},
+        "elevenlabs": {"rate": float(os.getenv("ELEVENLABS_RATE_LIMIT", "2")), "burst": 2, "max_concurrency": 2}
+    }
+
+    # Record/replay of external calls: "off", "record" or "replay"
+    CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+    CASSETTE_DIR = os.getenv("CASSETTE_DIR", "data/cassettes")
+    # Simulated network latency per provider on replay (seconds)
+    CASSETTE_LATENCY = {
+        provider: float(os.getenv(f"CASSETTE_LATENCY_{provider.upper()}", os.getenv("CASSETTE_LATENCY", "0")))
+        for provider in ("gemini", "ncbi", "tts")
+    }
+
+    # Latency budget: default per-request deadline in seconds (0 disables)
+    ASSESSMENT_DEADLINE = float(os.getenv("ASSESSMENT_DEADLINE", "45"))
+    # Seconds that must remain before an optional step is attempted
+    DEADLINE_RESERVES = {
+        "pubmed_narrow": 10,  # Second PubMed pass (skipped otherwise)
+        "pubmed": 5,  # Live PubMed search (cached literature otherwise)
+        "elevenlabs": 6,  # ElevenLabs voice (gTTS otherwise)
+        "tts": 2  # Any audio (text-only report otherwise)
+    }
+    LITERATURE_CACHE_MAX_ENTRIES = 128  # PubMed results kept per query for degraded requests
+
+    # Stage graph: threads shared by concurrent stages of sync assessments
+    STAGE_GRAPH_WORKERS = int(os.getenv("STAGE_GRAPH_WORKERS", "16"))
+
+    # Crew Pool Settings
+    CREW_POOL_SIZE = int(os.getenv("CREW_POOL_SIZE", "4"))  # Max warm crews per process
+    CREW_POOL_CHECKOUT_TIMEOUT = 30  # seconds to wait for a free crew
+
+    # Result Cache (keyed by decoded pixel hash)
+    RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() != "false"
+    RESULT_CACHE_MAX_ENTRIES = 256
+    RESULT_CACHE_TTL = 3600  # seconds
+
+    # Local image-quality pre-screen (runs before the vision call; scores reported in metadata)
+    QUALITY_SCREEN_ENABLED = os.getenv("QUALITY_SCREEN_ENABLED", "true").lower() != "false"
+    QUALITY_SCREEN_SIZE = 512  # pixels, longest side of the screened copy
+    QUALITY_MIN_SHARPNESS = float(os.getenv("QUALITY_MIN_SHARPNESS", "2.0"))  # Laplacian variance, sharpest tile
+    QUALITY_MIN_BRIGHTNESS = 20  # Mean gray level (0-255)
+    QUALITY_MAX_BRIGHTNESS = 240
+    QUALITY_MAX_CLIPPED = 0.5  # Fraction of pixels at pure black or white
+    QUALITY_MAX_NOISE = float(os.getenv("QUALITY_MAX_NOISE", "15"))  # Estimated noise sigma (gray levels)
+
+    # Vision Upload Encoding (encoded once per request, sent as bytes)
+    VISION_UPLOAD_MAX_DIMENSION = int(os.getenv("VISION_UPLOAD_MAX_DIMENSION", "1536"))  # pixels
+    VISION_UPLOAD_FORMAT = os.getenv("VISION_UPLOAD_FORMAT", "JPEG").upper()  # JPEG or WEBP
+    VISION_UPLOAD_QUALITY = int(os.getenv("VISION_UPLOAD_QUALITY", "85"))
+    VISION_UPLOAD_MIN_QUALITY = 55  # Lowest quality tried before downscaling to fit the budget
+    VISION_UPLOAD_MAX_BYTES = int(os.getenv("VISION_UPLOAD_MAX_BYTES", str(1024 * 1024)))
+
+    # Near-duplicate Vision Index (perceptual hash of the resized photo)
+    # Opt-in: a match reuses the stored analysis of another photo, which may be another patient's
+    VISION_INDEX_ENABLED = os.getenv("VISION_INDEX_ENABLED", "false").lower() == "true"
+    VISION_INDEX_PATH = os.getenv("VISION_INDEX_PATH", "data/vision_index.json")
+    VISION_INDEX_MAX_DISTANCE = int(os.getenv("VISION_INDEX_MAX_DISTANCE", "6"))  # Hamming bits out of 64
+    VISION_INDEX_MAX_ENTRIES = 500
+    VISION_INDEX_TTL = 7 * 24 * 3600  # seconds
+    VISION_INDEX_SAVE_INTERVAL = 5  # seconds; inserts within this window are written together
+
+    # Batch Settings
+    BATCH_MAX_CONCURRENCY = 4  # Assessments in flight per batch
+    # Images per Gemini request in assess_many batches (1 = off). Opt-in: a multi-image prompt changes the answers
+    VISION_BATCH_SIZE = int(os.getenv("VISION_BATCH_SIZE", "1"))
+
+    # Job Queue (SQLite broker + worker processes)
+    USE_JOB_QUEUE = os.getenv("USE_JOB_QUEUE", "false").lower() == "true"
+    JOB_QUEUE_DB = os.getenv("JOB_QUEUE_DB", "data/jobs.sqlite3")
+    JOB_LEASE_SECONDS = 300  # A running job is re-queued if its worker goes silent this long
+    JOB_MAX_ATTEMPTS = 3
+    JOB_POLL_INTERVAL = 1.0  # seconds
+    JOB_RESULT_TIMEOUT = 180  # seconds the app keeps polling a queued job before leaving it to "Check status"
+
+    # HTTP Service (service.py)
+    SERVICE_HOST = os.getenv("SERVICE_HOST", "0.0.0.0")
+    SERVICE_PORT = int(os.getenv("SERVICE_PORT", "8080"))
+    SERVICE_MAX_IN_FLIGHT = 32  # Assessments running at once before returning 429
+    SERVICE_MAX_STORED_RESULTS = 1000  # Finished assessments kept for GET
+    SERVICE_RETRY_AFTER = 5  # seconds suggested to clients on 429
+    MAX_UPLOAD_BYTES = 10 * 1024 * 1024  # Same limit as ImageProcessor.validate_image
+
     # Output Settings
     OUTPUT_DIR = "data/outputs"
     AUDIO_DIR = "data/outputs/audio"
 
+    # Include full stage memory (PubMed author lists etc.) in results
+    DEBUG_RESULTS = os.getenv("DEBUG_RESULTS", "false").lower() == "true"
+
+    # Tracing: append each assessment's spans as JSON lines (disabled when unset)
+    TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH")
+
     # Medical Disclaimer
     DISCLAIMER = """
     ⚠️ MEDICAL DISCLAIMER
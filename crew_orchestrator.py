@@ -1,11 +1,24 @@
-from crewai import Crew, Task, Process,LLM
 from agents.vision_agent import create_vision_agent, VisionAgentHandler
 from agents.diagnostic_agent import create_diagnostic_agent, DiagnosticAgentHandler
 from agents.communication_agent import create_communication_agent, CommunicationAgentHandler
-from utils.retry_handler import retry_with_exponential_backoff
+from agents.vision_findings import VisionFindings
+from utils.assessment_context import AssessmentContext
+from utils.assessment_result import AssessmentResult
+from utils.image_processor import ImageProcessor
+from utils.result_cache import get_result_cache, image_content_hash
+from utils.stage_graph import Stage, StageGraph, HaltPipeline
+from utils.tracing import span, use_trace, to_json_lines
 from config.config import Config
-from typing import Dict
-import json
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import asyncio
+import contextvars
+import itertools
+import os
+import queue
+import threading
+import time
 
 class MedicalAssessmentCrew:
     def __init__(self):
@@ -14,177 +27,904 @@ class MedicalAssessmentCrew:
         self.diagnostic_handler = DiagnosticAgentHandler()
         self.communication_handler = CommunicationAgentHandler()
 
-        # Create agents
-        self.vision_agent = create_vision_agent()
-        self.diagnostic_agent = create_diagnostic_agent()
-        self.communication_agent = create_communication_agent()
+        # CrewAI agent definitions (built on first access in fast-start mode)
+        self._agents = {}
+        if not Config.FAST_START:
+            self._agent("vision", create_vision_agent)
+            self._agent("diagnostic", create_diagnostic_agent)
+            self._agent("communication", create_communication_agent)
 
-        # Shared memory for context
-        self.crew_memory = {}
+        # Stage DAG (stateless - per-request values live on the context)
+        self.pipeline = self._build_pipeline()
 
-    @retry_with_exponential_backoff(max_retries=Config.MAX_RETRIES)
-    def assess_injury(self, image_path: str) -> Dict:
+        # Results keyed by image content, shared by every crew in the process
+        self.result_cache = get_result_cache() if Config.RESULT_CACHE_ENABLED else None
+
+        # Most recent request context (debugging only, never read on the hot path)
+        self._last_context = None
+
+    def assess_injury(self, image_path: str, context: Optional[AssessmentContext] = None,
+                      deadline: Optional[float] = None) -> Dict:
         """
         Main orchestration method - coordinates all agents
+        All per-request state lives on `context`, so one crew can serve
+        concurrent assessments from multiple threads
+        Stages run as a DAG: independent stages overlap and the critical path is
+        reported in metadata. Each stage checkpoints its outputs on the context
+        and retries with its group's policy, so a failure in a later stage never
+        repeats the vision call. Passing the same context again resumes from the
+        unfinished stages.
+        `deadline` is the request's latency budget in seconds (default
+        Config.ASSESSMENT_DEADLINE). Stages that run short skip the narrow
+        PubMed pass, use cached literature or fall back to fast/no TTS, and
+        list what they did in metadata['degradations'].
         Returns comprehensive assessment
         """
-        print("🔍 Starting medical assessment...")
+        context = self._prepare_context(image_path, context, deadline)
 
-        # Step 1: Vision Agent Analysis
-        print("\n✅ Vision Agent: Analyzing image...")
-        vision_result = self._run_vision_analysis(image_path)
-        self.crew_memory['vision_analysis'] = vision_result
+        key = self._cache_key(context)
+        if key is None:
+            return self._assess(context)
 
-        # Check image quality
-        if vision_result['image_quality'] < 5:
-            return {
-                "error": "Image quality too low. Please upload a clearer photo.",
-                "image_quality": vision_result['image_quality']
-            }
+        result, source = self.result_cache.get_or_compute(
+            key, lambda: self._assess(context), store_if=self._is_complete
+        )
+        return self._tag_cache_source(context, result, source)
 
-        # Step 2: Diagnostic Agent Analysis
-        print("\n🏥 Diagnostic Agent: Consulting medical literature...")
-        diagnostic_result = self._run_diagnostic_analysis(vision_result)
-        self.crew_memory['diagnostic_analysis'] = diagnostic_result
+    async def assess_injury_async(self, image_path: str, context: Optional[AssessmentContext] = None,
+                                  deadline: Optional[float] = None) -> Dict:
+        """
+        Async variant of assess_injury
+        Uses the async Gemini client, aiohttp for PubMed and async TTS, so one
+        event loop can keep many assessments in flight
+        """
+        context = self._prepare_context(image_path, context, deadline)
+
+        key = await asyncio.to_thread(self._cache_key, context)
+        if key is None:
+            return await self._assess_async(context)
+
+        result, source = await self.result_cache.get_or_compute_async(
+            key, lambda: self._assess_async(context), store_if=self._is_complete
+        )
+        return self._tag_cache_source(context, result, source)
+
+    def _prepare_context(self, image_path: str, context: Optional[AssessmentContext],
+                         deadline: Optional[float]) -> AssessmentContext:
+        if context is None:
+            context = AssessmentContext(image_path, deadline=deadline)
+        elif deadline is not None:
+            context.set_deadline(deadline)
+        self._last_context = context
+        return context
+
+    @staticmethod
+    def _is_complete(result: Dict) -> bool:
+        """Degraded results are returned but never cached for later requests"""
+        return not result.get('metadata', {}).get('degradations')
+
+    def _assess(self, context: AssessmentContext) -> Dict:
+        """Run the traced pipeline for one request (no caching)"""
+        with use_trace(context.trace):
+            with span("assessment"):
+                result = self._run_pipeline(context)
+
+        return self._attach_trace(context, result)
+
+    async def _assess_async(self, context: AssessmentContext) -> Dict:
+        """Async variant of _assess"""
+        with use_trace(context.trace):
+            with span("assessment"):
+                result = await self._run_pipeline_async(context)
+
+        return self._attach_trace(context, result)
+
+    def _cache_key(self, context: AssessmentContext) -> Optional[str]:
+        """Pixel-content key for the result cache, or None to bypass it"""
+        # Resumed requests already hold partial stage output - never coalesce those
+        # (outputs seeded by the batch prefetch are fresh, so those requests still use the cache)
+        if self.result_cache is None or set(context.memory) - context.seeded:
+            return None
+        try:
+            preview = ImageProcessor.load_preview(context.image_path)
+            if 'image_screen' not in context.memory:
+                context.preview = preview  # One decode serves the key and the pre-screen
+            return image_content_hash(context.image_path, preview)
+        except Exception as e:
+            # Unreadable images fall through to the vision stage, which reports the error
+            print(f"⚠️ Could not hash image for cache: {e}")
+            return None
+
+    def _tag_cache_source(self, context: AssessmentContext, result: Dict, source: str) -> Dict:
+        """Mark results that were served from the cache or a coalesced request"""
+        if source != "miss":
+            print(f"♻️ Served assessment from cache ({source})")
+            metadata = result.setdefault('metadata', {})
+            metadata['cached_from'] = metadata.get('request_id')
+            metadata['request_id'] = context.request_id
+        if 'metadata' in result:
+            result['metadata']['cache'] = source
+        return result
+
+    def _build_pipeline(self) -> StageGraph:
+        """
+        Declare the assessment as a DAG of stages
+        A local quality screen runs before the paid vision call, both PubMed passes
+        run side by side (the narrow pass is discarded if the broad one finds
+        nothing), and the detailed report renders while TTS runs
+        """
+        return StageGraph([
+            Stage('prescreen', self._stage_prescreen, outputs=['image_screen'],
+                  async_func=self._stage_prescreen_async),
+            Stage('vision', self._stage_vision, inputs=['image_screen'], outputs=['vision_analysis'],
+                  group='vision', async_func=self._stage_vision_async),
+            Stage('quality_gate', self._stage_quality_gate,
+                  inputs=['vision_analysis'], outputs=['description', 'vision_findings']),
+            Stage('pubmed_query', self._stage_pubmed_query,
+                  inputs=['vision_findings'], outputs=['pubmed_query']),
+            Stage('pubmed_broad', self._stage_pubmed_broad, inputs=['pubmed_query'],
+                  outputs=['broad_results'], group='diagnostic', async_func=self._stage_pubmed_broad_async),
+            Stage('pubmed_narrow', self._stage_pubmed_narrow, inputs=['pubmed_query'],
+                  outputs=['narrow_results'], group='diagnostic', async_func=self._stage_pubmed_narrow_async),
+            Stage('literature', self._stage_literature,
+                  inputs=['broad_results', 'narrow_results'], outputs=['pubmed_results']),
+            Stage('differential', self._stage_differential,
+                  inputs=['vision_findings', 'pubmed_results'], outputs=['diagnostic_analysis']),
+            Stage('report_summary', self._stage_report_summary,
+                  inputs=['diagnostic_analysis', 'vision_findings'], outputs=['report_summary']),
+            Stage('report_details', self._stage_report_details,
+                  inputs=['diagnostic_analysis'], outputs=['report_details']),
+            Stage('tts', self._stage_tts, inputs=['report_summary'], outputs=['audio_path'],
+                  group='communication', async_func=self._stage_tts_async),
+            Stage('patient_report', self._stage_patient_report,
+                  inputs=['report_summary', 'report_details', 'audio_path'], outputs=['patient_report'])
+        ])
+
+    def _run_pipeline(self, context: AssessmentContext) -> Dict:
+        """Run the stage graph for one request"""
+        print(f"🔍 Starting medical assessment ({context.request_id})...")
 
-        # Step 3: Communication Agent Output
-        print("\n🎙️ Communication Agent: Preparing patient report...")
-        communication_result = self._run_communication_generation(diagnostic_result)
-
-        # Compile final assessment
-        final_assessment = {
-            "vision_analysis": vision_result,
-            "diagnostic_analysis": diagnostic_result,
-            "patient_report": communication_result,
-            "metadata": {
-                "confidence": diagnostic_result.get('confidence', 0),
-                "requires_professional_review": communication_result.get('requires_professional_review', True),
-                "image_quality": vision_result['image_quality'],
-                "crew_memory": self.crew_memory
-            }
-        }
+        try:
+            halted = self.pipeline.run(context)
+        finally:
+            # Early PubMed searches nobody claimed (halted or failed run) must not keep spending quota
+            self._discard_prefetch(context)
+        if halted is not None:
+            return halted
+
+        print(f"\n✅ Assessment complete! ({context.request_id})")
+        return self._compile_assessment(context)
 
-        print("\n✅ Assessment complete!")
-        return final_assessment
+    async def _run_pipeline_async(self, context: AssessmentContext) -> Dict:
+        """Async variant of _run_pipeline"""
+        print(f"🔍 Starting medical assessment ({context.request_id})...")
 
-    def _run_vision_analysis(self, image_path: str) -> Dict:
-        """Execute vision agent with retry logic"""
         try:
-            result = self.vision_handler.analyze_image(image_path)
+            halted = await self.pipeline.run_async(context)
+        finally:
+            self._discard_prefetch(context)
+        if halted is not None:
+            return halted
+
+        print(f"\n✅ Assessment complete! ({context.request_id})")
+        return self._compile_assessment(context)
+
+    def _attach_trace(self, context: AssessmentContext, result: Dict) -> Dict:
+        """Add the request's spans to the result and append them to the trace log"""
+        spans = context.trace.to_list()
+        if 'metadata' in result:
+            result['metadata']['spans'] = spans
+
+        if Config.TRACE_LOG_PATH:
+            try:
+                with open(Config.TRACE_LOG_PATH, "a") as f:
+                    f.write(to_json_lines(spans))
+            except OSError as e:
+                print(f"⚠️ Could not write trace log: {e}")
+
+        return result
+
+    def _low_quality_result(self, vision_result: Dict) -> Dict:
+        """Result returned when the photo is too poor to assess"""
+        return {
+            "error": "Image quality too low. Please upload a clearer photo.",
+            "image_quality": vision_result['image_quality']
+        }
 
-            # Create CrewAI task for structured processing
-            vision_task = Task(
-                description=f"""
-                Process this medical image analysis and extract key structured data:
+    def _unusable_photo_result(self, screen: Dict) -> Dict:
+        """Result returned when the local screen rejects the photo (no vision call made)"""
+        return {
+            "error": f"Image quality too low ({', '.join(screen['reasons'])}). Please upload a clearer photo.",
+            "image_screen": screen
+        }
+
+    def _compile_assessment(self, context: AssessmentContext) -> Dict:
+        """Compile the compact final assessment from the stage outputs in the context"""
+        result = AssessmentResult.from_context(context, debug=context.debug).to_dict()
+        result['metadata']['critical_path'] = self.pipeline.critical_path(context.stage_timings)
+        return result
 
-                Raw Analysis: {result['description']}
+    # Pipeline stages: each takes its declared inputs and returns its outputs
 
-                Extract and structure:
-                1. Injury type
-                2. Key visible features
-                3. Severity assessment
-                4. Confidence level
-                """,
-                agent=self.vision_agent,
-                expected_output="Structured JSON with injury analysis"
+    def screen_image(self, image_path: str, preview=None) -> Optional[Dict]:
+        """Local quality screen of a photo, or None when screening is off or the image is unreadable"""
+        if not Config.QUALITY_SCREEN_ENABLED:
+            return None
+        try:
+            with span("prescreen") as attributes:
+                screen = ImageProcessor.screen_quality(image_path, preview=preview)
+                attributes.update(screen['scores'])
+        except Exception as e:
+            # Unreadable images fall through to the vision stage, which reports the error
+            print(f"⚠️ Could not pre-screen image: {e}")
+            return None
+        return screen
+
+    def _stage_prescreen(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        """Reject obviously unusable photos before paying for the vision call"""
+        screen = self.screen_image(context.image_path, context.preview)
+        context.preview = None
+        self._check_screen(screen)
+        return {'image_screen': screen}
+
+    def _check_screen(self, screen: Optional[Dict]):
+        """Halt on a photo the local screen rejected"""
+        if screen is not None and not screen['usable']:
+            print(f"🚫 Photo rejected before vision: {', '.join(screen['reasons'])}")
+            raise HaltPipeline(self._unusable_photo_result(screen))
+
+    async def _stage_prescreen_async(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        return await asyncio.to_thread(self._stage_prescreen, context, inputs)
+
+    def _stage_vision(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        """Execute vision agent"""
+        # A screen seeded by assess_many skips the prescreen stage, so its rejection lands here
+        self._check_screen(inputs['image_screen'])
+        print("\n✅ Vision Agent: Analyzing image...")
+        try:
+            result = self.vision_handler.analyze_image(
+                context.image_path,
+                on_injury_type=self._literature_prefetcher(context)
             )
 
             # Add structured data to result
             result['structured_analysis'] = result['description']
-            return result
+
+            return {'vision_analysis': result}
 
         except Exception as e:
             print(f"❌ Vision Agent error: {e}")
             raise
 
-    def _run_diagnostic_analysis(self, vision_result: Dict) -> Dict:
-        """Execute diagnostic agent with PubMed integration"""
+    async def _stage_vision_async(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        """Async vision stage"""
+        self._check_screen(inputs['image_screen'])
+        print("\n✅ Vision Agent: Analyzing image...")
         try:
-            description = vision_result['description']
-
-            # Search PubMed
-            pubmed_results = self.diagnostic_handler.search_pubmed(
-                description,
-                max_results=10
-            )
-
-            # Generate differential diagnosis
-            differential = self.diagnostic_handler.generate_differential_diagnosis(
-                description,
-                pubmed_results
+            result = await self.vision_handler.analyze_image_async(
+                context.image_path,
+                on_injury_type=self._literature_prefetcher(context, asynchronous=True)
             )
+            result['structured_analysis'] = result['description']
 
-            # Create diagnostic task
-            diagnostic_task = Task(
-                description=f"""
-                Based on this injury analysis:
-                {description}
-
-                And these medical literature findings:
-                {json.dumps([r['title'] for r in pubmed_results[:5]], indent=2)}
-
-                Provide:
-                1. Most likely diagnosis
-                2. Differential diagnoses (top 3)
-                3. Recommended actions
-                4. Warning signs to watch for
-                """,
-                agent=self.diagnostic_agent,
-                expected_output="Evidence-based diagnostic assessment"
-            )
+            return {'vision_analysis': result}
 
-            # Combine results
-            result = {
-                **differential,
-                'pubmed_results': pubmed_results,
-                'literature_count': len(pubmed_results)
-            }
+        except Exception as e:
+            print(f"❌ Vision Agent error: {e}")
+            raise
 
-            return result
+    def _stage_quality_gate(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        """Stop before the literature search when the photo is too poor to assess"""
+        vision_result = inputs['vision_analysis']
+        findings = VisionFindings.from_result(vision_result)
+        if findings.image_quality < 5:
+            raise HaltPipeline(self._low_quality_result(vision_result))
+        return {'description': vision_result['description'], 'vision_findings': findings}
 
+    def _stage_pubmed_query(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        print("\n🏥 Diagnostic Agent: Consulting medical literature...")
+        query = self.diagnostic_handler.build_query(inputs['vision_findings'])
+        print(f"PubMed query: {query}")  # Debug output
+        return {'pubmed_query': query}
+
+    def _stage_pubmed_broad(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        query = inputs['pubmed_query']
+        prefetched = self._prefetched_literature(context, 'broad_results', query)
+        if prefetched is not None:
+            return {'broad_results': prefetched}
+        if not context.can_afford('pubmed'):
+            return {'broad_results': self._fallback_literature(context, query)}
+        return {'broad_results': self.diagnostic_handler.search_pass(query, 10, timeout=context.remaining())}
+
+    async def _stage_pubmed_broad_async(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        query = inputs['pubmed_query']
+        prefetched = await self._prefetched_literature_async(context, 'broad_results', query)
+        if prefetched is not None:
+            return {'broad_results': prefetched}
+        if not context.can_afford('pubmed'):
+            return {'broad_results': self._fallback_literature(context, query)}
+        return {'broad_results': await self.diagnostic_handler.search_pass_async(
+            query, 10, timeout=context.remaining()
+        )}
+
+    def _stage_pubmed_narrow(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        """Speculative treatment-focused pass, run alongside the broad pass"""
+        prefetched = self._prefetched_literature(context, 'narrow_results', inputs['pubmed_query'])
+        if prefetched is not None:
+            return {'narrow_results': prefetched}
+        if not context.can_afford('pubmed_narrow'):
+            context.degrade('pubmed_narrow', 'skipped')
+            return {'narrow_results': None}
+        query = self.diagnostic_handler.narrow_query(inputs['pubmed_query'])
+        return {'narrow_results': self.diagnostic_handler.search_pass(query, 5, timeout=context.remaining())}
+
+    async def _stage_pubmed_narrow_async(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        prefetched = await self._prefetched_literature_async(context, 'narrow_results', inputs['pubmed_query'])
+        if prefetched is not None:
+            return {'narrow_results': prefetched}
+        if not context.can_afford('pubmed_narrow'):
+            context.degrade('pubmed_narrow', 'skipped')
+            return {'narrow_results': None}
+        query = self.diagnostic_handler.narrow_query(inputs['pubmed_query'])
+        return {'narrow_results': await self.diagnostic_handler.search_pass_async(
+            query, 5, timeout=context.remaining()
+        )}
+
+    # Literature prefetch: PubMed passes started while the vision answer is still streaming
+
+    def _literature_prefetcher(self, context: AssessmentContext, asynchronous: bool = False) -> Optional[Callable]:
+        """
+        Vision callback that starts both PubMed passes as soon as the injury type streams in
+        The pubmed stages reuse them if the final findings give the same query
+        """
+        if not Config.VISION_STREAMING:
+            return None
+
+        def start(findings: VisionFindings):
+            query = self.diagnostic_handler.build_query(findings)
+            if context.prefetch.get('query') == query:
+                return  # Already searching (retried vision attempt)
+            self._discard_prefetch(context)
+
+            passes = {}
+            if context.can_afford('pubmed'):
+                passes['broad_results'] = (query, 10)
+            if context.can_afford('pubmed_narrow'):
+                passes['narrow_results'] = (self.diagnostic_handler.narrow_query(query), 5)
+            if not passes:
+                return
+
+            print(f"⚡ Starting PubMed search early: {query}")
+            context.prefetch['query'] = query
+            for output, (pass_query, max_results) in passes.items():
+                if asynchronous:
+                    context.prefetch[output] = asyncio.ensure_future(self.diagnostic_handler.search_pass_async(
+                        pass_query, max_results, timeout=context.remaining()
+                    ))
+                else:
+                    # Copy the context so the search spans land on this request's trace
+                    context.prefetch[output] = _get_prefetch_executor().submit(
+                        contextvars.copy_context().run,
+                        self.diagnostic_handler.search_pass, pass_query, max_results, context.remaining()
+                    )
+
+        return start
+
+    def _claim_prefetch(self, context: AssessmentContext, output: str, query: str):
+        """The early search for `output` if it used `query`; a stale one is cancelled"""
+        pending = context.prefetch.pop(output, None)
+        if pending is None:
+            return None
+        if context.prefetch.get('query') != query:
+            print("↪️ Final injury type changed the PubMed query; discarding the early search")
+            pending.cancel()
+            return None
+        return pending
+
+    def _prefetched_literature(self, context: AssessmentContext, output: str, query: str) -> Optional[List[Dict]]:
+        """Results of the early search, or None if the stage should search itself"""
+        pending = self._claim_prefetch(context, output, query)
+        # A search that never got a thread is cancelled and run inline instead
+        if pending is None or pending.cancel():
+            return None
+        try:
+            return pending.result()
+        except Exception as e:
+            print(f"⚠️ Early PubMed search failed, searching again: {e}")
+            return None
+
+    async def _prefetched_literature_async(self, context: AssessmentContext, output: str,
+                                           query: str) -> Optional[List[Dict]]:
+        pending = self._claim_prefetch(context, output, query)
+        if pending is None:
+            return None
+        try:
+            return await pending
+        except Exception as e:
+            print(f"⚠️ Early PubMed search failed, searching again: {e}")
+            return None
+
+    def _discard_prefetch(self, context: AssessmentContext):
+        """Cancel early searches that no stage will claim (one already running finishes unread)"""
+        for output in ('broad_results', 'narrow_results'):
+            pending = context.prefetch.pop(output, None)
+            if pending is None:
+                continue
+            if not pending.cancel() and isinstance(pending, asyncio.Future) and not pending.cancelled():
+                pending.exception()  # Retrieve it so asyncio doesn't warn about a failed, unread task
+        context.prefetch.pop('query', None)
+
+    def _fallback_literature(self, context: AssessmentContext, query: str) -> List[Dict]:
+        """Literature for a request with no time left to search PubMed"""
+        cached = self.diagnostic_handler.cached_literature(query)
+        if cached is not None:
+            context.degrade('pubmed_broad', 'cached_literature')
+            return cached
+        context.degrade('pubmed_broad', 'skipped')
+        return []
+
+    def _stage_literature(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        return {'pubmed_results': self.diagnostic_handler.merge_passes(
+            inputs['broad_results'],
+            inputs['narrow_results'],
+            max_results=10
+        )}
+
+    def _stage_differential(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        """Execute diagnostic agent on the PubMed literature"""
+        pubmed_results = inputs['pubmed_results']
+
+        differential = self.diagnostic_handler.generate_differential_diagnosis(
+            inputs['vision_findings'],
+            pubmed_results
+        )
+
+        # Combine results
+        return {'diagnostic_analysis': {
+            **differential,
+            'pubmed_results': pubmed_results,
+            'literature_count': len(pubmed_results)
+        }}
+
+    def _stage_report_summary(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        print("\n🎙️ Communication Agent: Preparing patient report...")
+        return {'report_summary': self.communication_handler.build_summary(
+            inputs['diagnostic_analysis'],
+            inputs['vision_findings']
+        )}
+
+    def _stage_report_details(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        return {'report_details': self.communication_handler.build_details(inputs['diagnostic_analysis'])}
+
+    def _stage_tts(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        fast = self._tts_mode(context)
+        if fast is None:
+            return {'audio_path': None}
+        try:
+            return {'audio_path': self.communication_handler.synthesize_audio(
+                inputs['report_summary'],
+                request_id=context.request_id,
+                fast=fast
+            )}
         except Exception as e:
-            print(f"❌ Diagnostic Agent error: {e}")
+            print(f"❌ Communication Agent error: {e}")
             raise
 
-    def _run_communication_generation(self, diagnostic_result: Dict) -> Dict:
-        """Execute communication agent for patient output"""
+    async def _stage_tts_async(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        fast = self._tts_mode(context)
+        if fast is None:
+            return {'audio_path': None}
         try:
-            report = self.communication_handler.generate_patient_report(diagnostic_result)
+            return {'audio_path': await self.communication_handler.synthesize_audio_async(
+                inputs['report_summary'],
+                request_id=context.request_id,
+                fast=fast
+            )}
+        except Exception as e:
+            print(f"❌ Communication Agent error: {e}")
+            raise
 
-            # Create communication task
-            communication_task = Task(
-                description=f"""
-                Create a patient-friendly explanation of this diagnosis:
+    def _tts_mode(self, context: AssessmentContext) -> Optional[bool]:
+        """False for the normal voice, True for fast TTS, None for a text-only report"""
+        if not context.can_afford('tts'):
+            context.degrade('tts', 'text_only')
+            return None
+        if not context.can_afford('elevenlabs'):
+            context.degrade('tts', 'fast_tts')
+            return True
+        return False
+
+    def _stage_patient_report(self, context: AssessmentContext, inputs: Dict) -> Dict:
+        """Assemble the patient report from its independently produced parts"""
+        summary = inputs['report_summary']
+        return {'patient_report': {
+            **summary,
+            **inputs['report_details'],
+            'audio_path': inputs['audio_path']
+        }}
+
+    @property
+    def vision_agent(self):
+        return self._agent("vision", create_vision_agent)
+
+    @property
+    def diagnostic_agent(self):
+        return self._agent("diagnostic", create_diagnostic_agent)
+
+    @property
+    def communication_agent(self):
+        return self._agent("communication", create_communication_agent)
+
+    def _agent(self, name: str, factory: Callable):
+        """Create a CrewAI agent definition once (the pipeline never executes them)"""
+        if name not in self._agents:
+            self._agents[name] = factory()
+        return self._agents[name]
 
-                Primary Diagnosis: {diagnostic_result.get('primary_diagnosis', {})}
-                Confidence: {diagnostic_result.get('confidence', 0)}%
+    def get_crew_context(self) -> Dict:
+        """Return a copy of the most recent assessment's memory for debugging"""
+        context = self._last_context
+        return dict(context.memory) if context else {}
 
-                Requirements:
-                1. Use plain language (no medical jargon)
-                2. Provide clear next steps
-                3. Be empathetic and reassuring where appropriate
-                4. Include appropriate warnings
-                """,
-                agent=self.communication_agent,
-                expected_output="Patient-friendly report with clear guidance"
-            )
+    def health_check(self) -> bool:
+        """Check that handlers are initialized and the audio directory is usable"""
+        try:
+            if self.vision_handler is None or not self.vision_handler.is_ready():
+                return False
+            if self.diagnostic_handler is None or self.communication_handler is None:
+                return False
+            os.makedirs(Config.AUDIO_DIR, exist_ok=True)
+            return os.access(Config.AUDIO_DIR, os.W_OK)
+        except Exception as e:
+            print(f"⚠️ Crew health check failed: {e}")
+            return False
 
-            return report
 
-        except Exception as e:
-            print(f"❌ Communication Agent error: {e}")
-            raise
+class CrewPool:
+    """
+    Process-wide pool of warm MedicalAssessmentCrew instances
+    Crews are created lazily up to `size` and handed out with checkout/checkin
+    """
 
-    def get_crew_context(self) -> Dict:
-        """Return shared crew memory for debugging"""
-        return self.crew_memory
+    def __init__(self, size: int = Config.CREW_POOL_SIZE, factory: Optional[Callable] = None):
+        if size < 1:
+            raise ValueError("Crew pool size must be at least 1")
+        self.size = size
+        self._factory = factory or MedicalAssessmentCrew
+        # LIFO so the most recently used crew is handed out first
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._metrics = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "discarded": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "last_wait_seconds": 0.0
+        }
+
+    def checkout(self, timeout: Optional[float] = None) -> MedicalAssessmentCrew:
+        """
+        Take a healthy crew from the pool, creating one if below capacity
+        Blocks up to `timeout` seconds when all crews are in use
+        """
+        timeout = Config.CREW_POOL_CHECKOUT_TIMEOUT if timeout is None else timeout
+        start = time.perf_counter()
+
+        crew = self._take(timeout)
+        while not crew.health_check():
+            print("⚠️ Discarding unhealthy crew from pool")
+            self._discard()
+            crew = self._take(max(timeout - (time.perf_counter() - start), 0))
+
+        self._record_wait(time.perf_counter() - start)
+        return crew
+
+    def checkin(self, crew: MedicalAssessmentCrew):
+        """Return a crew to the pool"""
+        self._idle.put(crew)
+
+    @contextmanager
+    def crew(self, timeout: Optional[float] = None):
+        """Context manager that checks a crew out and always returns it"""
+        crew = self.checkout(timeout)
+        try:
+            yield crew
+        finally:
+            self.checkin(crew)
+
+    def warm(self, count: Optional[int] = None):
+        """Pre-create crews so the first requests don't pay the setup cost"""
+        count = self.size if count is None else min(count, self.size)
+        crews = [self.checkout() for _ in range(count)]
+        for crew in crews:
+            self.checkin(crew)
+
+    def get_metrics(self) -> Dict:
+        """Return pool usage and wait-time metrics"""
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["size"] = self.size
+            metrics["created"] = self._created
+        metrics["idle"] = self._idle.qsize()
+        metrics["in_use"] = metrics["created"] - metrics["idle"]
+        checkouts = metrics["checkouts"]
+        metrics["avg_wait_seconds"] = metrics["total_wait_seconds"] / checkouts if checkouts else 0.0
+        return metrics
+
+    def _take(self, timeout: float) -> MedicalAssessmentCrew:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+
+        if can_create:
+            try:
+                return self._factory()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._metrics["timeouts"] += 1
+            raise TimeoutError(f"No medical assessment crew available after {timeout}s")
+
+    def _discard(self):
+        with self._lock:
+            self._created -= 1
+            self._metrics["discarded"] += 1
+
+    def _record_wait(self, wait_seconds: float):
+        with self._lock:
+            self._metrics["checkouts"] += 1
+            self._metrics["total_wait_seconds"] += wait_seconds
+            self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], wait_seconds)
+            self._metrics["last_wait_seconds"] = wait_seconds
+
+
+_crew_pool = None
+_crew_pool_lock = threading.Lock()
+_shared_crew = None
+_prefetch_executor = None
+_prefetch_executor_lock = threading.Lock()
+
+
+def get_crew_pool() -> CrewPool:
+    """Return the process-wide crew pool, creating it on first use"""
+    global _crew_pool
+    if _crew_pool is None:
+        with _crew_pool_lock:
+            if _crew_pool is None:
+                _crew_pool = CrewPool()
+    return _crew_pool
+
+
+def _get_prefetch_executor() -> ThreadPoolExecutor:
+    """Threads for PubMed searches started ahead of their stage (sync assessments)"""
+    global _prefetch_executor
+    if _prefetch_executor is None:
+        with _prefetch_executor_lock:
+            if _prefetch_executor is None:
+                _prefetch_executor = ThreadPoolExecutor(
+                    max_workers=Config.STAGE_GRAPH_WORKERS,
+                    thread_name_prefix="prefetch"
+                )
+    return _prefetch_executor
 
 
 # Convenience function
 def run_medical_assessment(image_path: str) -> Dict:
     """
     Main entry point for medical assessment
+    Draws a warm crew from the process-wide pool
+    """
+    with get_crew_pool().crew() as crew:
+        return crew.assess_injury(image_path)
+
+
+def get_shared_crew() -> MedicalAssessmentCrew:
+    """
+    Return a single crew shared by async callers
+    Safe because all per-request state lives on AssessmentContext
     """
-    crew = MedicalAssessmentCrew()
-    return crew.assess_injury(image_path)
+    global _shared_crew
+    if _shared_crew is None:
+        with _crew_pool_lock:
+            if _shared_crew is None:
+                _shared_crew = MedicalAssessmentCrew()
+    return _shared_crew
+
+
+async def run_medical_assessment_async(image_path: str) -> Dict:
+    """
+    Async entry point for medical assessment
+    """
+    crew = await asyncio.to_thread(get_shared_crew)
+    return await crew.assess_injury_async(image_path)
+
+
+def assess_many(image_paths: Iterable[str], max_concurrency: Optional[int] = None,
+                per_stage_limits: Optional[Dict[str, int]] = None,
+                vision_batch_size: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Assess a batch of images, yielding each result as soon as it finishes
+    One pooled crew (and its handlers) serves the whole batch from worker threads.
+    `per_stage_limits` caps concurrent calls per stage, e.g. {"vision": 2}.
+    Vision runs `vision_batch_size` images per Gemini request (default Config.VISION_BATCH_SIZE, 1 = off).
+    Failures are yielded as {"image_path", "error", "error_type"} and never abort the batch.
+    """
+    max_concurrency = max_concurrency or Config.BATCH_MAX_CONCURRENCY
+    vision_batch_size = vision_batch_size or Config.VISION_BATCH_SIZE
+    stage_limits = {
+        stage: threading.BoundedSemaphore(limit)
+        for stage, limit in (per_stage_limits or {}).items()
+    }
+    paths = iter(image_paths)
+
+    with get_crew_pool().crew() as crew:
+        items = _iter_prefetched(crew, paths, vision_batch_size)
+
+        def run_one(image_path, screen, vision_result):
+            context = AssessmentContext(image_path, stage_limits=stage_limits)
+            _seed_vision(context, screen, vision_result)
+            return crew.assess_injury(image_path, context=context)
+
+        executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="assess")
+        pending = {}
+        try:
+            # Keep at most max_concurrency items in flight so long queues stay bounded
+            for item in items:
+                pending[executor.submit(run_one, *item)] = item[0]
+                if len(pending) >= max_concurrency:
+                    break
+
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    image_path = pending.pop(future)
+                    yield _batch_item(image_path, future)
+
+                    next_item = next(items, None)
+                    if next_item is not None:
+                        pending[executor.submit(run_one, *next_item)] = next_item[0]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def assess_many_async(image_paths: Iterable[str], max_concurrency: Optional[int] = None,
+                            per_stage_limits: Optional[Dict[str, int]] = None,
+                            vision_batch_size: Optional[int] = None) -> AsyncIterator[Dict]:
+    """
+    Async variant of assess_many built on assess_injury_async
+    Yields results as they finish with at most `max_concurrency` in flight
+    """
+    max_concurrency = max_concurrency or Config.BATCH_MAX_CONCURRENCY
+    vision_batch_size = vision_batch_size or Config.VISION_BATCH_SIZE
+    stage_limits = {
+        stage: asyncio.Semaphore(limit)
+        for stage, limit in (per_stage_limits or {}).items()
+    }
+    crew = await asyncio.to_thread(get_shared_crew)
+    paths = iter(image_paths)
+    prefetched = []
+    pending = {}
+
+    async def next_item():
+        if not prefetched:
+            chunk = list(itertools.islice(paths, vision_batch_size))
+            prefetched.extend(await asyncio.to_thread(_prefetch_vision, crew, chunk, vision_batch_size))
+        return prefetched.pop(0) if prefetched else None
+
+    def start(image_path, screen, vision_result):
+        context = AssessmentContext(image_path, stage_limits=stage_limits)
+        _seed_vision(context, screen, vision_result)
+        task = asyncio.ensure_future(crew.assess_injury_async(image_path, context=context))
+        pending[task] = image_path
+
+    try:
+        while len(pending) < max_concurrency:
+            item = await next_item()
+            if item is None:
+                break
+            start(*item)
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                image_path = pending.pop(task)
+                yield _batch_item(image_path, task)
+
+                item = await next_item()
+                if item is not None:
+                    start(*item)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _prefetch_vision(crew: MedicalAssessmentCrew, image_paths: List[str],
+                     batch_size: int) -> List[Tuple[str, Optional[Dict], Optional[Dict]]]:
+    """
+    Screen each image once and pair it with its screen and a vision result from
+    one batched Gemini request
+    Only usable photos are batched. Images without a result (batching off,
+    rejected by the screen, or analysis failed) get None and go through the
+    pipeline's own vision stage, which halts on a rejected screen.
+    """
+    if batch_size <= 1 or len(image_paths) <= 1 or crew.vision_handler is None:
+        return [(image_path, None, None) for image_path in image_paths]
+    with ThreadPoolExecutor(max_workers=len(image_paths), thread_name_prefix="prescreen") as executor:
+        screens = list(executor.map(crew.screen_image, image_paths))
+    usable = [i for i, screen in enumerate(screens) if screen is None or screen['usable']]
+
+    results = [None] * len(image_paths)
+    if usable:
+        try:
+            analyzed = crew.vision_handler.analyze_images([image_paths[i] for i in usable], batch_size)
+            for i, result in zip(usable, analyzed):
+                results[i] = result
+        except Exception as e:
+            print(f"⚠️ Batched vision failed, using per-image vision: {e}")
+    return list(zip(image_paths, screens, results))
+
+
+def _iter_prefetched(crew: MedicalAssessmentCrew, paths: Iterator[str],
+                     batch_size: int) -> Iterator[Tuple[str, Optional[Dict], Optional[Dict]]]:
+    """Pull `batch_size` paths at a time, prefetching their vision results together"""
+    while True:
+        chunk = list(itertools.islice(paths, batch_size))
+        if not chunk:
+            return
+        yield from _prefetch_vision(crew, chunk, batch_size)
+
+
+def _seed_vision(context: AssessmentContext, screen: Optional[Dict], vision_result: Optional[Dict]):
+    """Store the batch's screen and vision result so the pipeline skips those stages"""
+    if screen is not None:
+        context.memory['image_screen'] = screen
+        context.seeded.add('image_screen')
+    if vision_result is not None:
+        context.memory['vision_analysis'] = vision_result
+        context.seeded.add('vision_analysis')
+
+
+def _batch_item(image_path: str, future) -> Dict:
+    """Convert a finished future/task into a batch result tagged with its image"""
+    try:
+        result = future.result()
+    except Exception as e:
+        print(f"❌ Assessment failed for {image_path}: {e}")
+        return {"image_path": image_path, "error": str(e), "error_type": type(e).__name__}
+
+    return {"image_path": image_path, **result}
+
+
+# Heavy SDKs deferred in fast-start mode
+HEAVY_MODULES = ("crewai", "google.generativeai", "requests", "aiohttp")
+
+
+def preload_dependencies():
+    """Import the heavy SDKs up front instead of on first use"""
+    import importlib
+    from utils.tts_handler import _load_backends
+
+    for module in HEAVY_MODULES:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+    _load_backends()
+
 
+if not Config.FAST_START:
+    preload_dependencies()
@@ -1,6 +1,7 @@
 """Debug the diagnostic process"""
 from agents.vision_agent import VisionAgentHandler
 from agents.diagnostic_agent import DiagnosticAgentHandler
+from agents.vision_findings import VisionFindings
 import os
 
 # Get test image
@@ -32,7 +33,9 @@ print("...")
 print("\n2️⃣ CONDITION EXTRACTION:")
 print("-"*60)
 diagnostic_handler = DiagnosticAgentHandler()
-conditions = diagnostic_handler._extract_conditions(vision_result['description'])
+findings = VisionFindings.from_result(vision_result)
+print(f"Injury type line: {findings.injury_type or '(missing)'}")
+conditions = diagnostic_handler._extract_conditions(findings)
 print(f"Extracted conditions: {conditions}")
 
 if not conditions or conditions == ["Soft tissue injury"]:
@@ -57,7 +60,7 @@ if len(pubmed_results) == 0:
     print("  - Internet connection issue")
     print("  - PubMed API not responding")
     print("  - Query too specific/vague")
-    print(f"\nQuery used: {diagnostic_handler._create_broad_query(vision_result['description'])}")
+    print(f"\nQuery used: {diagnostic_handler._create_broad_query(findings)}")
 else:
     print("\nTop results:")
     for i, result in enumerate(pubmed_results[:3], 1):
@@ -69,7 +72,7 @@ print("\n4️⃣ DIFFERENTIAL DIAGNOSIS:")
 print("-"*60)
 
 differential = diagnostic_handler.generate_differential_diagnosis(
-    vision_result['description'],
+    findings,
     pubmed_results
 )
 
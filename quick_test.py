@@ -1,4 +1,9 @@
-"""Quick test script to verify POC setup"""
+"""Quick test script to verify POC setup
+
+Run offline against recorded API responses:
+    CASSETTE_MODE=record python quick_test.py   # once, with API keys
+    CASSETTE_MODE=replay python quick_test.py   # no network, deterministic
+"""
 
 import os
 import sys
@@ -0,0 +1,186 @@
+"""
+Headless asyncio HTTP service for medical assessments
+
+    POST /assessments        multipart form with an "image" file -> 202 {"id", "status"}
+    GET  /assessments/{id}   -> {"id", "status", "result" | "error"}
+    GET  /health             -> in-flight count and capacity
+    GET  /metrics            -> Prometheus span, rate-limit and vision index metrics
+
+Usage:
+    python service.py --port 8080
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from aiohttp import web
+from config.config import Config
+from crew_orchestrator import get_shared_crew
+from utils.assessment_context import AssessmentContext
+from utils.image_processor import ImageProcessor
+from utils.rate_limiter import export_prometheus as export_rate_limits
+from utils.tracing import export_prometheus
+from utils.vision_index import export_prometheus as export_vision_index
+
+UPLOAD_DIR = "data/uploads"
+
+
+class AssessmentService:
+    """Bounded in-flight front door to MedicalAssessmentCrew.assess_injury_async"""
+
+    def __init__(self, crew=None, max_in_flight: int = Config.SERVICE_MAX_IN_FLIGHT,
+                 max_stored: int = Config.SERVICE_MAX_STORED_RESULTS):
+        self._crew = crew
+        self.max_in_flight = max_in_flight
+        self.max_stored = max_stored
+        # Only touched from the event loop thread, so no locking is needed
+        self._in_flight = 0
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._tasks = set()
+
+    async def create_assessment(self, request: web.Request) -> web.Response:
+        # Reject before reading the upload so overload costs us nothing
+        if self._in_flight >= self.max_in_flight:
+            return web.json_response(
+                {"error": "Too many assessments in progress, retry later"},
+                status=429,
+                headers={"Retry-After": str(Config.SERVICE_RETRY_AFTER)}
+            )
+
+        self._in_flight += 1
+        image_path = None
+        try:
+            image_path = await self._save_upload(request)
+            is_valid, message = await asyncio.to_thread(ImageProcessor.validate_image, image_path)
+            if not is_valid:
+                raise web.HTTPBadRequest(text=message)
+            crew = self._crew or await asyncio.to_thread(get_shared_crew)
+        except BaseException:
+            self._in_flight -= 1
+            if image_path is not None:
+                _remove_upload(image_path)
+            raise
+
+        job_id = uuid.uuid4().hex[:12]
+        self._jobs[job_id] = {"status": "running", "submitted_at": time.time()}
+        self._evict_finished()
+
+        task = asyncio.create_task(self._run(crew, job_id, image_path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return web.json_response(
+            {"id": job_id, "status": "running"},
+            status=202,
+            headers={"Location": f"/assessments/{job_id}"}
+        )
+
+    async def get_assessment(self, request: web.Request) -> web.Response:
+        job_id = request.match_info["job_id"]
+        job = self._jobs.get(job_id)
+        if job is None:
+            raise web.HTTPNotFound(text=f"Unknown assessment: {job_id}")
+        return web.json_response({"id": job_id, **job}, dumps=_dumps)
+
+    async def health(self, request: web.Request) -> web.Response:
+        return web.json_response({
+            "status": "ok",
+            "in_flight": self._in_flight,
+            "max_in_flight": self.max_in_flight
+        })
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        text = export_prometheus() + export_rate_limits() + export_vision_index()
+        return web.Response(text=text, content_type="text/plain")
+
+    async def _run(self, crew, job_id: str, image_path: str):
+        job = self._jobs[job_id]
+        try:
+            context = AssessmentContext(image_path, request_id=job_id)
+            job["result"] = await crew.assess_injury_async(image_path, context=context)
+            job["status"] = "done"
+        except Exception as e:
+            print(f"❌ Assessment {job_id} failed: {e}")
+            job["status"] = "failed"
+            job["error"] = f"{type(e).__name__}: {e}"
+        finally:
+            job["finished_at"] = time.time()
+            self._in_flight -= 1
+
+    async def _save_upload(self, request: web.Request) -> str:
+        """Stream the "image" multipart field to data/uploads"""
+        if not request.content_type.startswith("multipart/"):
+            raise web.HTTPBadRequest(text="Expected multipart/form-data with an 'image' field")
+
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name != "image":
+                continue
+
+            os.makedirs(UPLOAD_DIR, exist_ok=True)
+            image_path = os.path.join(UPLOAD_DIR, f"injury_{uuid.uuid4().hex}.jpg")
+            size = 0
+            try:
+                with open(image_path, "wb") as f:
+                    while chunk := await part.read_chunk():
+                        size += len(chunk)
+                        if size > Config.MAX_UPLOAD_BYTES:
+                            raise web.HTTPRequestEntityTooLarge(max_size=Config.MAX_UPLOAD_BYTES, actual_size=size)
+                        f.write(chunk)
+            except BaseException:
+                # Oversized, or the client went away mid-upload
+                _remove_upload(image_path)
+                raise
+            return image_path
+
+        raise web.HTTPBadRequest(text="Missing 'image' file field")
+
+    def _evict_finished(self):
+        """Drop the oldest finished assessments beyond max_stored"""
+        excess = len(self._jobs) - self.max_stored
+        if excess <= 0:
+            return
+        for job_id in [j for j, job in self._jobs.items() if job["status"] != "running"][:excess]:
+            del self._jobs[job_id]
+
+
+def _remove_upload(image_path: str):
+    try:
+        os.remove(image_path)
+    except OSError:
+        pass
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=str)
+
+
+def make_app(service: AssessmentService = None) -> web.Application:
+    service = service or AssessmentService()
+    app = web.Application(client_max_size=Config.MAX_UPLOAD_BYTES + 64 * 1024)
+    app.add_routes([
+        web.post("/assessments", service.create_assessment),
+        web.get("/assessments/{job_id}", service.get_assessment),
+        web.get("/health", service.health),
+        web.get("/metrics", service.metrics)
+    ])
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the headless assessment HTTP service")
+    parser.add_argument("--host", default=Config.SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=Config.SERVICE_PORT)
+    parser.add_argument("--max-in-flight", type=int, default=Config.SERVICE_MAX_IN_FLIGHT)
+    args = parser.parse_args()
+
+    service = AssessmentService(max_in_flight=args.max_in_flight)
+    web.run_app(make_app(service), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,7 @@
 import unittest
 import os
-from crew_orchestrator import MedicalAssessmentCrew
+from typing import Callable, Optional
+from crew_orchestrator import MedicalAssessmentCrew, CrewPool
 from utils.image_processor import ImageProcessor
 from agents.vision_agent import VisionAgentHandler
 from agents.diagnostic_agent import DiagnosticAgentHandler
@@ -102,6 +103,24 @@ class TestMedicalAssessor(unittest.TestCase):
         self.assertEqual(result, "Success")
         self.assertEqual(attempt_count[0], 3)
 
+    def test_async_retry_mechanism(self):
+        """Test async retry logic handles failures"""
+        import asyncio
+        from utils.retry_handler import async_retry_with_exponential_backoff
+
+        attempt_count = [0]
+
+        @async_retry_with_exponential_backoff(max_retries=3, base_delay=0.01)
+        async def failing_coroutine():
+            attempt_count[0] += 1
+            if attempt_count[0] < 3:
+                raise Exception("Simulated failure")
+            return "Success"
+
+        result = asyncio.run(failing_coroutine())
+        self.assertEqual(result, "Success")
+        self.assertEqual(attempt_count[0], 3)
+
     def test_confidence_threshold_logic(self):
         """Test confidence threshold triggers human review"""
         from config.config import Config
@@ -117,6 +136,1445 @@ class TestMedicalAssessor(unittest.TestCase):
         self.assertFalse(requires_review)
 
 
+class _FakeCrew:
+    """Stand-in crew for pool tests (no API calls)"""
+
+    def __init__(self):
+        self.healthy = True
+
+    def health_check(self):
+        return self.healthy
+
+
+def _offline_crew(injury_for, vision_delay: float = 0.0) -> MedicalAssessmentCrew:
+    """
+    Crew running the real stage graph with no API calls
+    Vision reports `injury_for(image_path)` after `vision_delay` seconds,
+    PubMed finds nothing and TTS produces no audio
+    """
+    import asyncio
+    import time
+    from unittest import mock
+    from agents.communication_agent import CommunicationAgentHandler
+
+    def analyze(image_path, on_injury_type=None):
+        time.sleep(vision_delay)
+        text = f"INJURY TYPE: {injury_for(image_path)}\nIMAGE QUALITY: 8/10\nCONFIDENCE: 80%"
+        return {"description": text, "image_quality": 8, "confidence": 80}
+
+    async def analyze_async(image_path, on_injury_type=None):
+        return await asyncio.to_thread(analyze, image_path)
+
+    crew = MedicalAssessmentCrew.__new__(MedicalAssessmentCrew)
+    crew.vision_handler = mock.Mock(analyze_image=mock.Mock(side_effect=analyze), analyze_image_async=analyze_async)
+    crew.diagnostic_handler = DiagnosticAgentHandler()
+    crew.diagnostic_handler.search_pass = mock.Mock(return_value=[])
+    crew.diagnostic_handler.search_pass_async = mock.AsyncMock(return_value=[])
+    crew.communication_handler = CommunicationAgentHandler()
+    crew.communication_handler.synthesize_audio = mock.Mock(return_value=None)
+    crew.communication_handler.synthesize_audio_async = mock.AsyncMock(return_value=None)
+    crew.screen_image = lambda image_path, preview=None: None
+    crew.result_cache = None
+    crew._agents = {}
+    crew._last_context = None
+    crew.pipeline = crew._build_pipeline()
+    return crew
+
+
+class TestCrewPool(unittest.TestCase):
+
+    def test_checkout_reuses_crews(self):
+        """Test pool hands back the same warm crew"""
+        pool = CrewPool(size=2, factory=_FakeCrew)
+
+        with pool.crew() as first:
+            pass
+        with pool.crew() as second:
+            pass
+
+        self.assertIs(first, second)
+        metrics = pool.get_metrics()
+        self.assertEqual(metrics['created'], 1)
+        self.assertEqual(metrics['checkouts'], 2)
+        self.assertEqual(metrics['in_use'], 0)
+
+    def test_checkout_times_out_when_exhausted(self):
+        """Test checkout raises when all crews are in use"""
+        pool = CrewPool(size=1, factory=_FakeCrew)
+        crew = pool.checkout()
+
+        with self.assertRaises(TimeoutError):
+            pool.checkout(timeout=0.01)
+
+        pool.checkin(crew)
+        self.assertEqual(pool.get_metrics()['timeouts'], 1)
+
+    def test_unhealthy_crew_is_replaced(self):
+        """Test health check discards broken crews"""
+        pool = CrewPool(size=1, factory=_FakeCrew)
+        crew = pool.checkout()
+        crew.healthy = False
+        pool.checkin(crew)
+
+        replacement = pool.checkout()
+        self.assertIsNot(replacement, crew)
+        self.assertEqual(pool.get_metrics()['discarded'], 1)
+
+
+class TestFastStart(unittest.TestCase):
+
+    def _build_crew(self, fast_start: bool):
+        from contextlib import ExitStack
+        from unittest import mock
+        from config.config import Config
+        import crew_orchestrator
+
+        factories = {name: mock.Mock(return_value=f"{name} agent") for name in ("vision", "diagnostic", "communication")}
+        with ExitStack() as stack:
+            stack.enter_context(mock.patch.object(Config, "FAST_START", fast_start))
+            for name, factory in factories.items():
+                stack.enter_context(mock.patch.object(crew_orchestrator, f"create_{name}_agent", factory))
+            for handler in ("VisionAgentHandler", "DiagnosticAgentHandler", "CommunicationAgentHandler"):
+                stack.enter_context(mock.patch.object(crew_orchestrator, handler))
+            crew = MedicalAssessmentCrew()
+            built = {name: factory.call_count for name, factory in factories.items()}
+            self.assertEqual(crew.vision_agent, "vision agent")
+            self.assertEqual(crew.vision_agent, "vision agent")
+        return built, factories["vision"].call_count
+
+    def test_agents_built_lazily_or_up_front(self):
+        """Test FAST_START defers the agent definitions and FAST_START=false builds them in the constructor"""
+        built, vision_calls = self._build_crew(fast_start=True)
+        self.assertEqual(built, {"vision": 0, "diagnostic": 0, "communication": 0})
+        self.assertEqual(vision_calls, 1)
+
+        built, vision_calls = self._build_crew(fast_start=False)
+        self.assertEqual(built, {"vision": 1, "diagnostic": 1, "communication": 1})
+        self.assertEqual(vision_calls, 1)
+
+
+class TestConcurrentAssessments(unittest.TestCase):
+
+    INJURIES = {"a.jpg": "Contusion", "b.jpg": "Laceration", "c.jpg": "Abrasion", "d.jpg": "Burn"}
+
+    def test_threads_share_one_crew(self):
+        """Test concurrent assessments on one crew each get their own image's result"""
+        from concurrent.futures import ThreadPoolExecutor
+
+        crew = _offline_crew(self.INJURIES.get, vision_delay=0.05)
+        with ThreadPoolExecutor(max_workers=len(self.INJURIES)) as executor:
+            results = dict(zip(self.INJURIES, executor.map(crew.assess_injury, self.INJURIES)))
+
+        for image_path, injury in self.INJURIES.items():
+            self.assertIn(injury, results[image_path]['vision_analysis']['description'])
+            self.assertEqual(results[image_path]['diagnostic_analysis']['primary_diagnosis'], injury)
+        self.assertEqual(len({r['metadata']['request_id'] for r in results.values()}), len(self.INJURIES))
+
+    def test_async_assessments_share_one_crew(self):
+        """Test assessments awaited together on one crew don't mix their stage state"""
+        import asyncio
+
+        crew = _offline_crew(self.INJURIES.get, vision_delay=0.05)
+
+        async def run():
+            return await asyncio.gather(*(crew.assess_injury_async(path) for path in self.INJURIES))
+
+        for (image_path, injury), result in zip(self.INJURIES.items(), asyncio.run(run())):
+            self.assertIn(injury, result['vision_analysis']['description'])
+            self.assertEqual(result['diagnostic_analysis']['primary_diagnosis'], injury)
+
+
+class TestBatchAssessment(unittest.TestCase):
+
+    # The slow photo is submitted first but finishes last; the broken one fails without stopping the batch
+    DELAYS = {"slow.jpg": 0.3, "a.jpg": 0.02, "b.jpg": 0.02, "c.jpg": 0.02, "bad.jpg": 0.0}
+    FINISH_ORDER = ["a.jpg", "b.jpg", "c.jpg", "bad.jpg", "slow.jpg"]
+
+    def _crew(self):
+        import threading
+        import time
+
+        lock = threading.Lock()
+        self.in_flight = self.peak = 0
+
+        def injury_for(image_path):
+            with lock:
+                self.in_flight += 1
+                self.peak = max(self.peak, self.in_flight)
+            time.sleep(self.DELAYS[image_path])
+            with lock:
+                self.in_flight -= 1
+            if image_path == "bad.jpg":
+                raise ValueError("Invalid image file")
+            return "Contusion"
+
+        self.crew = _offline_crew(injury_for)
+        return self.crew
+
+    def _check(self, results):
+        self.assertEqual([r['image_path'] for r in results], self.FINISH_ORDER)
+        self.assertEqual(results[3]['error_type'], "ValueError")
+        self.assertEqual(results[4]['diagnostic_analysis']['primary_diagnosis'], "Contusion")
+        self.assertEqual(self.peak, 2)
+
+    def test_assess_many_yields_as_finished_within_bound(self):
+        """Test assess_many yields in completion order with at most max_concurrency in flight"""
+        from unittest import mock
+        from config.config import Config
+        from crew_orchestrator import assess_many
+
+        pool = CrewPool(size=1, factory=self._crew)
+        with mock.patch("crew_orchestrator.get_crew_pool", return_value=pool), \
+                mock.patch.object(Config, "STAGE_RETRY_POLICIES", {}):
+            results = list(assess_many(self.DELAYS, max_concurrency=2))
+        self._check(results)
+        self.crew.vision_handler.analyze_images.assert_not_called()  # Multi-image prompts are opt-in
+
+    def test_assess_many_async_yields_as_finished_within_bound(self):
+        """Test the async batch keeps the same order and bound"""
+        import asyncio
+        from unittest import mock
+        from config.config import Config
+        from crew_orchestrator import assess_many_async
+
+        async def run():
+            return [result async for result in assess_many_async(self.DELAYS, max_concurrency=2, vision_batch_size=1)]
+
+        with mock.patch("crew_orchestrator.get_shared_crew", return_value=self._crew()), \
+                mock.patch.object(Config, "STAGE_RETRY_POLICIES", {}):
+            results = asyncio.run(run())
+        self._check(results)
+
+
+class TestStageRetry(unittest.TestCase):
+
+    POLICIES = {"vision": {"max_retries": 3, "base_delay": 0}, "communication": {"max_retries": 2, "base_delay": 0}}
+
+    def test_failed_stage_retries_without_repeating_vision(self):
+        """Test a flaky TTS call is retried on its own and the vision call runs once"""
+        from unittest import mock
+        from config.config import Config
+
+        crew = _offline_crew(lambda image_path: "Contusion")
+        crew.communication_handler.synthesize_audio.side_effect = [ConnectionError("TTS down"), "report.mp3"]
+        with mock.patch.object(Config, "STAGE_RETRY_POLICIES", self.POLICIES):
+            result = crew.assess_injury("a.jpg")
+
+        self.assertEqual(result['patient_report']['audio_path'], "report.mp3")
+        self.assertEqual(result['metadata']['stage_attempts']['tts'], 2)
+        self.assertEqual(result['metadata']['stage_attempts']['vision'], 1)
+        self.assertEqual(crew.vision_handler.analyze_image.call_count, 1)
+
+    def test_resume_from_checkpoint(self):
+        """Test a request that exhausted its retries resumes from the unfinished stages"""
+        from unittest import mock
+        from config.config import Config
+        from utils.assessment_context import AssessmentContext
+
+        crew = _offline_crew(lambda image_path: "Contusion")
+        crew.communication_handler.synthesize_audio.side_effect = ConnectionError("TTS down")
+        context = AssessmentContext("a.jpg")
+        with mock.patch.object(Config, "STAGE_RETRY_POLICIES", self.POLICIES):
+            with self.assertRaises(ConnectionError):
+                crew.assess_injury("a.jpg", context=context)
+            self.assertIn('diagnostic_analysis', context.memory)
+
+            crew.communication_handler.synthesize_audio.side_effect = None
+            crew.communication_handler.synthesize_audio.return_value = "report.mp3"
+            result = crew.assess_injury("a.jpg", context=context)
+
+        self.assertEqual(result['patient_report']['audio_path'], "report.mp3")
+        self.assertEqual(result['metadata']['stage_attempts']['tts'], 3)
+        self.assertEqual(crew.vision_handler.analyze_image.call_count, 1)
+        self.assertEqual(crew.diagnostic_handler.search_pass.call_count, 2)  # Broad and narrow, once each
+
+
+class TestTracing(unittest.TestCase):
+
+    def test_spans_recorded_on_trace(self):
+        """Test spans land on the active trace and in the Prometheus export"""
+        from utils.tracing import Trace, span, use_trace, to_json_lines, export_prometheus
+
+        trace = Trace("test-request")
+        with use_trace(trace):
+            with span("test.outer"):
+                with span("test.inner", detail="x") as attrs:
+                    attrs["extra"] = 1
+
+        spans = trace.to_list()
+        self.assertEqual([s['name'] for s in spans], ["test.outer", "test.inner"])
+        self.assertEqual(spans[1]['attributes'], {"detail": "x", "extra": 1})
+        self.assertEqual(len(to_json_lines(spans).splitlines()), 2)
+        self.assertIn('span="test.inner"', export_prometheus())
+
+    def test_span_without_trace_is_noop(self):
+        """Test spans outside an assessment do not fail"""
+        from utils.tracing import span, current_trace
+
+        self.assertIsNone(current_trace())
+        with span("test.orphan"):
+            pass
+
+
+class TestAssessmentResult(unittest.TestCase):
+
+    def _context(self, debug):
+        from utils.assessment_context import AssessmentContext
+
+        context = AssessmentContext("sample.jpg", debug=debug)
+        context.memory['vision_analysis'] = {
+            "description": "INJURY TYPE: Contusion", "image_quality": 8,
+            "confidence": 80, "structured_analysis": "INJURY TYPE: Contusion"
+        }
+        differential = [{"condition": "Contusion", "probability": 100.0, "literature_count": 1}]
+        context.memory['diagnostic_analysis'] = {
+            "differential_diagnosis": differential,
+            "primary_diagnosis": differential[0],
+            "confidence": 85,
+            "pubmed_results": [{
+                "pmid": "1", "title": "Contusion care", "authors": [{"name": "A"}],
+                "source": "J", "pubdate": "2020", "article_type": ["Review"]
+            }],
+            "literature_count": 1
+        }
+        context.memory['patient_report'] = {
+            "summary": "Minor contusion", "severity": "minor", "confidence": 85,
+            "requires_professional_review": False, "audio_path": None
+        }
+        return context
+
+    def test_compact_result_drops_duplicates(self):
+        """Test compact result omits crew memory and author lists"""
+        import json
+        from utils.assessment_result import AssessmentResult
+
+        result = AssessmentResult.from_context(self._context(debug=False)).to_dict()
+        diagnostic = result['diagnostic_analysis']
+
+        self.assertNotIn('crew_memory', result['metadata'])
+        self.assertNotIn('authors', diagnostic['pubmed_results'][0])
+        self.assertEqual(diagnostic['primary_diagnosis'], "Contusion")
+        self.assertEqual(json.dumps(result).count('"probability"'), 1)
+        self.assertEqual(result['metadata']['confidence'], 85)
+
+    def test_debug_result_expands_memory(self):
+        """Test debug expansion keeps the full stage memory"""
+        from utils.assessment_result import AssessmentResult
+
+        context = self._context(debug=True)
+        result = AssessmentResult.from_context(context, debug=True).to_dict()
+        self.assertEqual(result['metadata']['crew_memory'], context.memory)
+
+        # Later work on the same context (a resumed request) leaves the returned result alone
+        context.memory['patient_report'] = {"summary": "someone else"}
+        self.assertNotEqual(result['metadata']['crew_memory']['patient_report'], {"summary": "someone else"})
+
+    def test_pooled_crew_debug_context_is_a_copy(self):
+        """Test the debug view of a pooled crew's last assessment can't reach into that request"""
+        from utils.assessment_context import AssessmentContext
+
+        crew = MedicalAssessmentCrew.__new__(MedicalAssessmentCrew)
+        first = crew._prepare_context("first.jpg", None, deadline=0)
+        first.memory['vision_analysis'] = {"description": "contusion"}
+
+        snapshot = crew.get_crew_context()
+        snapshot['vision_analysis'] = {"description": "changed"}
+        crew._prepare_context("second.jpg", AssessmentContext("second.jpg"), deadline=0)
+
+        self.assertEqual(first.memory['vision_analysis'], {"description": "contusion"})
+        self.assertEqual(crew.get_crew_context(), {})
+
+
+class TestResultCache(unittest.TestCase):
+
+    def test_hit_after_miss(self):
+        """Test completed results are served from cache as copies"""
+        from utils.result_cache import ResultCache
+
+        cache = ResultCache(max_entries=2, ttl_seconds=60)
+        first, source = cache.get_or_compute("k", lambda: {"metadata": {"n": 1}})
+        self.assertEqual(source, "miss")
+
+        second, source = cache.get_or_compute("k", lambda: self.fail("should not recompute"))
+        self.assertEqual(source, "hit")
+        self.assertEqual(second, first)
+        self.assertIsNot(second, first)
+
+    def test_concurrent_requests_coalesce(self):
+        """Test identical in-flight requests share one computation"""
+        import threading
+        import time
+        from utils.result_cache import ResultCache
+
+        cache = ResultCache(max_entries=2, ttl_seconds=60)
+        calls = [0]
+        sources = []
+
+        def compute():
+            calls[0] += 1
+            time.sleep(0.05)
+            return {"value": 1}
+
+        def worker():
+            sources.append(cache.get_or_compute("k", compute)[1])
+
+        threads = [threading.Thread(target=worker) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(calls[0], 1)
+        self.assertEqual(sorted(sources), ["coalesced"] * 3 + ["miss"])
+
+    def test_batch_seeded_requests_use_cache(self):
+        """Test batch items seeded with a prefetched vision result keep the cache; resumed requests skip it"""
+        import tempfile
+        from PIL import Image
+        from crew_orchestrator import _seed_vision
+        from utils.assessment_context import AssessmentContext
+        from utils.result_cache import ResultCache
+
+        crew = MedicalAssessmentCrew.__new__(MedicalAssessmentCrew)
+        crew.result_cache = ResultCache(max_entries=2, ttl_seconds=60)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "img.jpg")
+            Image.new("RGB", (64, 64), (180, 120, 100)).save(path)
+
+            seeded = AssessmentContext(path)
+            _seed_vision(seeded, {"usable": True}, {"description": "contusion"})
+            self.assertIsNotNone(crew._cache_key(seeded))
+
+            resumed = AssessmentContext(path)
+            resumed.memory['vision_analysis'] = {"description": "contusion"}
+            self.assertIsNone(crew._cache_key(resumed))
+
+    def test_key_and_prescreen_share_one_reduced_decode(self):
+        """Test a request decodes a downscaled copy once for both the cache key and the pre-screen"""
+        import tempfile
+        from unittest import mock
+        from PIL import Image
+        from config.config import Config
+        from utils.assessment_context import AssessmentContext
+        from utils.result_cache import ResultCache, image_content_hash
+
+        crew = _offline_crew(lambda image_path: "Contusion")
+        del crew.screen_image  # The real pre-screen
+        crew.result_cache = ResultCache(max_entries=2, ttl_seconds=60)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = [os.path.join(tmp_dir, f"{name}.jpg") for name in ("large", "other")]
+            Image.new("RGB", (4000, 3000), (180, 120, 100)).save(paths[0])
+            Image.new("RGB", (4000, 3000), (170, 120, 100)).save(paths[1])
+
+            preview = ImageProcessor.load_preview(paths[0])
+            self.assertLessEqual(max(preview.size), Config.QUALITY_SCREEN_SIZE)
+            self.assertEqual(preview.info["original_size"], (4000, 3000))
+            self.assertEqual(image_content_hash(paths[0]), image_content_hash(paths[0], preview))
+            self.assertNotEqual(image_content_hash(paths[0]), image_content_hash(paths[1]))
+
+            context = AssessmentContext(paths[0])
+            with mock.patch.object(Config, "QUALITY_SCREEN_ENABLED", True), \
+                    mock.patch("PIL.Image.open", wraps=Image.open) as opened:
+                result = crew.assess_injury(paths[0], context=context)
+
+        self.assertEqual(opened.call_count, 1)
+        self.assertIn("too blurry", result["image_screen"]["reasons"])  # A flat colour, screened from the preview
+        self.assertIsNone(context.preview)
+
+    def test_lru_eviction_and_errors_not_cached(self):
+        """Test bounded size and that failures are not stored"""
+        from utils.result_cache import ResultCache
+
+        cache = ResultCache(max_entries=1, ttl_seconds=60)
+        cache.get_or_compute("a", lambda: {"v": "a"})
+        cache.get_or_compute("b", lambda: {"v": "b"})
+        self.assertEqual(cache.get_stats()['entries'], 1)
+        self.assertEqual(cache.get_stats()['evictions'], 1)
+
+        def failing():
+            raise RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            cache.get_or_compute("c", failing)
+        self.assertEqual(cache.get_or_compute("c", lambda: {"v": "c"})[1], "miss")
+
+
+class TestUploadEncoding(unittest.TestCase):
+
+    def test_payload_fits_byte_budget(self):
+        """Test the upload is resized, encoded once and kept under the byte budget"""
+        import io
+        import numpy as np
+        from PIL import Image
+
+        noisy = Image.fromarray(np.random.default_rng(0).integers(0, 255, (1200, 1600, 3)).astype(np.uint8))
+        payload = ImageProcessor.encode_for_upload(noisy, max_dimension=1024, image_format="JPEG",
+                                                   quality=85, max_bytes=150 * 1024)
+
+        self.assertEqual(payload["mime_type"], "image/jpeg")
+        self.assertLessEqual(len(payload["data"]), 150 * 1024)
+        self.assertLessEqual(max(Image.open(io.BytesIO(payload["data"])).size), 1024)
+
+        webp = ImageProcessor.encode_for_upload(Image.new("RGB", (300, 200)), image_format="webp")
+        self.assertEqual(webp["mime_type"], "image/webp")
+        with self.assertRaises(ValueError):
+            ImageProcessor.encode_for_upload(noisy, image_format="GIF")
+
+
+class TestQualityScreen(unittest.TestCase):
+
+    def test_rejects_blurry_and_dark_photos(self):
+        """Test the local screen passes a sharp photo and names what is wrong with bad ones"""
+        import tempfile
+        import numpy as np
+        from PIL import Image, ImageEnhance, ImageFilter
+
+        texture = np.random.default_rng(0).integers(60, 200, (600, 800, 3)).astype(np.uint8)
+        sharp = Image.fromarray(texture).filter(ImageFilter.GaussianBlur(1))
+        photos = {
+            "sharp": sharp,
+            "blurry": sharp.filter(ImageFilter.GaussianBlur(12)),
+            "dark": ImageEnhance.Brightness(sharp).enhance(0.05)
+        }
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            screens = {}
+            for name, photo in photos.items():
+                path = os.path.join(tmp_dir, f"{name}.jpg")
+                photo.save(path, quality=90)
+                screens[name] = ImageProcessor.screen_quality(path)
+
+        self.assertTrue(screens["sharp"]["usable"], screens["sharp"])
+        self.assertIn("too blurry", screens["blurry"]["reasons"])
+        self.assertIn("too dark", screens["dark"]["reasons"])
+        self.assertIn("sharpness", screens["sharp"]["scores"])
+
+    def test_batch_screens_each_photo_once(self):
+        """Test assess_many screens before batching, sends only usable photos and never re-screens"""
+        from unittest import mock
+        from config.config import Config
+        from crew_orchestrator import _prefetch_vision, _seed_vision
+        from utils.assessment_context import AssessmentContext
+
+        screens = {
+            "good.jpg": {"usable": True, "reasons": [], "scores": {"sharpness": 9.0}},
+            "dark.jpg": {"usable": False, "reasons": ["too dark"], "scores": {"sharpness": 9.0}}
+        }
+        vision = {"description": "1. INJURY TYPE: Contusion", "image_quality": 8, "confidence": 85}
+
+        crew = MedicalAssessmentCrew.__new__(MedicalAssessmentCrew)
+        crew.vision_handler = mock.Mock()
+        crew.vision_handler.analyze_images.return_value = [vision]
+        crew.pipeline = crew._build_pipeline()
+
+        def screen(image_path, preview=None):
+            return screens[image_path]
+
+        with mock.patch.object(Config, "QUALITY_SCREEN_ENABLED", True), \
+                mock.patch.object(ImageProcessor, "screen_quality", side_effect=screen) as screen_quality:
+            items = _prefetch_vision(crew, ["good.jpg", "dark.jpg"], batch_size=2)
+            crew.vision_handler.analyze_images.assert_called_once_with(["good.jpg"], 2)
+            self.assertEqual(items[0], ("good.jpg", screens["good.jpg"], vision))
+            self.assertEqual(items[1], ("dark.jpg", screens["dark.jpg"], None))
+
+            # The rejected photo halts at the vision stage without a second screen or a Gemini call
+            context = AssessmentContext("dark.jpg", deadline=0)
+            _seed_vision(context, *items[1][1:])
+            result = crew._run_pipeline(context)
+
+        self.assertEqual(screen_quality.call_count, 2)
+        self.assertIn("too dark", result["error"])
+        crew.vision_handler.analyze_image.assert_not_called()
+
+
+class TestVisionFindings(unittest.TestCase):
+
+    def test_parse_structured_response(self):
+        """Test the vision response is parsed once and consumed by the downstream stages"""
+        from unittest import mock
+        from config.config import Config
+        from agents.communication_agent import CommunicationAgentHandler
+        from agents.vision_findings import VisionFindings
+
+        text = """**1. INJURY TYPE:** Contusion (bruise) with mild swelling
+**2. VISIBLE FEATURES:**
+   * **Color/discoloration:** purple-blue
+   * **Open wound:** No
+**3. SEVERITY ASSESSMENT:** Severe - large area over the joint
+**4. IMAGE QUALITY:** 6/10 - slightly blurry
+**5. CONFIDENCE:** 80% - typical appearance"""
+        findings = VisionFindings.parse(text)
+
+        self.assertEqual(findings.conditions, ["contusion", "bruise"])
+        self.assertEqual(findings.features["color/discoloration"], "purple-blue")
+        self.assertFalse(findings.feature_says_yes("open wound"))
+        self.assertEqual((findings.severity, findings.image_quality, findings.confidence), ("severe", 6, 80))
+        self.assertTrue(findings.complete)
+        self.assertEqual(VisionFindings.from_dict(findings.to_dict()), findings)
+        self.assertFalse(VisionFindings.parse("An acute injury.").complete)
+        self.assertEqual(VisionFindings.parse("An acute injury.").conditions, ["injury"])
+
+        diagnostic = DiagnosticAgentHandler()
+        self.assertTrue(diagnostic.build_query(findings).startswith("(contusion OR bruise)"))
+        differential = diagnostic.generate_differential_diagnosis(findings, [])
+        self.assertEqual(differential["primary_diagnosis"]["condition"], "Contusion")
+
+        # The vision model's severity assessment raises the report severity only when enabled
+        communication = CommunicationAgentHandler()
+        report = {**differential, "confidence": 80}
+        self.assertEqual(communication.build_summary(report, findings)["severity"], "minor")
+        with mock.patch.object(Config, "REPORT_SEVERITY_FROM_VISION", True):
+            self.assertEqual(communication.build_summary(report, findings)["severity"], "serious")
+
+    def test_injury_terms_match_whole_words(self):
+        """Test injury terms don't match inside longer words but plurals still count"""
+        from agents.vision_findings import VisionFindings
+
+        self.assertEqual(VisionFindings.parse("INJURY TYPE: Cutaneous rash with burning sensation").conditions, [])
+        self.assertEqual(VisionFindings.parse("INJURY TYPE: Superficial cuts and scratches").conditions, ["cut", "scratch"])
+        self.assertEqual(VisionFindings.parse("Several burns on the forearm").conditions, ["burn"])
+
+
+class _FakeGemini:
+    """Stand-in Gemini model: `respond(parts, **kwargs)` answers each call, which is recorded"""
+
+    def __init__(self, respond: Callable):
+        self.respond = respond
+        self.requests = []
+
+    def generate_content(self, parts, **kwargs):
+        self.requests.append((parts, kwargs))
+        return self.respond(parts, **kwargs)
+
+
+def _offline_vision_handler(tmp_dir: str, model: Optional[_FakeGemini] = None, **kwargs) -> VisionAgentHandler:
+    """VisionAgentHandler built without an API key, answering from `model`"""
+    from utils.cassette import use_cassette
+
+    use_cassette("replay", tmp_dir)  # Replay mode skips the API key check
+    try:
+        handler = VisionAgentHandler(**kwargs)
+    finally:
+        use_cassette("off")
+    if model is not None:
+        handler.model = model
+    return handler
+
+
+class TestVisionBatch(unittest.TestCase):
+
+    def test_unparsed_sections_fall_back_to_single_calls(self):
+        """Test a batched response is split per image and only the broken section is retried"""
+        import tempfile
+        from unittest import mock
+        from PIL import Image
+        from benchmarks.stub_servers import vision_text
+        from config.config import Config
+
+        def respond(parts):
+            if len(parts) > 2:
+                # Section 2 lost its fields, section 3 is missing entirely
+                return mock.Mock(text=f"=== IMAGE 1 ===\n{vision_text('contusion')}\n=== IMAGE 2 ===\nUnclear photo")
+            return mock.Mock(text=vision_text("laceration"))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i in range(3):
+                paths.append(os.path.join(tmp_dir, f"img_{i}.jpg"))
+                Image.new("RGB", (300, 300), (40 * i, 80, 120)).save(paths[-1])
+
+            handler = _offline_vision_handler(tmp_dir, _FakeGemini(respond))
+            with mock.patch.object(Config, "VISION_INDEX_ENABLED", False):
+                results = handler.analyze_images(paths, batch_size=3)
+
+        self.assertEqual(len(handler.model.requests), 3)
+        self.assertIn("Contusion", results[0]['description'])
+        self.assertIn("Laceration", results[1]['description'])
+        self.assertIn("Laceration", results[2]['description'])
+        self.assertEqual(results[0]['confidence'], 85)
+
+
+class TestVisionOutputMode(unittest.TestCase):
+
+    def test_json_mode_requests_schema_and_reports_usage(self):
+        """Test JSON mode sends the response schema and token cap, and reports generation stats"""
+        import json
+        import tempfile
+        from unittest import mock
+        from PIL import Image
+        from benchmarks.stub_servers import vision_json
+        from config.config import Config
+
+        def respond(parts, generation_config=None):
+            if generation_config["response_schema"]["type"] == "ARRAY":
+                # The second object is cut off, so that image is retried alone
+                text = json.dumps([vision_json("abrasion"), {"injury_type": "Burn"}])
+            else:
+                text = json.dumps(vision_json("hematoma"))
+            usage = mock.Mock(prompt_token_count=1290, candidates_token_count=len(text) // 4)
+            return mock.Mock(text=text, usage_metadata=usage)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            paths = []
+            for i in range(2):
+                paths.append(os.path.join(tmp_dir, f"img_{i}.jpg"))
+                Image.new("RGB", (300, 300), (40 * i, 80, 120)).save(paths[-1])
+
+            handler = _offline_vision_handler(tmp_dir, _FakeGemini(respond), output_mode="json")
+            prose_id = _offline_vision_handler(tmp_dir, output_mode="prose").analyzer_id
+            with mock.patch.object(Config, "VISION_INDEX_ENABLED", False):
+                single = handler.analyze_image(paths[0])
+                batch = handler.analyze_images(paths, batch_size=2)
+
+        self.assertNotEqual(handler.analyzer_id, prose_id)
+        configs = [kwargs["generation_config"] for parts, kwargs in handler.model.requests]
+        config = configs[0]
+        self.assertEqual(config["response_mime_type"], "application/json")
+        self.assertEqual(config["max_output_tokens"], Config.VISION_JSON_MAX_OUTPUT_TOKENS)
+
+        self.assertIn("INJURY TYPE: Hematoma", single["description"])
+        self.assertEqual((single["confidence"], single["image_quality"]), (85, 8))
+        self.assertEqual(single["generation"]["mode"], "json")
+        self.assertEqual(single["generation"]["prompt_tokens"], 1290)
+        self.assertGreater(single["generation"]["output_tokens"], 0)
+
+        self.assertEqual(len(configs), 3)
+        self.assertEqual(batch[0]["findings"]["conditions"], ["abrasion"])
+        self.assertEqual(batch[0]["generation"]["batch_size"], 2)
+        self.assertEqual(batch[1]["findings"]["conditions"], ["hematoma"])
+        with self.assertRaises(ValueError):
+            VisionAgentHandler(output_mode="xml")
+
+
+class TestStreamingPrefetch(unittest.TestCase):
+
+    def test_injury_type_reported_while_streaming(self):
+        """Test the streamed INJURY TYPE line is reported before the rest of the answer arrives"""
+        import tempfile
+        from unittest import mock
+        from PIL import Image
+        from benchmarks.stub_servers import vision_text
+        from config.config import Config
+
+        events = []
+        text = vision_text("laceration")
+
+        def respond(parts, stream=False):
+            for i in range(0, len(text), 40):
+                events.append("chunk")
+                yield mock.Mock(text=text[i:i + 40])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "img.jpg")
+            Image.new("RGB", (300, 300), (180, 120, 100)).save(path)
+            handler = _offline_vision_handler(tmp_dir, _FakeGemini(respond), output_mode="prose")
+            with mock.patch.object(Config, "VISION_INDEX_ENABLED", False):
+                result = handler.analyze_image(path, on_injury_type=lambda f: events.append(f.conditions))
+
+        self.assertEqual(events.count(["laceration"]), 1)
+        self.assertLess(events.index(["laceration"]), len(events) - 2)
+        self.assertEqual(result["description"], text)
+        self.assertIsNotNone(result["generation"]["injury_type_ms"])
+
+    def test_pubmed_stages_reuse_matching_prefetch(self):
+        """Test the PubMed stages take the early search only when the final query matches"""
+        from unittest import mock
+        from agents.vision_findings import VisionFindings
+        from config.config import Config
+        from utils.assessment_context import AssessmentContext
+
+        crew = MedicalAssessmentCrew.__new__(MedicalAssessmentCrew)
+        crew.diagnostic_handler = DiagnosticAgentHandler()
+        searched = []
+
+        def search_pass(query, max_results, timeout=None):
+            searched.append(query)
+            return [{"title": query}]
+
+        early = VisionFindings.parse("1. INJURY TYPE: Laceration\n")
+        with mock.patch.object(Config, "VISION_STREAMING", True), \
+                mock.patch.object(crew.diagnostic_handler, "search_pass", side_effect=search_pass):
+            context = AssessmentContext("sample.jpg", deadline=0)
+            crew._literature_prefetcher(context)(early)
+            query = crew.diagnostic_handler.build_query(early)
+            broad = crew._stage_pubmed_broad(context, {'pubmed_query': query})['broad_results']
+            narrow = crew._stage_pubmed_narrow(context, {'pubmed_query': query})['narrow_results']
+
+            self.assertEqual(broad, [{"title": query}])
+            self.assertEqual(narrow, [{"title": crew.diagnostic_handler.narrow_query(query)}])
+            self.assertEqual(len(searched), 2)
+
+            # The final findings named another injury: the stage searches its own query
+            context = AssessmentContext("sample.jpg", deadline=0)
+            crew._literature_prefetcher(context)(early)
+            other = crew.diagnostic_handler.build_query(VisionFindings.parse("1. INJURY TYPE: Contusion\n"))
+            broad = crew._stage_pubmed_broad(context, {'pubmed_query': other})['broad_results']
+            self.assertEqual(broad, [{"title": other}])
+
+    def _halting_crew(self):
+        """Crew whose vision streams an injury type, then rates the photo too poor to assess"""
+        from unittest import mock
+        from agents.vision_findings import VisionFindings
+
+        text = "1. INJURY TYPE: Laceration\n\n4. IMAGE QUALITY: 3 - blurry\n\n5. CONFIDENCE: 40%"
+
+        def analyze(image_path, on_injury_type=None):
+            on_injury_type(VisionFindings.parse(text.split("\n")[0]))
+            return {"description": text, "image_quality": 3, "confidence": 40}
+
+        async def analyze_async(image_path, on_injury_type=None):
+            return analyze(image_path, on_injury_type)
+
+        crew = MedicalAssessmentCrew.__new__(MedicalAssessmentCrew)
+        crew.vision_handler = mock.Mock(analyze_image=analyze, analyze_image_async=analyze_async)
+        crew.diagnostic_handler = DiagnosticAgentHandler()
+        crew.pipeline = crew._build_pipeline()
+        return crew
+
+    def test_halted_pipeline_cancels_prefetch(self):
+        """Test a photo rejected after the injury type streamed in cancels the early searches"""
+        import asyncio
+        from concurrent.futures import Future
+        from unittest import mock
+        from config.config import Config
+        from utils.assessment_context import AssessmentContext
+
+        crew = self._halting_crew()
+        submitted = []
+
+        def submit(func, *args):
+            submitted.append(Future())  # Queued behind busy workers: never started
+            return submitted[-1]
+
+        with mock.patch.object(Config, "VISION_STREAMING", True), \
+                mock.patch.object(Config, "QUALITY_SCREEN_ENABLED", False), \
+                mock.patch("crew_orchestrator._get_prefetch_executor", return_value=mock.Mock(submit=submit)):
+            context = AssessmentContext("sample.jpg", deadline=0)
+            result = crew._run_pipeline(context)
+
+            self.assertIn("Image quality too low", result["error"])
+            self.assertEqual(len(submitted), 2)
+            self.assertTrue(all(future.cancelled() for future in submitted))
+            self.assertEqual(context.prefetch, {})
+
+            # Async path: the search tasks are cancelled, not left running
+            searches = []
+
+            async def search_pass_async(query, max_results, timeout=None):
+                searches.append(asyncio.current_task())
+                await asyncio.sleep(10)
+
+            async def run():
+                context = AssessmentContext("sample.jpg", deadline=0)
+                result = await crew._run_pipeline_async(context)
+                await asyncio.sleep(0)
+                return context, result
+
+            with mock.patch.object(crew.diagnostic_handler, "search_pass_async", side_effect=search_pass_async):
+                context, result = asyncio.run(run())
+
+        self.assertIn("Image quality too low", result["error"])
+        self.assertEqual(len(searches), 2)
+        self.assertTrue(all(task.cancelled() for task in searches))
+        self.assertEqual(context.prefetch, {})
+
+
+class TestVisionCascade(unittest.TestCase):
+
+    def _handler(self, tmp_dir, answers, calls):
+        """Cascade handler whose tiers answer with `answers` (model name -> confidence or exception)"""
+        from unittest import mock
+        from benchmarks.stub_servers import vision_text
+
+        def tier(name):
+            def respond(parts):
+                calls.append(name)
+                if isinstance(answers[name], Exception):
+                    raise answers[name]
+                usage = mock.Mock(prompt_token_count=1000, candidates_token_count=200)
+                return mock.Mock(text=vision_text("contusion", answers[name]), usage_metadata=usage)
+            return _FakeGemini(respond)
+
+        handler = _offline_vision_handler(tmp_dir, output_mode="prose")
+        handler.model = tier(handler.model_name)
+        handler.tier_models = {name: tier(name) for name in handler.tiers if name != handler.model_name}
+        return handler
+
+    def test_escalates_only_on_low_confidence(self):
+        """Test the fast model answers when confident and the next tier is asked otherwise"""
+        import tempfile
+        from unittest import mock
+        from PIL import Image
+        from config.config import Config
+
+        with tempfile.TemporaryDirectory() as tmp_dir, \
+                mock.patch.object(Config, "VISION_CASCADE", True), \
+                mock.patch.object(Config, "VISION_CASCADE_MODELS", ["gemini-2.5-flash-lite", "gemini-2.5-flash"]), \
+                mock.patch.object(Config, "VISION_CASCADE_MIN_CONFIDENCE", 70), \
+                mock.patch.object(Config, "VISION_INDEX_ENABLED", False):
+            path = os.path.join(tmp_dir, "img.jpg")
+            Image.new("RGB", (300, 300), (180, 120, 100)).save(path)
+
+            calls = []
+            handler = self._handler(tmp_dir, {"gemini-2.5-flash-lite": 90, "gemini-2.5-flash": 85}, calls)
+            generation = handler.analyze_image(path)["generation"]
+            self.assertEqual(calls, ["gemini-2.5-flash-lite"])
+            self.assertEqual((generation["model"], generation["tier"], generation["escalated"]),
+                             ("gemini-2.5-flash-lite", 0, False))
+            self.assertAlmostEqual(generation["cost_usd"], (1000 * 0.10 + 200 * 0.40) / 1_000_000)
+
+            calls = []
+            handler = self._handler(tmp_dir, {"gemini-2.5-flash-lite": 55, "gemini-2.5-flash": 85}, calls)
+            result = handler.analyze_image(path)
+            generation = result["generation"]
+            self.assertEqual(calls, ["gemini-2.5-flash-lite", "gemini-2.5-flash"])
+            self.assertEqual(result["confidence"], 85)
+            self.assertEqual((generation["model"], generation["tier"], generation["escalated"]),
+                             ("gemini-2.5-flash", 1, True))
+            self.assertEqual([tier["confidence"] for tier in generation["tiers"]], [55, 85])
+            self.assertAlmostEqual(generation["total_cost_usd"],
+                                   sum(tier["cost_usd"] for tier in generation["tiers"]))
+
+            # A failed escalation keeps the fast model's answer
+            calls = []
+            handler = self._handler(tmp_dir, {"gemini-2.5-flash-lite": 55,
+                                              "gemini-2.5-flash": RuntimeError("overloaded")}, calls)
+            result = handler.analyze_image(path)
+            self.assertEqual(result["confidence"], 55)
+            self.assertEqual(result["generation"]["model"], "gemini-2.5-flash-lite")
+
+
+class TestVisionIndex(unittest.TestCase):
+
+    def test_near_duplicates_reuse_analysis(self):
+        """Test a recompressed, slightly cropped photo matches and the index persists"""
+        import io
+        import tempfile
+        import numpy as np
+        from PIL import Image
+        from utils.vision_index import VisionIndex, dhash
+
+        rng = np.random.default_rng(0)
+        pixels = np.kron(rng.integers(0, 255, (12, 16, 3)), np.ones((40, 40, 1))).astype(np.uint8)
+        original = Image.fromarray(pixels)
+        buffer = io.BytesIO()
+        original.crop((6, 6, 634, 474)).save(buffer, "JPEG", quality=60)
+        retaken = Image.open(io.BytesIO(buffer.getvalue()))
+        other = Image.fromarray(np.kron(rng.integers(0, 255, (12, 16, 3)), np.ones((40, 40, 1))).astype(np.uint8))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "index.json")
+            index = VisionIndex(path, max_distance=6)
+            index.add(dhash(original), "model-a", {"description": "contusion", "confidence": 80})
+
+            analysis, distance = index.lookup(dhash(retaken), "model-a")
+            self.assertEqual(analysis["description"], "contusion")
+            self.assertLessEqual(distance, 6)
+            self.assertIsNone(index.lookup(dhash(other), "model-a"))
+            self.assertIsNone(index.lookup(dhash(original), "model-b"))
+            self.assertAlmostEqual(index.get_stats()["hit_rate"], 1 / 3)
+
+            reloaded = VisionIndex(path, max_distance=6)
+            self.assertIsNotNone(reloaded.lookup(dhash(original), "model-a"))
+
+    def test_inserts_written_together(self):
+        """Test inserts soon after a save wait for the next write instead of rewriting the file"""
+        import json
+        import tempfile
+        from utils.vision_index import VisionIndex
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, "index.json")
+            index = VisionIndex(path, save_interval=60)
+            index.add(1, "model-a", {"description": "first"})
+            index.add(2, "model-a", {"description": "second"})
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)["entries"]), 1)
+
+            index.flush()
+            with open(path) as f:
+                self.assertEqual(len(json.load(f)["entries"]), 2)
+
+    def test_reuse_is_opt_in_and_reported(self):
+        """Test a reused analysis says so in the result metadata"""
+        import tempfile
+        from unittest import mock
+        from PIL import Image
+        from config.config import Config
+        from utils.assessment_context import AssessmentContext
+        from utils.assessment_result import AssessmentResult
+        from utils.vision_index import VisionIndex, dhash
+
+        img = Image.new("RGB", (64, 48), (180, 120, 100))
+        handler = VisionAgentHandler.__new__(VisionAgentHandler)
+        handler.analyzer_id = "model-a"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index = VisionIndex(os.path.join(tmp_dir, "index.json"))
+            index.add(dhash(img), "model-a", {"description": "contusion", "image_quality": 8, "confidence": 80})
+            with mock.patch.object(Config, "VISION_INDEX_ENABLED", True), \
+                    mock.patch("agents.vision_agent.get_vision_index", return_value=index):
+                _, analysis = handler._find_near_duplicate(img)
+
+        self.assertEqual(analysis["reused"], "reused analysis from near-duplicate (distance 0)")
+        context = AssessmentContext("sample.jpg", deadline=0)
+        context.memory.update(vision_analysis=analysis, diagnostic_analysis={}, patient_report={})
+        metadata = AssessmentResult.from_context(context).to_dict()["metadata"]
+        self.assertEqual(metadata["vision_reuse"], analysis["reused"])
+
+
+class TestLatencyBudget(unittest.TestCase):
+
+    def test_deadline_tracks_budget_and_degradations(self):
+        """Test the context reports remaining budget and records shortcuts"""
+        import math
+        from utils.assessment_context import AssessmentContext
+
+        self.assertEqual(AssessmentContext("sample.jpg", deadline=0).remaining(), math.inf)
+
+        context = AssessmentContext("sample.jpg", deadline=0.01)
+        self.assertFalse(context.can_afford('pubmed_narrow'))
+        context.degrade('pubmed_narrow', 'skipped')
+        self.assertEqual(context.degradations[0]['action'], 'skipped')
+
+    def test_degraded_results_not_cached(self):
+        """Test results rejected by store_if reach the caller but are not stored"""
+        from utils.result_cache import ResultCache
+
+        cache = ResultCache(max_entries=4, ttl_seconds=60)
+        complete = lambda result: not result['degraded']
+        self.assertEqual(cache.get_or_compute("a", lambda: {"degraded": True}, store_if=complete)[1], "miss")
+        self.assertEqual(cache.get_or_compute("a", lambda: {"degraded": False}, store_if=complete)[1], "miss")
+        self.assertEqual(cache.get_or_compute("a", lambda: {"degraded": False}, store_if=complete)[1], "hit")
+
+
+    def test_fast_tts_never_calls_elevenlabs(self):
+        """Test the fast_tts degradation goes straight to gTTS and a failed ElevenLabs call is not repeated"""
+        import asyncio
+        import tempfile
+        from contextlib import ExitStack
+        from unittest import mock
+        from config.config import Config
+        import utils.tts_handler as tts_handler
+        from utils.tts_handler import TTSHandler
+
+        elevenlabs = mock.Mock()
+        elevenlabs.return_value.text_to_speech.convert.side_effect = ConnectionError("ElevenLabs down")
+        gtts = mock.Mock()
+        with tempfile.TemporaryDirectory() as tmp_dir, ExitStack() as stack:
+            stack.enter_context(mock.patch.object(Config, "ELEVENLABS_API_KEY", "key"))
+            stack.enter_context(mock.patch.object(Config, "AUDIO_DIR", tmp_dir))
+            for name, value in {"_backends_loaded": True, "ELEVENLABS_AVAILABLE": True, "ELEVENLABS_V2": True,
+                                "ELEVENLABS_ASYNC": False, "GTTS_AVAILABLE": True, "gTTS": gtts,
+                                "ElevenLabs": elevenlabs, "VoiceSettings": mock.Mock()}.items():
+                stack.enter_context(mock.patch.object(tts_handler, name, value, create=True))
+
+            TTSHandler.generate_with_emotion("Minor bruise", "minor", fast=True)
+            asyncio.run(TTSHandler.generate_with_emotion_async("Minor bruise", "minor", fast=True))
+            self.assertEqual(elevenlabs.return_value.text_to_speech.convert.call_count, 0)
+            self.assertEqual(gtts.call_count, 2)
+
+            TTSHandler.generate_with_emotion("Minor bruise", "minor")
+            self.assertEqual(elevenlabs.return_value.text_to_speech.convert.call_count, 1)
+            self.assertEqual(gtts.call_count, 3)
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_token_bucket_spaces_calls(self):
+        """Test calls beyond the burst wait for tokens and the wait is measured"""
+        import time
+        from utils.rate_limiter import RateLimiter
+
+        limiter = RateLimiter("test", rate=20, burst=1)
+        start = time.perf_counter()
+        for _ in range(3):
+            with limiter.acquire():
+                pass
+
+        self.assertGreaterEqual(time.perf_counter() - start, 0.09)
+        metrics = limiter.get_metrics()
+        self.assertEqual(metrics["acquired"], 3)
+        self.assertEqual(metrics["throttled"], 2)
+
+    def test_concurrency_cap_shared_with_async(self):
+        """Test async callers respect the same concurrency cap"""
+        import asyncio
+        from utils.rate_limiter import RateLimiter
+
+        limiter = RateLimiter("test", max_concurrency=2)
+        active = []
+
+        async def call():
+            async with limiter.acquire_async():
+                active.append(1)
+                peak = len(active)
+                await asyncio.sleep(0.02)
+                active.pop()
+                return peak
+
+        async def run():
+            return await asyncio.gather(*(call() for _ in range(6)))
+
+        self.assertEqual(max(asyncio.run(run())), 2)
+
+
+class TestCassette(unittest.TestCase):
+
+    def test_record_then_replay(self):
+        """Test recorded responses replay without the live call"""
+        import tempfile
+        from utils.cassette import Cassette, CassetteMiss
+
+        with tempfile.TemporaryDirectory() as cassette_dir:
+            recorder = Cassette("record", cassette_dir)
+            self.assertEqual(recorder.call("ncbi", {"term": "wound"}, lambda: {"ids": ["1"]}), {"ids": ["1"]})
+            self.assertEqual(recorder.call("tts", {"text": "hi"}, lambda: b"ID3", binary=True), b"ID3")
+
+            def offline():
+                raise AssertionError("live call during replay")
+
+            player = Cassette("replay", cassette_dir, latency={"ncbi": 0.01})
+            self.assertEqual(player.call("ncbi", lambda: {"term": "wound"}, offline), {"ids": ["1"]})
+            self.assertEqual(player.call("tts", {"text": "hi"}, offline, binary=True), b"ID3")
+            with self.assertRaises(CassetteMiss):
+                player.call("ncbi", {"term": "other"}, offline)
+            self.assertEqual(player.get_stats()["replayed"], 2)
+
+
+class TestStubServers(unittest.TestCase):
+
+    def test_stub_endpoints_match_provider_formats(self):
+        """Test the stand-ins answer in the formats the handlers parse"""
+        import json
+        import urllib.error
+        import urllib.request
+        from benchmarks.stub_servers import StubServers, StubSettings
+        from agents.diagnostic_agent import DiagnosticAgentHandler
+
+        handler = DiagnosticAgentHandler()
+        with StubServers(StubSettings(error_rate={"tts": 1.0})) as servers:
+            pubmed = servers.environment()["PUBMED_BASE_URL"]
+            with urllib.request.urlopen(f"{pubmed}esearch.fcgi?db=pubmed&term=wound&retmax=3") as response:
+                article_ids = handler._parse_article_ids(json.load(response))
+            with urllib.request.urlopen(f"{pubmed}esummary.fcgi?id={','.join(article_ids)}") as response:
+                summaries = handler._parse_summaries(article_ids, json.load(response))
+
+            request = urllib.request.Request(
+                f"{servers.base_url}/v1beta/models/gemini-2.5-flash:generateContent",
+                data=b'{"contents": []}', method="POST"
+            )
+            with urllib.request.urlopen(request) as response:
+                text = json.load(response)["candidates"][0]["content"]["parts"][0]["text"]
+
+            tts = urllib.request.Request(f"{servers.base_url}/v1/text-to-speech/voice", data=b"{}", method="POST")
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(tts)
+
+        self.assertEqual(len(summaries), 3)
+        self.assertIn("IMAGE QUALITY: 8", text)
+        self.assertEqual(servers.settings.errors["tts"], 1)
+
+
+class TestLoadTest(unittest.TestCase):
+
+    def test_report_classifies_outcomes(self):
+        """Test the load report separates rejections from errors and diffs releases"""
+        from benchmarks.load_test import build_report, compare_reports, run_closed_loop
+
+        images = [{"path": f"img_{i}.jpg", "format": "JPEG", "resolution": "800x600"} for i in range(3)]
+
+        def assess(path):
+            if path == "img_1.jpg":
+                return {"error": "Image quality too low"}
+            if path == "img_2.jpg":
+                raise TimeoutError("vision timed out")
+            return {"metadata": {}}
+
+        records = run_closed_loop(images, total=6, concurrency=2, assess=assess)
+        report = build_report(records, wall_s=2.0, settings={})
+
+        self.assertEqual(report["requests"], 6)
+        self.assertEqual(report["rejected"], 2)
+        self.assertEqual(report["errors"], {"TimeoutError": 2})
+        self.assertAlmostEqual(report["error_rate"], 2 / 6, places=3)
+        self.assertEqual(report["throughput_per_s"], 2.0)
+        self.assertEqual(report["latency_ms"]["count"], 4)
+
+        previous = dict(report, throughput_per_s=1.0)
+        self.assertEqual(compare_reports(previous, report)["throughput_per_s"]["change"], 1.0)
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from utils.job_queue import JobQueue
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue = JobQueue(os.path.join(self.tmp_dir.name, "jobs.sqlite3"))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_submit_claim_complete(self):
+        """Test a job flows from queued to done with its result"""
+        job_id = self.queue.submit("sample.jpg")
+        self.assertEqual(self.queue.status(job_id)['status'], "queued")
+
+        self.assertEqual(self.queue.claim("worker-1"), (job_id, "sample.jpg"))
+        self.assertIsNone(self.queue.claim("worker-2"))
+
+        self.assertTrue(self.queue.complete(job_id, "worker-1", {"metadata": {"confidence": 80}}))
+        self.assertEqual(self.queue.status(job_id)['status'], "done")
+        self.assertEqual(self.queue.result(job_id, timeout=0)['metadata']['confidence'], 80)
+
+    def test_failed_and_pending_jobs(self):
+        """Test failures raise and pending jobs time out"""
+        failed_id = self.queue.submit("bad.jpg")
+        self.queue.claim("worker-1")
+        self.assertTrue(self.queue.fail(failed_id, "worker-1", "ValueError: Invalid image file"))
+        with self.assertRaises(RuntimeError):
+            self.queue.result(failed_id, timeout=0)
+
+        pending_id = self.queue.submit("sample.jpg")
+        with self.assertRaises(TimeoutError):
+            self.queue.result(pending_id, timeout=0)
+
+    def test_expired_lease_is_reclaimed(self):
+        """Test a job from a dead worker is handed to another worker"""
+        from unittest import mock
+        from config.config import Config
+
+        job_id = self.queue.submit("sample.jpg")
+        with mock.patch.object(Config, 'JOB_LEASE_SECONDS', -1):
+            self.queue.claim("dead-worker")
+
+        self.assertEqual(self.queue.claim("worker-2"), (job_id, "sample.jpg"))
+        self.assertEqual(self.queue.status(job_id)['attempts'], 2)
+
+    def test_stale_worker_cannot_overwrite_reclaimed_job(self):
+        """Test a worker whose lease expired can't finish a job another worker now holds"""
+        from unittest import mock
+        from config.config import Config
+
+        job_id = self.queue.submit("sample.jpg")
+        with mock.patch.object(Config, 'JOB_LEASE_SECONDS', -1):
+            self.queue.claim("slow-worker")
+        self.queue.claim("worker-2")
+
+        self.assertFalse(self.queue.heartbeat(job_id, "slow-worker"))
+        self.assertFalse(self.queue.fail(job_id, "slow-worker", "TimeoutError: too slow"))
+        self.assertFalse(self.queue.complete(job_id, "slow-worker", {"metadata": {"confidence": 10}}))
+        self.assertEqual(self.queue.status(job_id)['status'], "running")
+
+        self.assertTrue(self.queue.complete(job_id, "worker-2", {"metadata": {"confidence": 80}}))
+        self.assertFalse(self.queue.complete(job_id, "worker-2", {"metadata": {"confidence": 10}}))
+        self.assertEqual(self.queue.result(job_id, timeout=0)['metadata']['confidence'], 80)
+
+
+class TestAssessmentService(unittest.TestCase):
+
+    def setUp(self):
+        import tempfile
+        from unittest import mock
+        import service
+
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.upload_dir = os.path.join(self.tmp_dir.name, "uploads")
+        patcher = mock.patch.object(service, "UPLOAD_DIR", self.upload_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.tmp_dir.cleanup)
+
+    def _photo(self, size=(400, 300)) -> bytes:
+        import io
+        from PIL import Image
+
+        buffer = io.BytesIO()
+        Image.new("RGB", size, (180, 120, 110)).save(buffer, format="JPEG")
+        return buffer.getvalue()
+
+    def _call(self, crew, requests, max_in_flight=4):
+        """Run `requests(client)` against a test server in front of `crew`"""
+        import asyncio
+        from aiohttp.test_utils import TestClient, TestServer
+        from service import AssessmentService, make_app
+
+        async def run():
+            async with TestClient(TestServer(make_app(AssessmentService(crew, max_in_flight=max_in_flight)))) as client:
+                return await requests(client)
+
+        return asyncio.run(run())
+
+    def _post(self, client, data: bytes):
+        import aiohttp
+
+        form = aiohttp.FormData()
+        form.add_field("image", data, filename="injury.jpg", content_type="image/jpeg")
+        return client.post("/assessments", data=form)
+
+    def test_post_then_get_result(self):
+        """Test an accepted upload is assessed and its result served by id"""
+        import asyncio
+
+        class Crew:
+            async def assess_injury_async(self, image_path, context=None):
+                return {"metadata": {"confidence": 80}, "image": os.path.basename(image_path)}
+
+        async def requests(client):
+            response = await self._post(client, self._photo())
+            self.assertEqual(response.status, 202)
+            job_id = (await response.json())["id"]
+            self.assertEqual(response.headers["Location"], f"/assessments/{job_id}")
+
+            for _ in range(50):
+                job = await (await client.get(f"/assessments/{job_id}")).json()
+                if job["status"] != "running":
+                    break
+                await asyncio.sleep(0.01)
+            missing = await client.get("/assessments/unknown")
+            return job, missing.status
+
+        job, missing_status = self._call(Crew(), requests)
+
+        self.assertEqual(job["status"], "done")
+        self.assertEqual(job["result"]["metadata"]["confidence"], 80)
+        self.assertEqual(missing_status, 404)
+
+    def test_overload_returns_429_with_retry_after(self):
+        """Test requests beyond max_in_flight are turned away with Retry-After"""
+        import asyncio
+        from config.config import Config
+
+        release = asyncio.Event()
+
+        class Crew:
+            async def assess_injury_async(self, image_path, context=None):
+                await release.wait()
+                return {}
+
+        async def requests(client):
+            first = await self._post(client, self._photo())
+            second = await self._post(client, self._photo())
+            release.set()
+            return first.status, second.status, second.headers.get("Retry-After")
+
+        first, second, retry_after = self._call(Crew(), requests, max_in_flight=1)
+
+        self.assertEqual(first, 202)
+        self.assertEqual(second, 429)
+        self.assertEqual(retry_after, str(Config.SERVICE_RETRY_AFTER))
+
+    def test_rejected_uploads_are_removed(self):
+        """Test oversized and invalid uploads get 413/400 and leave no file behind"""
+        from unittest import mock
+        from config.config import Config
+
+        class Crew:
+            async def assess_injury_async(self, image_path, context=None):
+                raise AssertionError("rejected uploads must not be assessed")
+
+        async def requests(client):
+            invalid = await self._post(client, b"not an image")
+            tiny = await self._post(client, self._photo(size=(50, 50)))
+            with mock.patch.object(Config, "MAX_UPLOAD_BYTES", 1024):
+                oversized = await self._post(client, self._photo(size=(800, 600)) + os.urandom(4096))
+            missing = await client.post("/assessments", data={"note": "no image"})
+            return invalid.status, tiny.status, oversized.status, missing.status
+
+        statuses = self._call(Crew(), requests)
+
+        self.assertEqual(statuses, (400, 400, 413, 400))
+        self.assertEqual(os.listdir(self.upload_dir), [])
+
+
+class TestStageGraph(unittest.TestCase):
+
+    def _graph(self, log):
+        import time
+        from utils.stage_graph import Stage, StageGraph
+
+        def step(name, output, delay=0.0):
+            def run(context, inputs):
+                time.sleep(delay)
+                log.append(name)
+                return {output: name}
+            return run
+
+        return StageGraph([
+            Stage('a', step('a', 'x'), outputs=['x']),
+            Stage('slow', step('slow', 'y', delay=0.2), inputs=['x'], outputs=['y']),
+            Stage('fast', step('fast', 'z', delay=0.05), inputs=['x'], outputs=['z']),
+            Stage('join', step('join', 'out'), inputs=['y', 'z'], outputs=['out'])
+        ])
+
+    def test_independent_stages_overlap(self):
+        """Test sibling stages run concurrently and the critical path follows the slow branch"""
+        import time
+        from utils.assessment_context import AssessmentContext
+
+        log = []
+        graph = self._graph(log)
+        context = AssessmentContext("sample.jpg")
+        start = time.perf_counter()
+        self.assertIsNone(graph.run(context))
+
+        self.assertLess(time.perf_counter() - start, 0.24)
+        self.assertEqual(context.memory['out'], 'join')
+        self.assertEqual(graph.critical_path(context.stage_timings)['stages'], ['a', 'slow', 'join'])
+
+        # Checkpointed outputs are not recomputed
+        log.clear()
+        graph.run(context)
+        self.assertEqual(log, [])
+
+    def test_retries_stop_when_the_deadline_is_near(self):
+        """Test a failing stage is not retried once the backoff would outlast the deadline"""
+        import asyncio
+        import time
+        from unittest import mock
+        from config.config import Config
+        from utils.assessment_context import AssessmentContext
+        from utils.stage_graph import Stage, StageGraph
+
+        def flaky(context, inputs):
+            raise ConnectionError("provider unavailable")
+
+        async def flaky_async(context, inputs):
+            flaky(context, inputs)
+
+        graph = StageGraph([Stage('call', flaky, outputs=['x'], group='vision', async_func=flaky_async)])
+        policies = {"vision": {"max_retries": 5, "base_delay": 0.3}}
+        with mock.patch.object(Config, "STAGE_RETRY_POLICIES", policies):
+            for run in (graph.run, lambda context: asyncio.run(graph.run_async(context))):
+                # 0.3s backoff fits in the 0.5s budget, the following 0.6s one does not
+                context = AssessmentContext("sample.jpg", deadline=0.5)
+                start = time.perf_counter()
+                with self.assertRaises(ConnectionError):
+                    run(context)
+                self.assertEqual(context.stage_attempts['call'], 2)
+                self.assertLess(time.perf_counter() - start, 0.5)
+
+    def test_halt_and_invalid_graphs(self):
+        """Test a halting stage ends the run and bad graphs are rejected"""
+        from utils.assessment_context import AssessmentContext
+        from utils.stage_graph import Stage, StageGraph, HaltPipeline
+
+        def gate(context, inputs):
+            raise HaltPipeline({"error": "stop"})
+
+        graph = StageGraph([Stage('gate', gate, outputs=['x'])])
+        self.assertEqual(graph.run(AssessmentContext("sample.jpg")), {"error": "stop"})
+
+        with self.assertRaises(ValueError):
+            StageGraph([Stage('a', gate, inputs=['missing'], outputs=['x'])])
+        with self.assertRaises(ValueError):
+            StageGraph([
+                Stage('a', gate, inputs=['y'], outputs=['x']),
+                Stage('b', gate, inputs=['x'], outputs=['y'])
+            ])
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,87 @@
+import math
+import time
+import uuid
+from contextlib import nullcontext
+from typing import Dict, List, Optional
+from config.config import Config
+from utils.tracing import Trace
+
+
+class AssessmentContext:
+    """
+    Per-request state for a single assessment
+    Each request gets its own context, so a shared crew never mixes patients
+    """
+
+    def __init__(self, image_path: str, request_id: Optional[str] = None,
+                 stage_limits: Optional[Dict] = None, debug: Optional[bool] = None,
+                 deadline: Optional[float] = None):
+        self.request_id = request_id or uuid.uuid4().hex[:12]
+        self.image_path = image_path
+        self.started_at = time.time()
+
+        # Expand the result with full stage memory
+        self.debug = Config.DEBUG_RESULTS if debug is None else debug
+
+        # Downscaled photo decoded for the cache key, handed on to the pre-screen
+        self.preview = None
+
+        # Stage outputs for this request only (doubles as the checkpoint store)
+        self.memory: Dict = {}
+        # Memory keys filled in before the run (batch prefetch), as opposed to checkpoints of an earlier run
+        self.seeded: set = set()
+
+        # Timing spans for this request
+        self.trace = Trace(self.request_id)
+
+        # Semaphores shared across a batch, keyed by stage name
+        self.stage_limits = stage_limits or {}
+
+        # Attempts made per stage (retries included)
+        self.stage_attempts: Dict[str, int] = {}
+
+        # (start, end) offsets in seconds per stage, used for the critical path
+        self.stage_timings: Dict[str, tuple] = {}
+
+        # Latency budget and the shortcuts taken to meet it
+        self.deadline: Optional[float] = None
+        self.set_deadline(Config.ASSESSMENT_DEADLINE if deadline is None else deadline)
+        self.degradations: List[Dict] = []
+
+        # Work started ahead of its stage: {"query": ..., output name: future or task}
+        # (PubMed passes begun on the streamed injury type, see MedicalAssessmentCrew)
+        self.prefetch: Dict = {}
+
+    def set_deadline(self, seconds: Optional[float]):
+        """Give the request `seconds` from now to finish (0 or None removes the deadline)"""
+        self.deadline = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> float:
+        """Seconds left before the deadline (infinite when there is none)"""
+        if self.deadline is None:
+            return math.inf
+        return self.deadline - time.monotonic()
+
+    def can_afford(self, step: str) -> bool:
+        """Whether enough budget remains for an optional step (see Config.DEADLINE_RESERVES)"""
+        return self.remaining() >= Config.DEADLINE_RESERVES.get(step, 0)
+
+    def degrade(self, stage: str, action: str):
+        """Record a shortcut taken because the deadline is close"""
+        remaining = self.remaining()
+        print(f"⏳ {stage}: {action} ({remaining:.1f}s left)")
+        self.degradations.append({"stage": stage, "action": action, "remaining_s": round(remaining, 2)})
+
+    def record_attempt(self, stage: str):
+        self.stage_attempts[stage] = self.stage_attempts.get(stage, 0) + 1
+
+    def stage_slot(self, stage: Optional[str]):
+        """
+        Return the concurrency limiter for a stage group, or a no-op context
+        Works with `with` (threading semaphores) and `async with` (asyncio)
+        """
+        return self.stage_limits.get(stage) or nullcontext()
+
+    def elapsed(self) -> float:
+        """Seconds since the assessment started"""
+        return time.time() - self.started_at
@@ -0,0 +1,180 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+
+@dataclass(slots=True)
+class LiteratureRef:
+    """PubMed article reference (author lists are kept only in debug output)"""
+    pmid: str
+    title: str
+    source: str
+    pubdate: str
+    article_type: List[str]
+
+    @classmethod
+    def from_pubmed(cls, record: Dict) -> "LiteratureRef":
+        return cls(
+            pmid=record.get("pmid", ""),
+            title=record.get("title", ""),
+            source=record.get("source", ""),
+            pubdate=record.get("pubdate", ""),
+            article_type=list(record.get("article_type", []))
+        )
+
+    def to_dict(self) -> Dict:
+        return {
+            "pmid": self.pmid,
+            "title": self.title,
+            "source": self.source,
+            "pubdate": self.pubdate,
+            "article_type": self.article_type
+        }
+
+
+@dataclass(slots=True)
+class DifferentialEntry:
+    condition: str
+    probability: float
+    literature_count: int
+
+    def to_dict(self) -> Dict:
+        return {
+            "condition": self.condition,
+            "probability": self.probability,
+            "literature_count": self.literature_count
+        }
+
+
+@dataclass(slots=True)
+class VisionSummary:
+    description: str
+    image_quality: int
+    confidence: int
+
+    def to_dict(self) -> Dict:
+        return {
+            "description": self.description,
+            "image_quality": self.image_quality,
+            "confidence": self.confidence
+        }
+
+
+@dataclass(slots=True)
+class DiagnosticSummary:
+    differential: List[DifferentialEntry]
+    confidence: float
+    literature: List[LiteratureRef]
+
+    def to_dict(self) -> Dict:
+        differential = [entry.to_dict() for entry in self.differential]
+        return {
+            "differential_diagnosis": differential,
+            # Name only: the entry itself is differential_diagnosis[0]
+            "primary_diagnosis": differential[0]["condition"] if differential else None,
+            "confidence": self.confidence,
+            "pubmed_results": [ref.to_dict() for ref in self.literature],
+            "literature_count": len(self.literature)
+        }
+
+
+@dataclass(slots=True)
+class PatientReport:
+    summary: str
+    detailed: str
+    medical_details: str
+    severity: str
+    confidence: float
+    requires_professional_review: bool
+    audio_path: Optional[str]
+
+    def to_dict(self) -> Dict:
+        return {
+            "summary": self.summary,
+            "detailed": self.detailed,
+            "medical_details": self.medical_details,
+            "severity": self.severity,
+            "confidence": self.confidence,
+            "requires_professional_review": self.requires_professional_review,
+            "audio_path": self.audio_path
+        }
+
+
+@dataclass(slots=True)
+class AssessmentResult:
+    """
+    Compact assessment result
+    Each stage output appears once; the full stage memory is only included
+    when debug expansion is requested
+    """
+    request_id: str
+    vision: VisionSummary
+    diagnostic: DiagnosticSummary
+    report: PatientReport
+    stage_attempts: Dict[str, int] = field(default_factory=dict)
+    degradations: List[Dict] = field(default_factory=list)
+    image_screen: Optional[Dict] = None
+    vision_reuse: Optional[str] = None  # Set when a near-duplicate photo's analysis was reused
+    vision_generation: Optional[Dict] = None  # Model tier, output mode, latency, tokens and cost of the Gemini call(s)
+    debug_memory: Optional[Dict] = None
+
+    @classmethod
+    def from_context(cls, context, debug: bool = False) -> "AssessmentResult":
+        """Build the result from the stage checkpoints on an AssessmentContext"""
+        vision = context.memory["vision_analysis"]
+        diagnostic = context.memory["diagnostic_analysis"]
+        report = context.memory["patient_report"]
+
+        return cls(
+            request_id=context.request_id,
+            vision=VisionSummary(
+                description=vision["description"],
+                image_quality=vision["image_quality"],
+                confidence=vision["confidence"]
+            ),
+            diagnostic=DiagnosticSummary(
+                differential=[
+                    DifferentialEntry(c["condition"], c["probability"], c["literature_count"])
+                    for c in diagnostic.get("differential_diagnosis", [])
+                ],
+                confidence=diagnostic.get("confidence", 0),
+                literature=[LiteratureRef.from_pubmed(r) for r in diagnostic.get("pubmed_results", [])]
+            ),
+            report=PatientReport(
+                summary=report.get("summary", ""),
+                detailed=report.get("detailed", ""),
+                medical_details=report.get("medical_details", ""),
+                severity=report.get("severity", "uncertain"),
+                confidence=report.get("confidence", 0),
+                requires_professional_review=report.get("requires_professional_review", True),
+                audio_path=report.get("audio_path")
+            ),
+            stage_attempts=dict(context.stage_attempts),
+            degradations=list(context.degradations),
+            image_screen=context.memory.get("image_screen"),
+            vision_reuse=vision.get("reused"),
+            vision_generation=vision.get("generation"),
+            # A snapshot, so resuming or reusing the context never changes a returned result
+            debug_memory=dict(context.memory) if debug else None
+        )
+
+    def to_dict(self) -> Dict:
+        """Serialize to the dict layout used by the app and CLI scripts"""
+        result = {
+            "vision_analysis": self.vision.to_dict(),
+            "diagnostic_analysis": self.diagnostic.to_dict(),
+            "patient_report": self.report.to_dict(),
+            "metadata": {
+                "request_id": self.request_id,
+                "confidence": self.diagnostic.confidence,
+                "requires_professional_review": self.report.requires_professional_review,
+                "image_quality": self.vision.image_quality,
+                "stage_attempts": self.stage_attempts,
+                "degradations": self.degradations,
+                "image_screen": self.image_screen,
+                "vision_reuse": self.vision_reuse,
+                "vision_generation": self.vision_generation
+            }
+        }
+        if self.debug_memory is not None:
+            result["metadata"]["crew_memory"] = self.debug_memory
+        return result
@@ -0,0 +1,158 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, Union
+from config.config import Config
+
+# Cassette modes
+OFF = "off"
+RECORD = "record"
+REPLAY = "replay"
+
+
+class CassetteMiss(LookupError):
+    """Replay mode found no recording for a request"""
+
+
+class Cassette:
+    """
+    Record/replay store for external calls (Gemini text, PubMed JSON, TTS audio)
+    Recordings are keyed by a hash of the request, so replays are deterministic.
+    Replay sleeps for the configured per-provider latency to simulate the network.
+    """
+
+    def __init__(self, mode: str = OFF, directory: str = "data/cassettes",
+                 latency: Optional[Dict[str, float]] = None):
+        if mode not in (OFF, RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.mode = mode
+        self.directory = directory
+        self.latency = latency or {}
+        self._lock = threading.Lock()
+        self._stats = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != OFF
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == REPLAY
+
+    def call(self, provider: str, request: Union[Any, Callable[[], Any]], live: Callable[[], Any],
+             binary: bool = False) -> Any:
+        """
+        Return the recorded response for `request`, or call `live` (recording it in record mode)
+        `request` may be a callable so its fingerprint is only built when cassettes are on.
+        None responses (failed calls) are never recorded.
+        """
+        if not self.enabled:
+            return live()
+
+        path = self._path(provider, request, binary)
+        if self.replaying:
+            response = self._load(path, provider, binary)
+            delay = self.latency.get(provider, 0)
+            if delay > 0:
+                time.sleep(delay)
+            return response
+
+        response = live()
+        self._save(path, response, binary)
+        return response
+
+    async def call_async(self, provider: str, request: Union[Any, Callable[[], Any]],
+                         live: Callable[[], Awaitable[Any]], binary: bool = False) -> Any:
+        """Async variant of call"""
+        if not self.enabled:
+            return await live()
+
+        path = self._path(provider, request, binary)
+        if self.replaying:
+            response = self._load(path, provider, binary)
+            delay = self.latency.get(provider, 0)
+            if delay > 0:
+                await asyncio.sleep(delay)
+            return response
+
+        response = await live()
+        self._save(path, response, binary)
+        return response
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["mode"] = self.mode
+        return stats
+
+    def _path(self, provider: str, request, binary: bool) -> str:
+        if callable(request):
+            request = request()
+        fingerprint = json.dumps(request, sort_keys=True, default=str)
+        key = hashlib.sha256(fingerprint.encode()).hexdigest()[:32]
+        return os.path.join(self.directory, provider, key + (".bin" if binary else ".json"))
+
+    def _load(self, path: str, provider: str, binary: bool) -> Any:
+        try:
+            if binary:
+                with open(path, "rb") as f:
+                    response = f.read()
+            else:
+                with open(path) as f:
+                    response = json.load(f)["response"]
+        except FileNotFoundError:
+            self._count("misses")
+            raise CassetteMiss(f"No {provider} recording at {path} (run with CASSETTE_MODE=record first)")
+
+        self._count("replayed")
+        return response
+
+    def _save(self, path: str, response: Any, binary: bool):
+        if response is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write then rename so concurrent recorders never leave a partial file
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        if binary:
+            with open(tmp_path, "wb") as f:
+                f.write(response)
+        else:
+            with open(tmp_path, "w") as f:
+                json.dump({"recorded_at": time.time(), "response": response}, f)
+        os.replace(tmp_path, path)
+        self._count("recorded")
+
+    def _count(self, stat: str):
+        with self._lock:
+            self._stats[stat] += 1
+
+
+_cassette = None
+_cassette_lock = threading.Lock()
+
+
+def get_cassette() -> Cassette:
+    """Return the process-wide cassette configured from Config"""
+    global _cassette
+    if _cassette is None:
+        with _cassette_lock:
+            if _cassette is None:
+                _cassette = Cassette(Config.CASSETTE_MODE, Config.CASSETTE_DIR, Config.CASSETTE_LATENCY)
+    return _cassette
+
+
+def use_cassette(mode: str, directory: Optional[str] = None,
+                 latency: Optional[Dict[str, float]] = None) -> Cassette:
+    """Replace the process-wide cassette (benchmarks and tests)"""
+    global _cassette
+    with _cassette_lock:
+        _cassette = Cassette(
+            mode,
+            directory or Config.CASSETTE_DIR,
+            Config.CASSETTE_LATENCY if latency is None else latency
+        )
+    return _cassette
@@ -1,7 +1,12 @@
 from PIL import Image
 import io
 import os
-from typing import Tuple
+import time
+import numpy as np
+from typing import Dict, Optional, Tuple
+from config.config import Config
+
+UPLOAD_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp"}
 
 class ImageProcessor:
     """Handle image preprocessing and validation"""
@@ -69,3 +74,118 @@ class ImageProcessor:
             "file_size": os.path.getsize(image_path)
         }
 
+    @staticmethod
+    def encode_for_upload(img: Image.Image, max_dimension: int = Config.VISION_UPLOAD_MAX_DIMENSION,
+                          image_format: str = Config.VISION_UPLOAD_FORMAT,
+                          quality: int = Config.VISION_UPLOAD_QUALITY,
+                          max_bytes: Optional[int] = Config.VISION_UPLOAD_MAX_BYTES) -> Dict:
+        """
+        Encode an image once for the vision API
+        Lowers quality (down to VISION_UPLOAD_MIN_QUALITY), then resolution, until the
+        payload fits `max_bytes`. Returns {"mime_type", "data"} as the Gemini SDK expects.
+        """
+        image_format = image_format.upper()
+        if image_format not in UPLOAD_MIME_TYPES:
+            raise ValueError(f"Unsupported upload format: {image_format}")
+
+        if img.mode != 'RGB':
+            img = img.convert('RGB')
+        if max(img.size) > max_dimension:
+            img = img.copy()
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+
+        min_quality = min(quality, Config.VISION_UPLOAD_MIN_QUALITY)
+        while True:
+            for attempt_quality in range(quality, min_quality - 1, -10):
+                buffer = io.BytesIO()
+                img.save(buffer, image_format, quality=attempt_quality)
+                data = buffer.getvalue()
+                if not max_bytes or len(data) <= max_bytes:
+                    return {"mime_type": UPLOAD_MIME_TYPES[image_format], "data": data}
+
+            # Still over budget at the lowest quality: shrink and try again
+            if max(img.size) <= 256:
+                return {"mime_type": UPLOAD_MIME_TYPES[image_format], "data": data}
+            img = img.resize((int(img.size[0] * 0.75), int(img.size[1] * 0.75)), Image.Resampling.LANCZOS)
+
+    @staticmethod
+    def load_preview(image_path: str, size: int = Config.QUALITY_SCREEN_SIZE) -> Image.Image:
+        """
+        Downscaled RGB copy of a photo, decoded once per request (cache key and pre-screen)
+        JPEGs decode straight to a reduced size, so a 24 MP photo costs milliseconds.
+        The full resolution is kept in `preview.info["original_size"]`
+        """
+        with Image.open(image_path) as img:
+            original_size = img.size
+            img.draft('RGB', (size, size))
+            preview = img.convert('RGB')
+        preview.thumbnail((size, size))
+        preview.info["original_size"] = original_size
+        return preview
+
+    @staticmethod
+    def screen_quality(image_path: str, size: int = Config.QUALITY_SCREEN_SIZE,
+                       preview: Optional[Image.Image] = None) -> Dict:
+        """
+        Local blur, exposure and noise estimate on a downscaled grayscale copy
+        Runs in milliseconds so unusable photos never reach the vision API.
+        `preview` (from load_preview) saves decoding the file again.
+        Returns {"usable", "reasons", "scores", "duration_ms"}; thresholds live in Config.QUALITY_*
+        """
+        start = time.perf_counter()
+        if preview is not None:
+            gray = preview.convert('L')
+        else:
+            with Image.open(image_path) as img:
+                img.draft('L', (size, size))  # JPEGs decode straight to a reduced size
+                gray = img.convert('L')
+        gray.thumbnail((size, size))
+        pixels = np.asarray(gray, dtype=np.float32)
+
+        scores = {
+            "sharpness": _sharpness(pixels),
+            "brightness": float(pixels.mean()),
+            "clipped": float(np.mean((pixels <= 5) | (pixels >= 250))),
+            "noise": _noise_sigma(pixels)
+        }
+
+        reasons = []
+        if scores["sharpness"] < Config.QUALITY_MIN_SHARPNESS:
+            reasons.append("too blurry")
+        if scores["brightness"] < Config.QUALITY_MIN_BRIGHTNESS:
+            reasons.append("too dark")
+        elif scores["brightness"] > Config.QUALITY_MAX_BRIGHTNESS:
+            reasons.append("overexposed")
+        if scores["clipped"] > Config.QUALITY_MAX_CLIPPED:
+            reasons.append("too much pure black or white")
+        if scores["noise"] > Config.QUALITY_MAX_NOISE:
+            reasons.append("too noisy")
+
+        return {
+            "usable": not reasons,
+            "reasons": reasons,
+            "scores": {name: round(value, 3) for name, value in scores.items()},
+            "duration_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+
+
+def _sharpness(pixels: np.ndarray, grid: int = 8) -> float:
+    """
+    Laplacian variance of the sharpest tile
+    Whole-image variance is dominated by smooth skin; a photo is usable if the injury region is in focus
+    """
+    laplacian = (pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+                 - 4 * pixels[1:-1, 1:-1])
+    grid = max(1, min(grid, min(laplacian.shape) // 8))
+    rows, cols = laplacian.shape[0] // grid, laplacian.shape[1] // grid
+    tiles = laplacian[:rows * grid, :cols * grid].reshape(grid, rows, grid, cols)
+    return float(tiles.var(axis=(1, 3)).max())
+
+
+def _noise_sigma(pixels: np.ndarray) -> float:
+    """Gaussian noise estimate (Immerkaer's method): edges cancel out in this 3x3 kernel"""
+    center = pixels[1:-1, 1:-1]
+    corners = pixels[:-2, :-2] + pixels[:-2, 2:] + pixels[2:, :-2] + pixels[2:, 2:]
+    edges = pixels[:-2, 1:-1] + pixels[2:, 1:-1] + pixels[1:-1, :-2] + pixels[1:-1, 2:]
+    response = np.abs(corners - 2 * edges + 4 * center)
+    return float(np.sqrt(np.pi / 2) * response.mean() / 6)
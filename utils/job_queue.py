@@ -0,0 +1,177 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from config.config import Config
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    image_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    worker TEXT,
+    submitted_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_expires REAL,
+    result TEXT,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, submitted_at);
+"""
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Durable local job broker backed by SQLite
+    Jobs survive app and worker restarts; a job whose worker died is picked up
+    again once its lease expires
+    """
+
+    def __init__(self, db_path: str = Config.JOB_QUEUE_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        """Short-lived autocommit connection (safe across threads and processes)"""
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+        finally:
+            conn.close()
+
+    def submit(self, image_path: str) -> str:
+        """Enqueue an image for assessment and return the job id"""
+        job_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, image_path, status, submitted_at) VALUES (?, ?, ?, ?)",
+                (job_id, image_path, QUEUED, time.time())
+            )
+        return job_id
+
+    def status(self, job_id: str) -> Optional[Dict]:
+        """Return job state (without the result payload), or None if unknown"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, image_path, status, attempts, worker, submitted_at, started_at,"
+                " finished_at, error FROM jobs WHERE id = ?",
+                (job_id,)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def result(self, job_id: str, timeout: Optional[float] = None,
+               poll_interval: float = Config.JOB_POLL_INTERVAL) -> Dict:
+        """
+        Wait for a job to finish and return its assessment
+        Raises KeyError for unknown jobs, RuntimeError if the job failed and
+        TimeoutError if it is still pending after `timeout` seconds
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT status, result, error FROM jobs WHERE id = ?", (job_id,)
+                ).fetchone()
+            if row is None:
+                raise KeyError(f"Unknown job: {job_id}")
+            if row["status"] == DONE:
+                return json.loads(row["result"])
+            if row["status"] == FAILED:
+                raise RuntimeError(row["error"] or "Assessment failed")
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError(f"Job {job_id} still {row['status']} after {timeout}s")
+            time.sleep(poll_interval)
+
+    def claim(self, worker_id: str) -> Optional[Tuple[str, str]]:
+        """
+        Atomically take the oldest runnable job for a worker
+        Returns (job_id, image_path) or None when the queue is empty
+        """
+        now = time.time()
+        with self._connect() as conn:
+            # IMMEDIATE takes the write lock up front so two workers can't claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Jobs whose worker died out of retries are failed rather than retried forever
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, finished_at = ?"
+                    " WHERE status = ? AND lease_expires < ? AND attempts >= ?",
+                    (FAILED, "Worker lease expired too many times", now, RUNNING, now, Config.JOB_MAX_ATTEMPTS)
+                )
+
+                row = conn.execute(
+                    "SELECT id, image_path FROM jobs"
+                    " WHERE status = ? OR (status = ? AND lease_expires < ?)"
+                    " ORDER BY submitted_at LIMIT 1",
+                    (QUEUED, RUNNING, now)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, worker = ?, started_at = ?, lease_expires = ?,"
+                        " attempts = attempts + 1 WHERE id = ?",
+                        (RUNNING, worker_id, now, now + Config.JOB_LEASE_SECONDS, row["id"])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        return (row["id"], row["image_path"]) if row else None
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """
+        Extend the lease of a running job so it isn't handed to another worker
+        Returns False if the worker no longer holds the job
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND status = ? AND worker = ?",
+                (time.time() + Config.JOB_LEASE_SECONDS, job_id, RUNNING, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, worker_id: str, result: Dict) -> bool:
+        """
+        Store the assessment for a finished job
+        Returns False (and stores nothing) if the worker's lease expired and the
+        job was claimed by another worker
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, finished_at = ?, lease_expires = NULL"
+                " WHERE id = ? AND status = ? AND worker = ?",
+                (DONE, json.dumps(result, default=str), time.time(), job_id, RUNNING, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: str, worker_id: str, error: str) -> bool:
+        """Mark a job as failed; returns False if the worker no longer holds it"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ?, lease_expires = NULL"
+                " WHERE id = ? AND status = ? AND worker = ?",
+                (FAILED, error, time.time(), job_id, RUNNING, worker_id)
+            )
+        return cursor.rowcount == 1
+
+    def stats(self) -> Dict[str, int]:
+        """Number of jobs per status"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, Optional
+from config.config import Config
+
+
+class RateLimiter:
+    """
+    Token bucket plus concurrency cap for one external provider
+    Shared by every crew and thread in the process; sync callers use
+    `acquire()`, coroutines use `acquire_async()`
+    """
+
+    def __init__(self, name: str, rate: Optional[float] = None, burst: int = 1,
+                 max_concurrency: Optional[int] = None):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self.max_concurrency = max_concurrency
+        self._metrics = {
+            "acquired": 0,
+            "throttled": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0
+        }
+
+    @contextmanager
+    def acquire(self):
+        """Block until a call may be made, holding a concurrency slot until exit"""
+        start = time.perf_counter()
+        if self._slots is not None:
+            self._slots.acquire()
+        try:
+            delay = self._reserve()
+            if delay > 0:
+                time.sleep(delay)
+            self._record_wait(time.perf_counter() - start)
+            yield
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    @asynccontextmanager
+    async def acquire_async(self):
+        """Async variant of acquire; waits without blocking the event loop"""
+        start = time.perf_counter()
+        if self._slots is not None:
+            # The semaphore is shared with threads, so poll instead of blocking
+            backoff = 0.005
+            while not self._slots.acquire(blocking=False):
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 0.05)
+        try:
+            delay = self._reserve()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._record_wait(time.perf_counter() - start)
+            yield
+        finally:
+            if self._slots is not None:
+                self._slots.release()
+
+    def _reserve(self) -> float:
+        """Take a token and return how long to wait before using it"""
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Tokens go negative while calls are queued, which keeps them evenly spaced
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def _record_wait(self, wait_seconds: float):
+        with self._lock:
+            self._metrics["acquired"] += 1
+            if wait_seconds > 0.001:
+                self._metrics["throttled"] += 1
+            self._metrics["total_wait_seconds"] += wait_seconds
+            self._metrics["max_wait_seconds"] = max(self._metrics["max_wait_seconds"], wait_seconds)
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["rate"] = self.rate
+        metrics["max_concurrency"] = self.max_concurrency
+        acquired = metrics["acquired"]
+        metrics["avg_wait_seconds"] = metrics["total_wait_seconds"] / acquired if acquired else 0.0
+        return metrics
+
+
+_limiters: Dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(provider: str) -> RateLimiter:
+    """Return the process-wide limiter for a provider (see Config.PROVIDER_RATE_LIMITS)"""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        with _limiters_lock:
+            limiter = _limiters.get(provider)
+            if limiter is None:
+                limiter = RateLimiter(provider, **Config.PROVIDER_RATE_LIMITS.get(provider, {}))
+                _limiters[provider] = limiter
+    return limiter
+
+
+def get_rate_limit_metrics() -> Dict[str, Dict]:
+    """Wait-time metrics for every provider used so far"""
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.get_metrics() for limiter in limiters}
+
+
+def export_prometheus() -> str:
+    """Prometheus text for time spent waiting on provider limits"""
+    lines = [
+        "# HELP medical_assessment_ratelimit_wait_seconds_total Time spent waiting for provider rate limits",
+        "# TYPE medical_assessment_ratelimit_wait_seconds_total counter"
+    ]
+    metrics = get_rate_limit_metrics()
+    for provider, values in sorted(metrics.items()):
+        lines.append(
+            f'medical_assessment_ratelimit_wait_seconds_total{{provider="{provider}"}} '
+            f'{values["total_wait_seconds"]:.6f}'
+        )
+    lines.append("# HELP medical_assessment_ratelimit_throttled_total Calls delayed by provider rate limits")
+    lines.append("# TYPE medical_assessment_ratelimit_throttled_total counter")
+    for provider, values in sorted(metrics.items()):
+        lines.append(f'medical_assessment_ratelimit_throttled_total{{provider="{provider}"}} {values["throttled"]}')
+    return "\n".join(lines) + "\n"
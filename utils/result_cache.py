@@ -0,0 +1,152 @@
+import asyncio
+import copy
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+from PIL import Image
+from config.config import Config
+from utils.image_processor import ImageProcessor
+
+
+def image_content_hash(image_path: str, preview: Optional[Image.Image] = None) -> str:
+    """
+    Hash of the decoded pixels (not the file bytes) of the downscaled preview
+    Files that decode to the same pixels (re-saved PNGs, JPEGs with edited
+    metadata) map to the same key. Hashing the reduced decode keeps the key
+    off the critical path of cache misses; pass the request's `preview` to
+    share it with the pre-screen.
+    """
+    if preview is None:
+        preview = ImageProcessor.load_preview(image_path)
+    width, height = preview.info.get("original_size", preview.size)
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{width}x{height}".encode())
+    digest.update(preview.tobytes())
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    Bounded LRU/TTL cache of completed assessments
+    Identical requests arriving while one is running wait for that computation
+    instead of starting their own
+    """
+
+    def __init__(self, max_entries: int = Config.RESULT_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = Config.RESULT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Dict]]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0}
+
+    def get_or_compute(self, key: str, compute: Callable[[], Dict],
+                       store_if: Optional[Callable[[Dict], bool]] = None) -> Tuple[Dict, str]:
+        """
+        Return (result, source) where source is "hit", "coalesced" or "miss"
+        Exceptions are propagated to every waiter and never cached; results
+        rejected by `store_if` are handed to waiters but not stored
+        """
+        result, future, owner = self._claim(key)
+        if result is not None:
+            return result, "hit"
+        if not owner:
+            return copy.deepcopy(future.result()), "coalesced"
+
+        try:
+            result = compute()
+        except BaseException as e:
+            self._release(key, future, error=e)
+            raise
+
+        self._release(key, future, result=result, store=store_if is None or store_if(result))
+        return result, "miss"
+
+    async def get_or_compute_async(self, key: str, compute: Callable[[], Awaitable[Dict]],
+                                   store_if: Optional[Callable[[Dict], bool]] = None) -> Tuple[Dict, str]:
+        """Async variant of get_or_compute; waiters await without blocking the loop"""
+        result, future, owner = self._claim(key)
+        if result is not None:
+            return result, "hit"
+        if not owner:
+            return copy.deepcopy(await asyncio.wrap_future(future)), "coalesced"
+
+        try:
+            result = await compute()
+        except BaseException as e:
+            self._release(key, future, error=e)
+            raise
+
+        self._release(key, future, result=result, store=store_if is None or store_if(result))
+        return result, "miss"
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["inflight"] = len(self._inflight)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_rate"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _claim(self, key: str) -> Tuple[Optional[Dict], Optional[Future], bool]:
+        """Return a cached copy, or the in-flight future and whether we own it"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, result = entry
+                if time.monotonic() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(key)
+                    self._stats["hits"] += 1
+                    return copy.deepcopy(result), None, False
+                del self._entries[key]
+
+            future = self._inflight.get(key)
+            if future is not None:
+                self._stats["coalesced"] += 1
+                return None, future, False
+
+            future = Future()
+            self._inflight[key] = future
+            self._stats["misses"] += 1
+            return None, future, True
+
+    def _release(self, key: str, future: Future, result: Optional[Dict] = None,
+                 error: Optional[BaseException] = None, store: bool = True):
+        # Store a private copy so callers can't mutate the cached entry
+        stored = copy.deepcopy(result) if error is None else None
+        with self._lock:
+            self._inflight.pop(key, None)
+            if error is None and store:
+                self._entries[key] = (time.monotonic(), stored)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self._stats["evictions"] += 1
+
+        if error is None:
+            future.set_result(stored)
+        else:
+            future.set_exception(error)
+
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Return the process-wide result cache shared by all crews"""
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
@@ -1,16 +1,20 @@
+import asyncio
 import time
 import functools
-from typing import Callable, Any
+from typing import Callable, Any, Optional
 from config.config import Config
 
 def retry_with_exponential_backoff(
     max_retries: int = Config.MAX_RETRIES,
     base_delay: float = Config.RETRY_DELAY,
     max_delay: float = 60.0,
-    exponential_base: float = 2
+    exponential_base: float = 2,
+    time_left: Optional[Callable[[], float]] = None
 ) -> Callable:
     """
     Decorator for retrying functions with exponential backoff
+    `time_left()` returns the seconds until a deadline; no retry is made once
+    the backoff delay would use them up
     """
     def decorator(func: Callable) -> Callable:
         @functools.wraps(func)
@@ -30,6 +34,9 @@ def retry_with_exponential_backoff(
 
                     # Calculate delay with exponential backoff
                     delay = min(base_delay * (exponential_base ** (retries - 1)), max_delay)
+                    if time_left is not None and time_left() <= delay:
+                        print(f"❌ Not retrying {func.__name__}: the deadline is too close for a {delay:.1f}s backoff")
+                        raise
 
                     print(f"⚠️ Attempt {retries} failed: {str(e)}")
                     print(f"🔄 Retrying in {delay:.1f} seconds...")
@@ -42,6 +49,49 @@ def retry_with_exponential_backoff(
     return decorator
 
 
+def async_retry_with_exponential_backoff(
+    max_retries: int = Config.MAX_RETRIES,
+    base_delay: float = Config.RETRY_DELAY,
+    max_delay: float = 60.0,
+    exponential_base: float = 2,
+    time_left: Optional[Callable[[], float]] = None
+) -> Callable:
+    """
+    Decorator for retrying coroutines with exponential backoff
+    Sleeps with asyncio.sleep so other tasks keep running; `time_left` as above
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs) -> Any:
+            retries = 0
+
+            while retries < max_retries:
+                try:
+                    return await func(*args, **kwargs)
+
+                except Exception as e:
+                    retries += 1
+
+                    if retries >= max_retries:
+                        print(f"❌ Max retries ({max_retries}) reached for {func.__name__}")
+                        raise
+
+                    delay = min(base_delay * (exponential_base ** (retries - 1)), max_delay)
+                    if time_left is not None and time_left() <= delay:
+                        print(f"❌ Not retrying {func.__name__}: the deadline is too close for a {delay:.1f}s backoff")
+                        raise
+
+                    print(f"⚠️ Attempt {retries} failed: {str(e)}")
+                    print(f"🔄 Retrying in {delay:.1f} seconds...")
+
+                    await asyncio.sleep(delay)
+
+            return None
+
+        return wrapper
+    return decorator
+
+
 def timeout_handler(timeout_seconds: int):
     """
     Decorator to add timeout to functions (simplified version)
@@ -0,0 +1,258 @@
+import asyncio
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional
+from config.config import Config
+from utils.retry_handler import retry_with_exponential_backoff, async_retry_with_exponential_backoff
+from utils.tracing import span
+
+
+class HaltPipeline(Exception):
+    """Raised by a stage to finish the assessment early with `result`"""
+
+    def __init__(self, result: Dict):
+        super().__init__("Pipeline halted")
+        self.result = result
+
+
+class Stage:
+    """
+    One node of the assessment pipeline
+    `func(context, inputs)` receives the declared inputs by name and returns a
+    dict with every declared output. `group` selects the retry policy and
+    batch concurrency limit (vision / diagnostic / communication).
+    Async runs use `async_func` when given; stages without one run inline on
+    the event loop, so only cheap CPU-bound stages should omit it.
+    """
+
+    def __init__(self, name: str, func: Callable, inputs: Iterable[str] = (),
+                 outputs: Iterable[str] = (), group: Optional[str] = None,
+                 async_func: Optional[Callable] = None):
+        self.name = name
+        self.func = func
+        self.async_func = async_func
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.group = group
+
+    def __repr__(self):
+        return f"Stage({self.name}: {list(self.inputs)} -> {list(self.outputs)})"
+
+
+_stage_executor = None
+_stage_executor_lock = threading.Lock()
+
+
+def _get_stage_executor() -> ThreadPoolExecutor:
+    """Threads shared by every sync pipeline run in the process"""
+    global _stage_executor
+    if _stage_executor is None:
+        with _stage_executor_lock:
+            if _stage_executor is None:
+                _stage_executor = ThreadPoolExecutor(
+                    max_workers=Config.STAGE_GRAPH_WORKERS,
+                    thread_name_prefix="stage"
+                )
+    return _stage_executor
+
+
+class StageGraph:
+    """
+    Declarative DAG of pipeline stages
+    Stage outputs are stored in `context.memory`, so a stage whose outputs are
+    already present is skipped (checkpoint resume). Stages whose inputs are
+    ready run concurrently; per-request timings give the critical path.
+    """
+
+    def __init__(self, stages: Iterable[Stage]):
+        self.stages: Dict[str, Stage] = {}
+        producers: Dict[str, str] = {}
+        for stage in stages:
+            if stage.name in self.stages:
+                raise ValueError(f"Duplicate stage: {stage.name}")
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"Output '{output}' produced by both {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+            self.stages[stage.name] = stage
+
+        self.dependencies: Dict[str, set] = {}
+        for stage in self.stages.values():
+            missing = [i for i in stage.inputs if i not in producers]
+            if missing:
+                raise ValueError(f"Stage {stage.name} needs inputs nobody produces: {missing}")
+            self.dependencies[stage.name] = {producers[i] for i in stage.inputs}
+
+        self.order = self._topological_order()
+
+    def _topological_order(self) -> List[str]:
+        order = []
+        done = set()
+        remaining = list(self.stages)
+        while remaining:
+            ready = [name for name in remaining if self.dependencies[name] <= done]
+            if not ready:
+                raise ValueError(f"Stage graph has a cycle among: {remaining}")
+            for name in ready:
+                order.append(name)
+                done.add(name)
+                remaining.remove(name)
+        return order
+
+    def run(self, context) -> Optional[Dict]:
+        """
+        Execute the graph for one request using the shared stage threads
+        Returns None on completion, or the result of a stage that halted the pipeline
+        """
+        executor = _get_stage_executor()
+        origin = time.perf_counter()
+        done = set()
+        remaining = list(self.order)
+        running = {}
+
+        try:
+            while remaining or running:
+                ready = [name for name in remaining if self.dependencies[name] <= done]
+                for name in ready:
+                    remaining.remove(name)
+
+                # A lone ready stage runs inline - no thread hop on linear stretches
+                if len(ready) == 1 and not running:
+                    self._execute(self.stages[ready[0]], context, origin)
+                    done.add(ready[0])
+                    continue
+
+                for name in ready:
+                    # Copy the context so tracing spans land on this request's trace
+                    task_context = contextvars.copy_context()
+                    future = executor.submit(task_context.run, self._execute, self.stages[name], context, origin)
+                    running[future] = name
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    future.result()
+                    done.add(name)
+        except HaltPipeline as halt:
+            return halt.result
+        finally:
+            for future in running:
+                future.cancel()
+
+        return None
+
+    async def run_async(self, context) -> Optional[Dict]:
+        """Async variant of run; independent stages run as concurrent tasks"""
+        origin = time.perf_counter()
+        done = set()
+        remaining = list(self.order)
+        running = {}
+
+        try:
+            while remaining or running:
+                ready = [name for name in remaining if self.dependencies[name] <= done]
+                for name in ready:
+                    remaining.remove(name)
+                    task = asyncio.ensure_future(self._execute_async(self.stages[name], context, origin))
+                    running[task] = name
+
+                finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    name = running.pop(task)
+                    task.result()
+                    done.add(name)
+        except HaltPipeline as halt:
+            return halt.result
+        finally:
+            for task in running:
+                task.cancel()
+
+        return None
+
+    def _execute(self, stage: Stage, context, origin: float):
+        if self._restore(stage, context, origin):
+            return
+
+        def attempt():
+            context.record_attempt(stage.name)
+            with context.stage_slot(stage.group):
+                try:
+                    return stage.func(context, inputs)
+                except HaltPipeline as halt:
+                    return halt  # A decision, not a failure: passed through the retry policy untouched
+
+        attempt.__name__ = stage.func.__name__
+        inputs = {name: context.memory[name] for name in stage.inputs}
+        start = time.perf_counter()
+        try:
+            with span(f"stage.{stage.name}"):
+                policy = Config.STAGE_RETRY_POLICIES.get(stage.group)
+                outputs = retry_with_exponential_backoff(**policy, time_left=context.remaining)(attempt)() if policy else attempt()
+        finally:
+            context.stage_timings[stage.name] = (start - origin, time.perf_counter() - origin)
+        if isinstance(outputs, HaltPipeline):
+            raise outputs
+        context.memory.update(outputs)
+
+    async def _execute_async(self, stage: Stage, context, origin: float):
+        if self._restore(stage, context, origin):
+            return
+
+        async def attempt():
+            context.record_attempt(stage.name)
+            async with context.stage_slot(stage.group):
+                try:
+                    if stage.async_func is not None:
+                        return await stage.async_func(context, inputs)
+                    return stage.func(context, inputs)
+                except HaltPipeline as halt:
+                    return halt
+
+        attempt.__name__ = stage.func.__name__
+        inputs = {name: context.memory[name] for name in stage.inputs}
+        start = time.perf_counter()
+        try:
+            with span(f"stage.{stage.name}"):
+                policy = Config.STAGE_RETRY_POLICIES.get(stage.group)
+                outputs = await (async_retry_with_exponential_backoff(**policy, time_left=context.remaining)(attempt)() if policy else attempt())
+        finally:
+            context.stage_timings[stage.name] = (start - origin, time.perf_counter() - origin)
+        if isinstance(outputs, HaltPipeline):
+            raise outputs
+        context.memory.update(outputs)
+
+    def _restore(self, stage: Stage, context, origin: float) -> bool:
+        """Skip a stage whose outputs were checkpointed by an earlier attempt"""
+        if not stage.outputs or not all(output in context.memory for output in stage.outputs):
+            return False
+        print(f"↩️ Resuming after {stage.name} stage (checkpoint found)")
+        now = time.perf_counter() - origin
+        context.stage_timings[stage.name] = (now, now)
+        return True
+
+    def critical_path(self, timings: Dict[str, tuple]) -> Dict:
+        """
+        Longest chain of dependent stages for one request
+        Walks back from the last stage to finish through whichever dependency
+        finished last, i.e. the one that actually held it up
+        """
+        if not timings:
+            return {"stages": [], "duration_ms": 0.0}
+
+        path = []
+        current = max(timings, key=lambda name: timings[name][1])
+        while current is not None:
+            path.append(current)
+            blockers = [d for d in self.dependencies.get(current, ()) if d in timings]
+            current = max(blockers, key=lambda name: timings[name][1]) if blockers else None
+        path.reverse()
+
+        return {
+            "stages": path,
+            "duration_ms": round((timings[path[-1]][1] - timings[path[0]][0]) * 1000, 3),
+            "stage_ms": {
+                name: round((end - start) * 1000, 3) for name, (start, end) in timings.items()
+            }
+        }
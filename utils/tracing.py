@@ -0,0 +1,128 @@
+import contextvars
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+# Trace of the assessment running in the current thread / asyncio task
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+
+# Histogram buckets (seconds) for the Prometheus export
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Trace:
+    """Timing spans collected for one assessment"""
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.spans: List[Dict] = []
+        # Spans may arrive from several tasks/threads of the same request
+        self._lock = threading.Lock()
+
+    def add(self, record: Dict):
+        with self._lock:
+            self.spans.append(record)
+
+    def to_list(self) -> List[Dict]:
+        with self._lock:
+            return sorted(self.spans, key=lambda r: r["start"])
+
+
+class SpanMetrics:
+    """Process-wide latency histogram per span name"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series: Dict[tuple, Dict] = {}
+
+    def observe(self, name: str, duration: float, status: str):
+        key = (name, status)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"count": 0, "sum": 0.0, "buckets": [0] * len(LATENCY_BUCKETS)}
+                self._series[key] = series
+            series["count"] += 1
+            series["sum"] += duration
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    series["buckets"][i] += 1
+
+    def to_prometheus(self) -> str:
+        """Render all series in the Prometheus text exposition format"""
+        metric = "medical_assessment_span_seconds"
+        lines = [
+            f"# HELP {metric} Duration of assessment pipeline spans",
+            f"# TYPE {metric} histogram"
+        ]
+        with self._lock:
+            for (name, status), series in sorted(self._series.items()):
+                labels = f'span="{name}",status="{status}"'
+                for bound, count in zip(LATENCY_BUCKETS, series["buckets"]):
+                    lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {series["count"]}')
+                lines.append(f"{metric}_sum{{{labels}}} {series['sum']:.6f}")
+                lines.append(f"{metric}_count{{{labels}}} {series['count']}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+
+span_metrics = SpanMetrics()
+
+
+@contextmanager
+def use_trace(trace: Trace):
+    """Make `trace` the destination for spans opened in this thread/task"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a block of work and record it on the current trace
+    Yields the attribute dict so callers can add details discovered inside the block
+    """
+    trace = _current_trace.get()
+    start_ts = time.time()
+    start = time.perf_counter()
+    status = "ok"
+    try:
+        yield attributes
+    except BaseException:
+        status = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        span_metrics.observe(name, duration, status)
+        if trace is not None:
+            trace.add({
+                "request_id": trace.request_id,
+                "name": name,
+                "start": start_ts,
+                "duration_ms": round(duration * 1000, 3),
+                "status": status,
+                "attributes": attributes
+            })
+
+
+def to_json_lines(spans: Iterable[Dict]) -> str:
+    """Serialize spans as JSON lines (one span per line)"""
+    return "".join(json.dumps(record, default=str) + "\n" for record in spans)
+
+
+def export_prometheus() -> str:
+    """Prometheus text for every span recorded in this process"""
+    return span_metrics.to_prometheus()
@@ -1,30 +1,96 @@
+import asyncio
 import os
 import time
+from typing import Optional
 from config.config import Config
+from utils.cassette import get_cassette
+from utils.rate_limiter import get_rate_limiter
+
+# Backends are detected on first use so importing this module stays cheap
+ELEVENLABS_AVAILABLE = False
+ELEVENLABS_V2 = False
+ELEVENLABS_ASYNC = False
+GTTS_AVAILABLE = False
+gTTS = None
+_backends_loaded = False
+
+
+def _load_backends():
+    """Try to import ElevenLabs, fallback to gTTS (runs once)"""
+    global ELEVENLABS_AVAILABLE, ELEVENLABS_V2, ELEVENLABS_ASYNC, GTTS_AVAILABLE, _backends_loaded
+    global ElevenLabs, AsyncElevenLabs, VoiceSettings, gTTS
+
+    if _backends_loaded:
+        return
 
-# Try to import ElevenLabs, fallback to gTTS
-try:
-    from elevenlabs.client import ElevenLabs
-    from elevenlabs import VoiceSettings
-    ELEVENLABS_AVAILABLE = True
-    ELEVENLABS_V2 = True
-except ImportError:
     try:
-        # Try older API format (v1.x)
-        from elevenlabs import generate, set_api_key, VoiceSettings, save
+        from elevenlabs.client import ElevenLabs
+        from elevenlabs import VoiceSettings
         ELEVENLABS_AVAILABLE = True
-        ELEVENLABS_V2 = False
+        ELEVENLABS_V2 = True
+        try:
+            from elevenlabs.client import AsyncElevenLabs
+            ELEVENLABS_ASYNC = True
+        except ImportError:
+            ELEVENLABS_ASYNC = False
     except ImportError:
-        ELEVENLABS_AVAILABLE = False
-        ELEVENLABS_V2 = False
+        try:
+            # Try older API format (v1.x)
+            from elevenlabs import VoiceSettings
+            ELEVENLABS_AVAILABLE = True
+            ELEVENLABS_V2 = False
+        except ImportError:
+            ELEVENLABS_AVAILABLE = False
+            ELEVENLABS_V2 = False
+
+    # Always import gTTS as fallback
+    try:
+        from gtts import gTTS
+        GTTS_AVAILABLE = True
+    except ImportError:
+        GTTS_AVAILABLE = False
+        gTTS = None
+
+    _backends_loaded = True
+
+# Map severity to voice and settings
+VOICE_SETTINGS = {
+    "serious": {
+        "voice": "Adam",  # More serious, authoritative
+        "stability": 0.5,
+        "similarity_boost": 0.75,
+        "style": 0.3,
+        "use_speaker_boost": True
+    },
+    "moderate": {
+        "voice": "Rachel",  # Professional, clear
+        "stability": 0.6,
+        "similarity_boost": 0.7,
+        "style": 0.4,
+        "use_speaker_boost": True
+    },
+    "minor": {
+        "voice": "Bella",  # Calm, reassuring
+        "stability": 0.7,
+        "similarity_boost": 0.65,
+        "style": 0.2,
+        "use_speaker_boost": True
+    },
+    "uncertain": {
+        "voice": "Rachel",  # Professional, neutral
+        "stability": 0.6,
+        "similarity_boost": 0.7,
+        "style": 0.3,
+        "use_speaker_boost": True
+    }
+}
 
-# Always import gTTS as fallback
-try:
-    from gtts import gTTS
-    GTTS_AVAILABLE = True
-except ImportError:
-    GTTS_AVAILABLE = False
-    gTTS = None
+# Voice IDs for common voices
+VOICE_IDS = {
+    "Adam": "pNInz6obpgDQGcFmaJgB",  # Adam
+    "Rachel": "21m00Tcm4TlvDq8ikWAM",  # Rachel
+    "Bella": "EXAVITQu4vr4xnSDxMaL"  # Bella
+}
 
 class TTSHandler:
     """Handle text-to-speech generation using ElevenLabs (with gTTS fallback)"""
@@ -48,6 +114,8 @@ class TTSHandler:
         Generate audio file from text using ElevenLabs (or gTTS fallback)
         Returns: path to audio file
         """
+        _load_backends()
+
         # Ensure output directory exists
         os.makedirs(Config.AUDIO_DIR, exist_ok=True)
 
@@ -62,29 +130,30 @@ class TTSHandler:
             try:
                 print("🎙️ Using ElevenLabs for TTS generation...")
                 
-                if ELEVENLABS_V2:
-                    # New API (v2.x) - use text_to_speech.convert
-                    client = ElevenLabs(api_key=Config.ELEVENLABS_API_KEY)
-                    audio_generator = client.text_to_speech.convert(
-                        voice_id="21m00Tcm4TlvDq8ikWAM",  # Rachel voice ID
-                        text=clean_text,
-                        model_id="eleven_multilingual_v2"
-                    )
-                    # Save audio stream
-                    with open(output_path, "wb") as f:
-                        for chunk in audio_generator:
-                            if chunk:
-                                f.write(chunk)
-                else:
-                    # Old API (v1.x)
-                    from elevenlabs import set_api_key, generate, save
-                    set_api_key(Config.ELEVENLABS_API_KEY)
-                    audio = generate(
-                        text=clean_text,
-                        voice="Rachel",
-                        model="eleven_multilingual_v2"
-                    )
-                    save(audio, output_path)
+                with get_rate_limiter("elevenlabs").acquire():
+                    if ELEVENLABS_V2:
+                        # New API (v2.x) - use text_to_speech.convert
+                        client = ElevenLabs(**TTSHandler._client_options())
+                        audio_generator = client.text_to_speech.convert(
+                            voice_id="21m00Tcm4TlvDq8ikWAM",  # Rachel voice ID
+                            text=clean_text,
+                            model_id="eleven_multilingual_v2"
+                        )
+                        # Save audio stream
+                        with open(output_path, "wb") as f:
+                            for chunk in audio_generator:
+                                if chunk:
+                                    f.write(chunk)
+                    else:
+                        # Old API (v1.x)
+                        from elevenlabs import set_api_key, generate, save
+                        set_api_key(Config.ELEVENLABS_API_KEY)
+                        audio = generate(
+                            text=clean_text,
+                            voice="Rachel",
+                            model="eleven_multilingual_v2"
+                        )
+                        save(audio, output_path)
                 
                 print(f"✅ ElevenLabs audio generated: {output_path}")
                 return output_path
@@ -100,108 +169,108 @@ class TTSHandler:
                 print("ℹ️ ElevenLabs API key not found, using gTTS")
         
         # Fallback to gTTS
+        return TTSHandler._gtts_audio(text, output_filename, language, slow)
+
+    @staticmethod
+    def _gtts_audio(
+        text: str,
+        output_filename: str,
+        language: str = 'en',
+        slow: bool = False
+    ) -> str:
+        """
+        gTTS-only synthesis, used wherever ElevenLabs must not be (re)tried
+        Returns: path to audio file
+        """
+        _load_backends()
         if not GTTS_AVAILABLE or gTTS is None:
             raise ValueError("Neither ElevenLabs nor gTTS is available for TTS generation")
-        
-        tts = gTTS(text=clean_text, lang=language, slow=slow)
+
+        os.makedirs(Config.AUDIO_DIR, exist_ok=True)
+        output_path = os.path.join(Config.AUDIO_DIR, output_filename)
+        tts = gTTS(text=TTSHandler._clean_text(text), lang=language, slow=slow)
         tts.save(output_path)
         return output_path
 
     @staticmethod
-    def generate_with_emotion(text: str, severity: str) -> str:
+    def generate_with_emotion(text: str, severity: str, request_id: Optional[str] = None,
+                              fast: bool = False) -> str:
         """
         Generate audio with emotional tone based on severity using ElevenLabs
         Falls back to gTTS if ElevenLabs is not available
+        `fast` goes straight to gTTS (used when the request is short on time)
         """
-        import time
-        timestamp = int(time.time())
-        filename = f"diagnosis_{severity}_{timestamp}.mp3"
-        
+        cassette = get_cassette()
+        if not cassette.enabled:
+            return TTSHandler._synthesize_with_emotion(text, severity, request_id, fast)
+
+        # Record/replay the audio bytes, keyed by what was spoken and how
+        live_paths = []
+
+        def synthesize():
+            live_paths.append(TTSHandler._synthesize_with_emotion(text, severity, request_id, fast))
+            return TTSHandler._read_audio(live_paths[0])
+
+        audio = cassette.call("tts", {"text": text, "severity": severity, "fast": fast}, synthesize, binary=True)
+        return live_paths[0] if live_paths else TTSHandler._write_audio(severity, request_id, audio)
+
+    @staticmethod
+    def _synthesize_with_emotion(text: str, severity: str, request_id: Optional[str] = None,
+                                 fast: bool = False) -> str:
+        """Live synthesis behind generate_with_emotion"""
+        _load_backends()
+        filename = TTSHandler._audio_filename(severity, request_id)
+
         # Use ElevenLabs if available
-        if ELEVENLABS_AVAILABLE and Config.ELEVENLABS_API_KEY:
+        if fast:
+            print("ℹ️ Short on time, skipping ElevenLabs")
+        elif ELEVENLABS_AVAILABLE and Config.ELEVENLABS_API_KEY:
             try:
                 print(f"🎙️ Using ElevenLabs for TTS (severity: {severity})...")
                 os.makedirs(Config.AUDIO_DIR, exist_ok=True)
                 clean_text = TTSHandler._clean_text(text)
                 output_path = os.path.join(Config.AUDIO_DIR, filename)
                 
-                # Map severity to voice and settings
-                voice_settings = {
-                    "serious": {
-                        "voice": "Adam",  # More serious, authoritative
-                        "stability": 0.5,
-                        "similarity_boost": 0.75,
-                        "style": 0.3,
-                        "use_speaker_boost": True
-                    },
-                    "moderate": {
-                        "voice": "Rachel",  # Professional, clear
-                        "stability": 0.6,
-                        "similarity_boost": 0.7,
-                        "style": 0.4,
-                        "use_speaker_boost": True
-                    },
-                    "minor": {
-                        "voice": "Bella",  # Calm, reassuring
-                        "stability": 0.7,
-                        "similarity_boost": 0.65,
-                        "style": 0.2,
-                        "use_speaker_boost": True
-                    },
-                    "uncertain": {
-                        "voice": "Rachel",  # Professional, neutral
-                        "stability": 0.6,
-                        "similarity_boost": 0.7,
-                        "style": 0.3,
-                        "use_speaker_boost": True
-                    }
-                }
+                settings = VOICE_SETTINGS.get(severity, VOICE_SETTINGS["moderate"])
                 
-                settings = voice_settings.get(severity, voice_settings["moderate"])
-                
-                if ELEVENLABS_V2:
-                    # New API (v2.x) - use text_to_speech.convert
-                    # Voice IDs for common voices
-                    voice_ids = {
-                        "Adam": "pNInz6obpgDQGcFmaJgB",  # Adam
-                        "Rachel": "21m00Tcm4TlvDq8ikWAM",  # Rachel
-                        "Bella": "EXAVITQu4vr4xnSDxMaL"  # Bella
-                    }
-                    voice_id = voice_ids.get(settings["voice"], voice_ids["Rachel"])
+                with get_rate_limiter("elevenlabs").acquire():
+                    if ELEVENLABS_V2:
+                        # New API (v2.x) - use text_to_speech.convert
+                        voice_id = VOICE_IDS.get(settings["voice"], VOICE_IDS["Rachel"])
                     
-                    client = ElevenLabs(api_key=Config.ELEVENLABS_API_KEY)
-                    audio_generator = client.text_to_speech.convert(
-                        voice_id=voice_id,
-                        text=clean_text,
-                        model_id="eleven_multilingual_v2",
-                        voice_settings=VoiceSettings(
-                            stability=settings["stability"],
-                            similarity_boost=settings["similarity_boost"],
-                            style=settings["style"],
-                            use_speaker_boost=settings["use_speaker_boost"]
+                        client = ElevenLabs(**TTSHandler._client_options())
+                        audio_generator = client.text_to_speech.convert(
+                            voice_id=voice_id,
+                            text=clean_text,
+                            model_id="eleven_multilingual_v2",
+                            voice_settings=VoiceSettings(
+                                stability=settings["stability"],
+                                similarity_boost=settings["similarity_boost"],
+                                style=settings["style"],
+                                use_speaker_boost=settings["use_speaker_boost"]
+                            )
                         )
-                    )
-                    # Save audio stream
-                    with open(output_path, "wb") as f:
-                        for chunk in audio_generator:
-                            if chunk:
-                                f.write(chunk)
-                else:
-                    # Old API (v1.x)
-                    from elevenlabs import set_api_key, generate, save
-                    set_api_key(Config.ELEVENLABS_API_KEY)
-                    audio = generate(
-                        text=clean_text,
-                        voice=settings["voice"],
-                        model="eleven_multilingual_v2",
-                        voice_settings=VoiceSettings(
-                            stability=settings["stability"],
-                            similarity_boost=settings["similarity_boost"],
-                            style=settings["style"],
-                            use_speaker_boost=settings["use_speaker_boost"]
+                        # Save audio stream
+                        with open(output_path, "wb") as f:
+                            for chunk in audio_generator:
+                                if chunk:
+                                    f.write(chunk)
+                    else:
+                        # Old API (v1.x)
+                        from elevenlabs import set_api_key, generate, save
+                        set_api_key(Config.ELEVENLABS_API_KEY)
+                        audio = generate(
+                            text=clean_text,
+                            voice=settings["voice"],
+                            model="eleven_multilingual_v2",
+                            voice_settings=VoiceSettings(
+                                stability=settings["stability"],
+                                similarity_boost=settings["similarity_boost"],
+                                style=settings["style"],
+                                use_speaker_boost=settings["use_speaker_boost"]
+                            )
                         )
-                    )
-                    save(audio, output_path)
+                        save(audio, output_path)
                 
                 print(f"✅ ElevenLabs audio generated with {settings['voice']} voice: {output_path}")
                 return output_path
@@ -219,7 +288,101 @@ class TTSHandler:
         # Fallback to gTTS
         print("🎙️ Using gTTS for TTS generation...")
         slow = (severity in ["serious", "uncertain"])
-        result = TTSHandler.generate_audio(text, filename, slow=slow)
+        result = TTSHandler._gtts_audio(text, filename, slow=slow)
+        print(f"✅ gTTS audio generated: {result}")
+        return result
+
+    @staticmethod
+    async def generate_with_emotion_async(text: str, severity: str, request_id: Optional[str] = None,
+                                          fast: bool = False) -> str:
+        """
+        Async variant of generate_with_emotion
+        Streams from the async ElevenLabs client; gTTS and the v1 API run in a thread
+        """
+        cassette = get_cassette()
+        if not cassette.enabled:
+            return await TTSHandler._synthesize_with_emotion_async(text, severity, request_id, fast)
+
+        live_paths = []
+
+        async def synthesize():
+            live_paths.append(await TTSHandler._synthesize_with_emotion_async(text, severity, request_id, fast))
+            return TTSHandler._read_audio(live_paths[0])
+
+        audio = await cassette.call_async("tts", {"text": text, "severity": severity, "fast": fast},
+                                          synthesize, binary=True)
+        return live_paths[0] if live_paths else TTSHandler._write_audio(severity, request_id, audio)
+
+    @staticmethod
+    async def _synthesize_with_emotion_async(text: str, severity: str, request_id: Optional[str] = None,
+                                             fast: bool = False) -> str:
+        """Live synthesis behind generate_with_emotion_async"""
+        _load_backends()
+        if fast or not (ELEVENLABS_ASYNC and Config.ELEVENLABS_API_KEY):
+            return await asyncio.to_thread(TTSHandler._synthesize_with_emotion, text, severity, request_id, fast)
+
+        filename = TTSHandler._audio_filename(severity, request_id)
+        try:
+            print(f"🎙️ Using ElevenLabs for TTS (severity: {severity})...")
+            os.makedirs(Config.AUDIO_DIR, exist_ok=True)
+            output_path = os.path.join(Config.AUDIO_DIR, filename)
+            settings = VOICE_SETTINGS.get(severity, VOICE_SETTINGS["moderate"])
+
+            async with get_rate_limiter("elevenlabs").acquire_async():
+                client = AsyncElevenLabs(**TTSHandler._client_options())
+                audio_stream = client.text_to_speech.convert(
+                    voice_id=VOICE_IDS.get(settings["voice"], VOICE_IDS["Rachel"]),
+                    text=TTSHandler._clean_text(text),
+                    model_id="eleven_multilingual_v2",
+                    voice_settings=VoiceSettings(
+                        stability=settings["stability"],
+                        similarity_boost=settings["similarity_boost"],
+                        style=settings["style"],
+                        use_speaker_boost=settings["use_speaker_boost"]
+                    )
+                )
+                chunks = [chunk async for chunk in audio_stream if chunk]
+                with open(output_path, "wb") as f:
+                    f.write(b"".join(chunks))
+
+            print(f"✅ ElevenLabs audio generated with {settings['voice']} voice: {output_path}")
+            return output_path
+        except Exception as e:
+            print(f"⚠️ ElevenLabs error: {e}, falling back to gTTS")
+
+        print("🎙️ Using gTTS for TTS generation...")
+        slow = (severity in ["serious", "uncertain"])
+        result = await asyncio.to_thread(TTSHandler._gtts_audio, text, filename, slow=slow)
         print(f"✅ gTTS audio generated: {result}")
         return result
 
+    @staticmethod
+    def _client_options() -> dict:
+        """ElevenLabs client arguments (base_url only when overridden)"""
+        options = {"api_key": Config.ELEVENLABS_API_KEY}
+        if Config.ELEVENLABS_BASE_URL:
+            options["base_url"] = Config.ELEVENLABS_BASE_URL
+        return options
+
+    @staticmethod
+    def _read_audio(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
+
+    @staticmethod
+    def _write_audio(severity: str, request_id: Optional[str], audio: bytes) -> str:
+        """Save replayed audio under a fresh filename"""
+        os.makedirs(Config.AUDIO_DIR, exist_ok=True)
+        output_path = os.path.join(Config.AUDIO_DIR, TTSHandler._audio_filename(severity, request_id))
+        with open(output_path, "wb") as f:
+            f.write(audio)
+        return output_path
+
+    @staticmethod
+    def _audio_filename(severity: str, request_id: Optional[str] = None) -> str:
+        """Build the output filename for a diagnosis audio clip"""
+        timestamp = int(time.time())
+        if request_id:
+            # Concurrent requests can finish within the same second
+            return f"diagnosis_{severity}_{timestamp}_{request_id}.mp3"
+        return f"diagnosis_{severity}_{timestamp}.mp3"
@@ -0,0 +1,182 @@
+import atexit
+import copy
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+import numpy as np
+from PIL import Image
+from config.config import Config
+
+
+def dhash(img: Image.Image, hash_size: int = 8) -> int:
+    """
+    Difference hash of an image: one bit per horizontal brightness gradient
+    Survives re-compression, small crops and resizes; returns a hash_size**2-bit int
+    """
+    gray = img.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BILINEAR)
+    pixels = np.asarray(gray, dtype=np.int16)
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+class VisionIndex:
+    """
+    Persistent index of recent vision analyses keyed by perceptual hash
+    An image within `max_distance` bits of an indexed one (same model) reuses its
+    analysis instead of calling Gemini again. Inserts are saved as JSON at most once
+    per `save_interval` seconds (call flush() to write pending ones now).
+    """
+
+    def __init__(self, path: Optional[str] = Config.VISION_INDEX_PATH,
+                 max_distance: int = Config.VISION_INDEX_MAX_DISTANCE,
+                 max_entries: int = Config.VISION_INDEX_MAX_ENTRIES,
+                 ttl_seconds: float = Config.VISION_INDEX_TTL,
+                 save_interval: float = Config.VISION_INDEX_SAVE_INTERVAL):
+        self.path = path
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.save_interval = save_interval
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # Keeps snapshots reaching disk in order
+        self._dirty = False
+        self._last_saved = -math.inf
+        self._save_timer: Optional[threading.Timer] = None
+        self._stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._load()
+
+    def lookup(self, phash: int, model: str) -> Optional[Tuple[Dict, int]]:
+        """Return (analysis, distance) of the nearest fresh match, or None"""
+        now = time.time()
+        best_key, best_distance = None, self.max_distance + 1
+        # A linear scan on purpose: at most max_entries XORs, microseconds next to a Gemini call
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if now - entry["stored_at"] > self.ttl_seconds:
+                    del self._entries[key]
+                    continue
+                if entry["model"] != model:
+                    continue
+                distance = hamming_distance(phash, entry["hash"])
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+
+            if best_key is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._stats["hits"] += 1
+            return copy.deepcopy(self._entries[best_key]["analysis"]), best_distance
+
+    def add(self, phash: int, model: str, analysis: Dict):
+        key = f"{model}:{phash:016x}"
+        with self._lock:
+            self._entries[key] = {
+                "hash": phash,
+                "model": model,
+                "stored_at": time.time(),
+                "analysis": copy.deepcopy(analysis)
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+            self._dirty = True
+            wait = self._last_saved + self.save_interval - time.monotonic()
+            if wait > 0:
+                # Saved recently: write this insert with any others arriving before the timer
+                if self._save_timer is None:
+                    self._save_timer = threading.Timer(wait, self.flush)
+                    self._save_timer.daemon = True
+                    self._save_timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """Write pending inserts to disk"""
+        with self._save_lock:
+            with self._lock:
+                if self._save_timer is not None:
+                    self._save_timer.cancel()
+                    self._save_timer = None
+                if not self._dirty:
+                    return
+                self._dirty = False
+                self._last_saved = time.monotonic()
+                snapshot = list(self._entries.values())
+            self._save(snapshot)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["max_distance"] = self.max_distance
+        return stats
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+        self.flush()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)["entries"]
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️ Ignoring unreadable vision index {self.path}: {e}")
+            return
+        for entry in entries[-self.max_entries:]:
+            self._entries[f"{entry['model']}:{entry['hash']:016x}"] = entry
+
+    def _save(self, entries):
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Write then rename so a crash never leaves a truncated index
+            tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"entries": entries}, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"⚠️ Could not save vision index: {e}")
+
+
+_vision_index = None
+_vision_index_lock = threading.Lock()
+
+
+def get_vision_index() -> VisionIndex:
+    """Return the process-wide vision index"""
+    global _vision_index
+    if _vision_index is None:
+        with _vision_index_lock:
+            if _vision_index is None:
+                _vision_index = VisionIndex()
+                atexit.register(_vision_index.flush)
+    return _vision_index
+
+
+def export_prometheus() -> str:
+    """Prometheus text for near-duplicate reuse"""
+    stats = get_vision_index().get_stats()
+    return "\n".join([
+        "# HELP medical_assessment_vision_index_lookups_total Near-duplicate lookups before calling Gemini",
+        "# TYPE medical_assessment_vision_index_lookups_total counter",
+        f'medical_assessment_vision_index_lookups_total{{result="hit"}} {stats["hits"]}',
+        f'medical_assessment_vision_index_lookups_total{{result="miss"}} {stats["misses"]}'
+    ]) + "\n"
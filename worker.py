@@ -0,0 +1,107 @@
+"""
+Assessment worker: runs MedicalAssessmentCrew against the SQLite job queue
+
+Usage:
+    python worker.py --processes 4
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+from config.config import Config
+from utils.job_queue import JobQueue
+
+
+def _keep_lease_alive(queue: JobQueue, job_id: str, worker_id: str, stop: threading.Event):
+    """Renew the job lease while the assessment runs"""
+    interval = max(Config.JOB_LEASE_SECONDS / 3, 1)
+    while not stop.wait(interval):
+        if not queue.heartbeat(job_id, worker_id):
+            print(f"⚠️ Job {job_id} was handed to another worker")
+            return
+
+
+def run_worker(worker_index: int, db_path: str, max_jobs: int = 0):
+    """Claim and process jobs until stopped (or until `max_jobs` are done)"""
+    # Imported in the child so each process builds its own SDK clients
+    from crew_orchestrator import MedicalAssessmentCrew
+
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{worker_index}"
+    queue = JobQueue(db_path)
+    crew = MedicalAssessmentCrew()
+    stopping = threading.Event()
+
+    def handle_stop(signum, frame):
+        print(f"🛑 Worker {worker_id} stopping after current job...")
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    print(f"👷 Worker {worker_id} ready")
+    processed = 0
+    while not stopping.is_set():
+        job = queue.claim(worker_id)
+        if job is None:
+            stopping.wait(Config.JOB_POLL_INTERVAL)
+            continue
+
+        job_id, image_path = job
+        print(f"📥 Worker {worker_id} processing job {job_id}")
+        lease_stop = threading.Event()
+        heartbeat = threading.Thread(target=_keep_lease_alive, args=(queue, job_id, worker_id, lease_stop), daemon=True)
+        heartbeat.start()
+        try:
+            result = crew.assess_injury(image_path)
+            if queue.complete(job_id, worker_id, result):
+                print(f"✅ Job {job_id} done")
+            else:
+                print(f"⚠️ Job {job_id} lease lost; result discarded")
+        except Exception as e:
+            if queue.fail(job_id, worker_id, f"{type(e).__name__}: {e}"):
+                print(f"❌ Job {job_id} failed: {e}")
+            else:
+                print(f"⚠️ Job {job_id} lease lost; error discarded: {e}")
+        finally:
+            lease_stop.set()
+
+        processed += 1
+        if max_jobs and processed >= max_jobs:
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run medical assessment workers")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="Worker processes to start")
+    parser.add_argument("--db", default=Config.JOB_QUEUE_DB, help="SQLite job queue path")
+    parser.add_argument("--max-jobs", type=int, default=0, help="Exit each worker after this many jobs (0 = run forever)")
+    args = parser.parse_args()
+
+    # Create the schema once before the workers race for it
+    JobQueue(args.db)
+
+    if args.processes == 1:
+        run_worker(0, args.db, args.max_jobs)
+        return
+
+    processes = [
+        multiprocessing.Process(target=run_worker, args=(i, args.db, args.max_jobs), name=f"assessment-worker-{i}")
+        for i in range(args.processes)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        # Children received SIGINT too and finish their current job
+        for process in processes:
+            process.join()
+
+
+if __name__ == "__main__":
+    main()